@@ -188,6 +188,9 @@ class MPIScheduler(scheduler.Scheduler):
 
     _exit_info = None
 
+    # ids of the jobs which status changed since the last poll_changes()
+    _changed = None
+
     _loop = None
 
     _interval = None
@@ -196,6 +199,8 @@ class MPIScheduler(scheduler.Scheduler):
 
     _failed_count = None
 
+    notifies_status_changes = True
+
     JOB_REQUEST = 11
     JOB_SENDING = 12
     EXIT_SIGNAL = 13
@@ -215,6 +220,7 @@ class MPIScheduler(scheduler.Scheduler):
         # self._processes = {}
         self._status = {}
         self._exit_info = {}
+        self._changed = set()
         self._lock = threading.RLock()
         self.stop_thread_loop = False
         self._interval = interval
@@ -248,6 +254,7 @@ class MPIScheduler(scheduler.Scheduler):
         self._communicator.Probe(source=MPI.ANY_SOURCE,
                                  tag=MPI.ANY_TAG,
                                  status=MPIStatus)
+        changed = False
         with self._lock:
             t = MPIStatus.Get_tag()
             if t == MPIScheduler.JOB_REQUEST:
@@ -269,7 +276,8 @@ class MPIScheduler(scheduler.Scheduler):
                     self._communicator.send(job_list, dest=s,
                                             tag=MPIScheduler.JOB_SENDING)
                     for j in job_list:
-                        self._status[j.job_id] = constants.RUNNING
+                        self._set_status(j.job_id, constants.RUNNING)
+                    changed = True
             elif t == MPIScheduler.JOB_RESULT:
                 # self._logger.debug("Master received the JOB_RESULT signal")
                 s = MPIStatus.Get_source()
@@ -292,7 +300,8 @@ class MPIScheduler(scheduler.Scheduler):
                             job_id) + " ret value = " + repr(ret_value))
                     else:
                         self._exit_info[job_id] = exit_info
-                        self._status[job_id] = job_status
+                        self._set_status(job_id, job_status)
+                        changed = True
             elif t == MPIScheduler.EXIT_SIGNAL:
                 # self._logger.debug("Master received the EXIT_SIGNAL")
                 self._stopped_slaves = self._stopped_slaves + 1
@@ -300,6 +309,8 @@ class MPIScheduler(scheduler.Scheduler):
                     self.stop_thread_loop = True
             else:
                 self._logger.critical("Master unknown tag")
+        if changed:
+            self._notify_status_changes()
 
     def sleep(self):
         self.is_sleeping = True
@@ -326,7 +337,7 @@ class MPIScheduler(scheduler.Scheduler):
             # self._logger.debug(">> job_submission wait lock END")
             self._queue.append(job.job_id)
             self._jobs[job.job_id] = job
-            self._status[job.job_id] = constants.QUEUED_ACTIVE
+            self._set_status(job.job_id, constants.QUEUED_ACTIVE)
             self._queue.sort(key=lambda job_id: self._jobs[job_id].priority,
                              reverse=True)
             self._logger.debug("A Job was submitted.")
@@ -344,6 +355,23 @@ class MPIScheduler(scheduler.Scheduler):
         status = self._status[scheduler_job_id]
         return status
 
+    def _set_status(self, job_id, status):
+        self._status[job_id] = status
+        self._changed.add(job_id)
+
+    def poll_changes(self, scheduler_job_ids):
+        '''
+        Only the jobs which status changed since the last call are
+        processed.
+        '''
+        with self._lock:
+            changed = self._changed
+            self._changed = set()
+            changes = dict((job_id, self._status[job_id])
+                           for job_id in changed
+                           if job_id in scheduler_job_ids)
+        return (changes, {})
+
     def get_job_exit_info(self, scheduler_job_id):
         '''
         * scheduler_job_id *string*
@@ -441,7 +469,8 @@ if __name__ == '__main__':
 
             database_server = WorkflowDatabaseServer(
                 config.get_database_file(),
-                config.get_transfered_file_dir())
+                config.get_transfered_file_dir(),
+                backend=config.get_database_backend())
 
             logger.info("workflow_file " + repr(options.workflow_file))
             logger.info("wf_id_to_restart " + repr(options.wf_id_to_restart))
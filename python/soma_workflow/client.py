@@ -323,11 +323,33 @@ class WorkflowController(object):
         '''
         return self._engine_proxy.workflow(workflow_id)
 
+    def archived_workflow(self, workflow_id):
+        '''
+        Rows of a workflow archived by the database server (see the
+        DATABASE_ARCHIVE_DELAY configuration item). The archived workflows
+        are listed by workflows(), and their status is returned by
+        workflow_status(), but they cannot be restarted.
+
+        * workflow_id *workflow identifier*
+
+        * returns: *dictionary*
+            the rows of the workflow and of its elements as dictionaries
+            column -> value: workflow (dictionary), jobs, transfers,
+            temporary_paths, ios and ios_tmp (sequences), and files, the
+            sequence of the files of the elements.
+
+        Raises *UnknownObjectError* if the workflow_id is not an archived
+        workflow
+        '''
+        return self._engine_proxy.archived_workflow(workflow_id)
+
     def workflows(self, workflow_ids=None):
         '''
         Lists the identifiers and general information about all the workflows
         submitted by the user, or about the workflows specified in the
-        *workflow_ids* argument.
+        *workflow_ids* argument. The workflows archived by the database
+        server (see the DATABASE_ARCHIVE_DELAY configuration item) are
+        listed too.
 
         * workflow_ids *sequence of workflow identifiers*
 
@@ -336,6 +358,31 @@ class WorkflowController(object):
         '''
         return self._engine_proxy.workflows(workflow_ids)
 
+    def workflows_summary(self, workflow_ids=None):
+        '''
+        Aggregated status of the user's workflows, or of the workflows
+        specified in the *workflow_ids* argument: jobs counts per status
+        and per queue, progression and timing information. It is much
+        cheaper than workflow_elements_status for monitoring many or large
+        workflows. The archived workflows are summarized too.
+
+        * workflow_ids *sequence of workflow identifiers*
+
+        * returns: *dictionary: workflow identifier -> dictionary*
+            with the items:
+              * name, status, queue: workflow name, status and queue
+              * job_count: number of jobs
+              * status_counts: job status -> number of jobs
+              * queue_counts: queue -> (job status -> number of jobs)
+              * progress: percentage of ended (done or failed) jobs
+              * first_submission_date, first_execution_date,
+                last_ending_date: *date or None*
+              * mean_duration: mean execution time of the ended jobs, in
+                seconds (or None)
+              * eta: *date or None* estimated end of the workflow
+        '''
+        return self._engine_proxy.workflows_summary(workflow_ids)
+
     def jobs(self, job_ids=None):
         '''
         Lists the identifiers and general information about all the jobs
@@ -404,6 +451,36 @@ class WorkflowController(object):
         Raises *UnknownObjectError* if the workflow_id is not valid
         '''
         wf_status = self._engine_proxy.workflow_elements_status(workflow_id)
+        return self._with_transfer_progression(wf_status)
+
+    def workflow_elements_status_changes(self, workflow_id,
+                                         since_revision=None):
+        '''
+        Incremental version of workflow_elements_status, for periodic
+        monitoring: only the elements which status changed since a former
+        call are returned.
+
+        * workflow_id *workflow identifier*
+
+        * since_revision *int or None*
+            Revision returned by the former call. If None, the status of
+            all the elements is returned.
+
+        * returns: tuple (revision, elements_status):
+            * revision: *int* to pass as since_revision to the next call
+            * elements_status: same as the workflow_elements_status result,
+              restricted to the jobs, transfers and temporary paths
+              modified since since_revision. The workflow status and queue
+              are always given.
+
+        Raises *UnknownObjectError* if the workflow_id is not valid
+        '''
+        revision, wf_status \
+            = self._engine_proxy.workflow_elements_status_changes(
+                workflow_id, since_revision)
+        return revision, self._with_transfer_progression(wf_status)
+
+    def _with_transfer_progression(self, wf_status):
         # special processing for transfer status:
         new_transfer_status = []
         for engine_path, client_path, client_paths, status, transfer_type \
@@ -1056,8 +1133,12 @@ def _embedded_engine_and_server(config, local_scheduler_config=None):
         logger.info("****************************************************")
 
     # database server
-    database_server = WorkflowDatabaseServer(config.get_database_file(),
-                                             config.get_transfered_file_dir())
+    database_server = WorkflowDatabaseServer(
+        config.get_database_file(), config.get_transfered_file_dir(),
+        backend=config.get_database_backend(),
+        cache=config.get_database_status_cache(),
+        archive_delay=config.get_database_archive_delay(),
+        maintenance_interval=config.get_database_maintenance_interval())
 
     if config.get_scheduler_type() == configuration.DRMAA_SCHEDULER:
         from soma_workflow.scheduler import DrmaaCTypes
@@ -1065,7 +1146,9 @@ def _embedded_engine_and_server(config, local_scheduler_config=None):
         scheduler = DrmaaCTypes(config.get_drmaa_implementation(),
                                 config.get_parallel_job_config(),
                                 configured_native_spec
-                                    =config.get_native_specification())
+                                    =config.get_native_specification(),
+                                max_parallel_submissions
+                                    =config.get_submission_threads())
 
     elif config.get_scheduler_type() == configuration.LOCAL_SCHEDULER:
         from soma_workflow.scheduler import ConfiguredLocalScheduler
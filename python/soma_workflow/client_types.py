@@ -754,6 +754,20 @@ class Workflow(object):
         '''
         The keys must be string to serialize with JSON.
         '''
+        return self._to_dict_with_ids()[0]
+
+    def _to_dict_with_ids(self):
+        '''
+        Same as to_dict(), also returning the identifiers given to the
+        elements of the workflow in the dictionary.
+
+        Returns
+        -------
+        (wf_dict, job_ids, transfer_ids, temporary_ids): tuple
+            job_ids: dict Job -> id
+            transfer_ids: dict FileTransfer -> id
+            temporary_ids: dict TemporaryPath -> id
+        '''
         # TODO user_storage
         id_generator = IdGenerator()
         job_ids = {}  # Job -> id
@@ -845,10 +859,25 @@ class Workflow(object):
                                                 option_ids)
         wf_dict["serialized_option_paths"] = ser_opt
 
-        return wf_dict
+        return wf_dict, job_ids, transfer_ids, temporary_ids
 
     @classmethod
     def from_dict(cls, d):
+        return cls._from_dict_with_ids(d)[0]
+
+    @classmethod
+    def _from_dict_with_ids(cls, d):
+        '''
+        Same as from_dict(), also returning the elements of the workflow
+        indexed by their identifier in the dictionary.
+
+        Returns
+        -------
+        (workflow, job_from_ids, tr_from_ids, tmp_from_ids): tuple
+            job_from_ids: dict id -> Job
+            tr_from_ids: dict id -> FileTransfer
+            tmp_from_ids: dict id -> TemporaryPath
+        '''
         name = d.get("name", None)
 
         # shared resource paths
@@ -898,7 +927,7 @@ class Workflow(object):
         # groups
         serialized_groups = d.get("serialized_groups", {})
         group_from_ids = {}
-        to_convert = serialized_groups.keys()
+        to_convert = list(serialized_groups.keys())
         converted_or_stuck = False
         while not converted_or_stuck:
             new_converted = []
@@ -936,7 +965,7 @@ class Workflow(object):
                        user_storage=None,
                        name=name)
 
-        return workflow
+        return workflow, job_from_ids, tr_from_ids, tmp_from_ids
 
     def __group_hubs(self, group, group_to_hub):
         '''
@@ -18,6 +18,7 @@ from __future__ import with_statement, print_function
 import os
 import sys
 import socket
+from datetime import timedelta
 try:
     import configparser # python 3
 except ImportError:
@@ -25,7 +26,7 @@ except ImportError:
 
 from soma_workflow.errors import ConfigurationError
 import soma_workflow.observer as observer
-from soma_workflow.info import DB_VERSION
+from soma_workflow.info import DB_FILE_VERSION
 
 import six
 
@@ -79,6 +80,10 @@ OCFG_MAX_JOB_IN_QUEUE = 'MAX_JOB_IN_QUEUE'
 # running or in the queue for one user. The engine won't submit more than
 # N jobs at once.
 OCFG_MAX_JOB_RUNNING = 'MAX_JOB_RUNNING'
+# OCFG_FAIR_SHARE: if set to True (or empty), the jobs waiting to be
+# submitted in a queue are taken alternately from the different workflows,
+# instead of by priority only.
+OCFG_FAIR_SHARE = 'FAIR_SHARE'
 
 # database server
 CFG_DATABASE_FILE = 'DATABASE_FILE'
@@ -89,6 +94,25 @@ CFG_NAME_SERVER_HOST = 'NAME_SERVER_HOST'
 OCFG_SERVER_LOG_FILE = 'SERVER_LOG_FILE'
 OCFG_SERVER_LOG_LEVEL = 'SERVER_LOG_LEVEL'
 OCFG_SERVER_LOG_FORMAT = 'SERVER_LOG_FORMAT'
+# Database writes: define this item to group the status updates of the
+# engines in delayed commits. The value is the time (in milliseconds) during
+# which the writes are accumulated before a commit, 5 ms if empty.
+OCFG_DATABASE_WRITE_BEHIND = 'DATABASE_WRITE_BEHIND'
+# Database backend: SQLite database file (sqlite, default) or SQLite
+# in-memory database (memory)
+OCFG_DATABASE_BACKEND = 'DATABASE_BACKEND'
+# Database status cache: if set to True (or empty), the database server keeps
+# the status of the active jobs and workflows in memory. It is only correct
+# if no other process writes the database, thus it is only enabled by default
+# with the memory backend.
+OCFG_DATABASE_STATUS_CACHE = 'DATABASE_STATUS_CACHE'
+# Database archival: the workflows done for longer than this number of hours
+# are moved to a compressed archive, and removed from the live tables.
+OCFG_DATABASE_ARCHIVE_DELAY = 'DATABASE_ARCHIVE_DELAY'
+# Database maintenance: interval (in seconds) between two archivals of the
+# done workflows and incremental vacuums of the database, 3600 if empty or,
+# when DATABASE_ARCHIVE_DELAY is set, if missing.
+OCFG_DATABASE_MAINTENANCE_INTERVAL = 'DATABASE_MAINTENANCE_INTERVAL'
 
 # Engine
 OCFG_ENGINE_LOG_DIR = 'ENGINE_LOG_DIR'
@@ -129,6 +153,9 @@ PARALLEL_JOB_ENV = [OCFG_PARALLEL_ENV_MPI_BIN, OCFG_PARALLEL_ENV_NODE_FILE]
 # Native_specification for all jobs
 OCFG_NATIVE_SPECIFICATION = 'NATIVE_SPECIFICATION'
 
+# Number of jobs submitted concurrently to the DRMS (DRMAA scheduler only)
+OCFG_SUBMISSION_THREADS = 'SUBMISSION_THREADS'
+
 # Container (docker / singularity...) prefix prepended to all commands in jobs
 OCFG_CONTAINER_COMMAND = 'CONTAINER_COMMAND'
 
@@ -403,7 +430,7 @@ class Configuration(observer.Observable):
             
             if database_file is None:
                 database_file = os.path.join(
-                    swf_dir, "soma_workflow-%s.db" % DB_VERSION)
+                    swf_dir, "soma_workflow-%s.db" % DB_FILE_VERSION)
 
             config = cls(resource_id=resource_id,
                          mode=mode,
@@ -632,14 +659,14 @@ class Configuration(observer.Observable):
                 swf_dir = self._config_parser.get(
                     self._resource_id, OCFG_SWF_DIR)
             self._database_file = os.path.join(
-                swf_dir, "soma_workflow-%s.db" % DB_VERSION)
+                swf_dir, "soma_workflow-%s.db" % DB_FILE_VERSION)
         else:
             database_file = self._config_parser.get(self._resource_id,
                                                     CFG_DATABASE_FILE)
             # append db version before extension ("soma_workflow-<version>.db")
             db_file_parts = database_file.split('.')
             self._database_file = '.'.join(
-                db_file_parts[:-1]) + '-%s' % DB_VERSION
+                db_file_parts[:-1]) + '-%s' % DB_FILE_VERSION
             if len(db_file_parts) >= 2:
                 self._database_file += '.' + db_file_parts[-1]
         self._database_file = os.path.expandvars(self._database_file)
@@ -684,6 +711,82 @@ class Configuration(observer.Observable):
             self._shared_temporary_dir)
         return self._shared_temporary_dir
 
+    def get_database_write_behind(self):
+        '''
+        Returns the commit interval (in seconds) of the database server in
+        write behind mode, or None if the writes are synchronous.
+        '''
+        if self._config_parser is None or \
+            not self._config_parser.has_option(self._resource_id,
+                                               OCFG_DATABASE_WRITE_BEHIND):
+            return None
+        interval = self._config_parser.get(self._resource_id,
+                                           OCFG_DATABASE_WRITE_BEHIND)
+        if not interval.strip():
+            return 0.005
+        return float(interval) / 1000.
+
+    def get_database_backend(self):
+        '''
+        Returns the kind of SQLite database of the database server (see
+        soma_workflow.database_server.SQLITE_DATABASES), or None for the
+        default one.
+        '''
+        if self._config_parser is None or \
+            not self._config_parser.has_option(self._resource_id,
+                                               OCFG_DATABASE_BACKEND):
+            return None
+        backend = self._config_parser.get(self._resource_id,
+                                          OCFG_DATABASE_BACKEND).strip()
+        return backend or None
+
+    def get_database_status_cache(self):
+        '''
+        Returns True if the database server keeps a status cache (see
+        OCFG_DATABASE_STATUS_CACHE).
+        '''
+        if self._config_parser is None or \
+            not self._config_parser.has_option(self._resource_id,
+                                               OCFG_DATABASE_STATUS_CACHE):
+            return self.get_database_backend() == 'memory'
+        cache = self._config_parser.get(self._resource_id,
+                                        OCFG_DATABASE_STATUS_CACHE).strip()
+        return cache.lower() in ('', '1', 'true', 'yes', 'on')
+
+    def get_database_archive_delay(self):
+        '''
+        Returns the delay (timedelta) after which the done workflows are
+        archived by the database server, or None if they are not archived.
+        '''
+        if self._config_parser is None or \
+            not self._config_parser.has_option(self._resource_id,
+                                               OCFG_DATABASE_ARCHIVE_DELAY):
+            return None
+        delay = self._config_parser.get(self._resource_id,
+                                        OCFG_DATABASE_ARCHIVE_DELAY).strip()
+        if not delay:
+            return None
+        return timedelta(hours=float(delay))
+
+    def get_database_maintenance_interval(self):
+        '''
+        Returns the interval (in seconds) between two maintenances of the
+        database (see WorkflowDatabaseServer.maintenance()), or None if the
+        maintenance is not scheduled. When the archival is enabled, the
+        maintenance is scheduled every hour by default.
+        '''
+        if self._config_parser is None or \
+            not self._config_parser.has_option(
+                self._resource_id, OCFG_DATABASE_MAINTENANCE_INTERVAL):
+            if self.get_database_archive_delay() is not None:
+                return 3600.
+            return None
+        interval = self._config_parser.get(
+            self._resource_id, OCFG_DATABASE_MAINTENANCE_INTERVAL)
+        if not interval.strip():
+            return 3600.
+        return float(interval)
+
     def get_parallel_job_config(self):
         if self._config_parser == None or self.parallel_job_config != None:
             return self.parallel_job_config
@@ -732,6 +835,21 @@ class Configuration(observer.Observable):
                 OCFG_NATIVE_SPECIFICATION)
         return self._native_specification
 
+    def get_submission_threads(self):
+        '''
+        Returns the number of jobs submitted concurrently to the DRMS (see
+        OCFG_SUBMISSION_THREADS), or None to use the scheduler default.
+        '''
+        if self._config_parser is None or \
+            not self._config_parser.has_option(self._resource_id,
+                                               OCFG_SUBMISSION_THREADS):
+            return None
+        threads = self._config_parser.get(self._resource_id,
+                                          OCFG_SUBMISSION_THREADS).strip()
+        if not threads:
+            return None
+        return max(1, int(threads))
+
     def get_path_translation(self):
         if self._config_parser == None or self.path_translation != None:
             return self.path_translation
@@ -870,6 +988,19 @@ class Configuration(observer.Observable):
 
         return self._running_jobs_limits
 
+    def get_fair_share(self):
+        '''
+        Returns True if the engine shares the submissions between the
+        workflows (see OCFG_FAIR_SHARE).
+        '''
+        if self._config_parser is None or \
+            not self._config_parser.has_option(self._resource_id,
+                                               OCFG_FAIR_SHARE):
+            return False
+        fair_share = self._config_parser.get(self._resource_id,
+                                             OCFG_FAIR_SHARE).strip()
+        return fair_share.lower() in ('', '1', 'true', 'yes', 'on')
+
     def get_queues(self):
         if self._config_parser == None or len(self._queues) != 0:
             return self._queues
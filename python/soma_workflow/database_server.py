@@ -25,6 +25,7 @@ import os
 import shutil
 import logging
 import pickle
+import json
 from datetime import date
 from datetime import timedelta
 from datetime import datetime
@@ -32,12 +33,19 @@ import socket
 import itertools
 import math
 import glob
+import functools
+import time
 import ctypes
 import ctypes.util
 import tempfile
+import zlib
+import gc
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 import soma_workflow.constants as constants
 from soma_workflow.client import FileTransfer, TemporaryPath
+from soma_workflow.engine_types import EngineWorkflow
 from soma_workflow.errors import UnknownObjectError, DatabaseError
 from soma_workflow.info import DB_VERSION
 
@@ -73,6 +81,11 @@ if not hasattr(six, 'next'):
 strtime_format = '%Y-%m-%d %H:%M:%S'
 file_separator = ', '
 update_interval = timedelta(0, 30, 0)
+# counters reported by WorkflowDatabaseServer.clean()
+CLEANING_COUNTS = ('jobs', 'transfers', 'temporary_paths', 'workflows',
+                   'archived_workflows', 'files', 'batches')
+# file numbers reservations closer than this (seconds) double the block size
+FILE_NUMBER_GROWTH_INTERVAL = 1.
 
 #-----------------------------------------------------------------------------
 # Local utilities
@@ -184,15 +197,39 @@ Job server database tables:
     pickled_engine_workflow,
     expiration_date,
     name,
-    ended_transfered,
+    ended_transfered (not used since version 1.7, see ended_transfers),
     status
+
+  Ended transfers (created by the 1.7 upgrade)
+    id,
+    workflow_id,
+    engine file path
+
+  Archived workflows (created by the 1.8 upgrade)
+    id (the id the workflow had in the workflows table),
+    user_id,
+    name,
+    expiration_date,
+    status,
+    last_status_update,
+    archive_date,
+    data (compressed rows of the workflow, see archive_data())
 '''
 
 
-def create_database(database_file):
-    connection = sqlite3.connect(
-        database_file, timeout=5, isolation_level="EXCLUSIVE")
+def create_database(database_file, connection=None):
+    '''
+    Create the tables of a new database in database_file, or using an
+    opened connection, which is not closed.
+    '''
+    own_connection = connection is None
+    if own_connection:
+        connection = sqlite3.connect(
+            database_file, timeout=5, isolation_level="EXCLUSIVE")
     cursor = connection.cursor()
+    # the free pages are released by incremental_vacuum(). This has to be
+    # set before the first table is created.
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
     cursor.execute(
         '''CREATE TABLE users (id    INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
                                       login VARCHAR(255) NOT NULL UNIQUE)''')
@@ -275,11 +312,218 @@ def create_database(database_file):
                                            queue              TEXT) ''')
 
     cursor.execute('''CREATE TABLE db_version (version TEXT NOT NULL)''')
-    cursor.execute('INSERT INTO db_version (version) VALUES (?)', [DB_VERSION])
+    cursor.execute('INSERT INTO db_version (version) VALUES (?)',
+                   [BASE_DB_VERSION])
 
     cursor.close()
     connection.commit()
-    connection.close()
+
+    # the tables above are the base schema: later schema changes are applied
+    # as for an existing database.
+    upgrade_database(connection)
+    if own_connection:
+        connection.close()
+
+
+def _create_indexes_1_2(cursor):
+    '''
+    Secondary indexes used by the frequent queries of the engine and of the
+    cleaning functions.
+    '''
+    cursor.execute('CREATE INDEX IF NOT EXISTS jobs_workflow_id '
+                   'ON jobs (workflow_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS jobs_user_status_queue '
+                   'ON jobs (user_id, status, queue)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS jobs_expiration_date '
+                   'ON jobs (expiration_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS transfers_workflow_id '
+                   'ON transfers (workflow_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS temporary_paths_workflow_id '
+                   'ON temporary_paths (workflow_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ios_engine_file_path '
+                   'ON ios (engine_file_path)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ios_tmp_temp_path_id '
+                   'ON ios_tmp (temp_path_id)')
+
+
+def _add_revisions_1_3(cursor):
+    '''
+    Revision numbers on transfers and temporary paths, to get only the
+    status changes since a given revision.
+    '''
+    cursor.execute('CREATE TABLE db_revision (value INTEGER NOT NULL)')
+    cursor.execute('INSERT INTO db_revision (value) VALUES (0)')
+    cursor.execute('ALTER TABLE transfers '
+                   'ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE temporary_paths '
+                   'ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+    # the (workflow_id, revision) indexes replace the workflow_id ones
+    cursor.execute('DROP INDEX IF EXISTS transfers_workflow_id')
+    cursor.execute('DROP INDEX IF EXISTS temporary_paths_workflow_id')
+    cursor.execute('CREATE INDEX IF NOT EXISTS transfers_workflow_revision '
+                   'ON transfers (workflow_id, revision)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS '
+                   'temporary_paths_workflow_revision '
+                   'ON temporary_paths (workflow_id, revision)')
+
+
+def _add_structures_1_4(cursor):
+    '''
+    Structured workflow representation (see EngineWorkflow.to_structure())
+    replacing pickled_engine_workflow.
+    '''
+    cursor.execute('ALTER TABLE workflows ADD COLUMN structure TEXT')
+    cursor.execute('ALTER TABLE jobs ADD COLUMN definition TEXT')
+
+
+def _add_job_revisions_1_5(cursor):
+    '''
+    Revision numbers on jobs, to get only the workflow elements modified
+    since a given revision (see get_detailed_workflow_status_changes()).
+    '''
+    cursor.execute('ALTER TABLE jobs '
+                   'ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+    # the (workflow_id, revision) index replaces the workflow_id one
+    cursor.execute('DROP INDEX IF EXISTS jobs_workflow_id')
+    cursor.execute('CREATE INDEX IF NOT EXISTS jobs_workflow_revision '
+                   'ON jobs (workflow_id, revision)')
+
+
+def _create_expiration_indexes_1_6(cursor):
+    '''
+    Expiration date indexes used by the batches of clean().
+    '''
+    cursor.execute('CREATE INDEX IF NOT EXISTS transfers_expiration_date '
+                   'ON transfers (expiration_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS '
+                   'temporary_paths_expiration_date '
+                   'ON temporary_paths (expiration_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS workflows_expiration_date '
+                   'ON workflows (expiration_date)')
+
+
+def _add_ended_transfers_1_7(cursor):
+    '''
+    Queue of the ended transfers events, replacing the comma separated
+    list of workflows.ended_transfers.
+    '''
+    cursor.execute('CREATE TABLE ended_transfers ('
+                   'id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, '
+                   'workflow_id INTEGER NOT NULL, '
+                   'engine_file_path TEXT NOT NULL)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ended_transfers_workflow_id '
+                   'ON ended_transfers (workflow_id)')
+    for workflow_id, ended_transfers in list(cursor.execute(
+            'SELECT id, ended_transfers FROM workflows '
+            'WHERE ended_transfers IS NOT NULL')):
+        cursor.executemany(
+            'INSERT INTO ended_transfers (workflow_id, engine_file_path) '
+            'VALUES (?, ?)',
+            [(workflow_id, engine_file_path) for engine_file_path
+             in ended_transfers.split(', ')])
+    cursor.execute('UPDATE workflows SET ended_transfers=NULL')
+
+
+def _add_archived_workflows_1_8(cursor):
+    '''
+    Archive of the finished workflows, moved out of the live tables (see
+    WorkflowDatabaseServer.archive_workflows()).
+    '''
+    cursor.execute('CREATE TABLE IF NOT EXISTS archived_workflows ('
+                   'id INTEGER PRIMARY KEY NOT NULL, '
+                   'user_id INTEGER NOT NULL, '
+                   'name TEXT, '
+                   'expiration_date DATE NOT NULL, '
+                   'status TEXT, '
+                   'last_status_update DATE, '
+                   'archive_date DATE NOT NULL, '
+                   'data BLOB NOT NULL)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS archived_workflows_user_id '
+                   'ON archived_workflows (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS '
+                   'archived_workflows_expiration_date '
+                   'ON archived_workflows (expiration_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS workflows_status_update '
+                   'ON workflows (status, last_status_update)')
+
+
+# version of the schema created by the tables definitions of
+# create_database()
+BASE_DB_VERSION = '1.1'
+
+# Database schema upgrades: sequence of
+# (from_version, to_version, upgrade function).
+# An upgrade function takes a cursor on the database, inside a transaction.
+DB_UPGRADES = [
+    ('1.1', '1.2', _create_indexes_1_2),
+    ('1.2', '1.3', _add_revisions_1_3),
+    ('1.3', '1.4', _add_structures_1_4),
+    ('1.4', '1.5', _add_job_revisions_1_5),
+    ('1.5', '1.6', _create_expiration_indexes_1_6),
+    ('1.6', '1.7', _add_ended_transfers_1_7),
+    ('1.7', '1.8', _add_archived_workflows_1_8),
+]
+
+
+def get_database_version(cursor):
+    '''
+    Returns the schema version of a database (str), or None if the
+    db_version table does not exist.
+    '''
+    try:
+        for row in cursor.execute('SELECT version FROM db_version'):
+            return unicode(row[0])
+    except sqlite3.OperationalError:
+        pass
+    return None
+
+
+def can_upgrade_database(version):
+    '''
+    Tells if a database with the given schema version can be upgraded to
+    DB_VERSION.
+    '''
+    version = unicode(version)
+    for from_version, to_version, upgrade in DB_UPGRADES:
+        if from_version == version:
+            version = to_version
+    return version == unicode(DB_VERSION)
+
+
+def upgrade_database(connection):
+    '''
+    Upgrade the schema of an opened database to DB_VERSION, applying all
+    the needed DB_UPGRADES steps in a single exclusive transaction.
+
+    Returns
+    -------
+    version: str
+        the initial version of the database
+    '''
+    cursor = connection.cursor()
+    try:
+        # lock the database before reading its version: another process may
+        # be upgrading it at the same time.
+        cursor.execute('BEGIN EXCLUSIVE')
+        initial_version = get_database_version(cursor)
+        version = initial_version
+        for from_version, to_version, upgrade in DB_UPGRADES:
+            if from_version == version:
+                upgrade(cursor)
+                version = to_version
+        if version != unicode(DB_VERSION):
+            raise DatabaseError('Cannot upgrade the database from version %s '
+                                'to version %s' % (initial_version,
+                                                   DB_VERSION))
+        if version != initial_version:
+            cursor.execute('UPDATE db_version SET version=?', [version])
+    except Exception:
+        connection.rollback()
+        cursor.close()
+        raise
+    connection.commit()
+    cursor.close()
+    return initial_version
 
 
 # -- this is a copy of the find_library in soma-base soma.utils.find_library
@@ -383,6 +627,126 @@ def sqlite3_max_variable_number():
     return _sqlite3_max_variable_number
 
 
+def chunks(sequence, size=None):
+    '''
+    Split a sequence in successive sub-lists of at most size elements, for
+    queries with a number of parameters bounded by
+    sqlite3_max_variable_number(). If size is None, the SQLite limit is
+    used. If the limit is unknown (0), the whole sequence is a single chunk.
+    '''
+    if size is None:
+        size = sqlite3_max_variable_number()
+    sequence = list(sequence)
+    if size <= 0:
+        size = max(len(sequence), 1)
+    for i in range(0, len(sequence), size):
+        yield sequence[i:i + size]
+
+
+# gc_paused() state, shared by the threads of the process
+_gc_pause_lock = threading.Lock()
+_gc_pauses = 0
+_gc_was_enabled = False
+
+
+@contextmanager
+def gc_paused():
+    '''
+    Pause the cyclic garbage collector while a large object graph is built
+    (workflow loaded from the database): otherwise the allocation of many
+    objects triggers collections which scan the growing graph again and
+    again.
+
+    The collector is global to the process: it is paused by the first of
+    concurrent gc_paused() blocks, and enabled again, if it was enabled,
+    when the last one ends.
+    '''
+    global _gc_pauses, _gc_was_enabled
+    with _gc_pause_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_pause_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_was_enabled:
+                gc.enable()
+
+
+def scan_directory(path):
+    '''
+    Iterate over the paths of the entries of a directory, without building
+    the whole list of names (os.scandir is used when available).
+    '''
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(path):
+            yield entry.path
+    else:
+        for name in os.listdir(path):
+            yield os.path.join(path, name)
+
+
+# columns which are not copied in the archived workflows: the pickles are
+# superseded by the workflow structures and the job definitions
+ARCHIVE_EXCLUDED_COLUMNS = ('pickled_engine_job', 'pickled_engine_workflow')
+
+
+def select_rows(cursor, query, args=()):
+    '''
+    Returns the rows selected by a query as a list of dictionaries
+    column name -> value, without the ARCHIVE_EXCLUDED_COLUMNS.
+    '''
+    cursor.execute(query, args)
+    names = [description[0] for description in cursor.description]
+    return [dict((name, value) for name, value in zip(names, row)
+                 if name not in ARCHIVE_EXCLUDED_COLUMNS)
+            for row in cursor.fetchall()]
+
+
+def archive_data(data):
+    '''
+    Compress the rows of an archived workflow (dictionary, see
+    WorkflowDatabaseServer.archive_workflows()) into the value of the data
+    column of the archived_workflows table.
+    '''
+    return sqlite3.Binary(zlib.compress(
+        json.dumps(data).encode('utf-8'), 9))
+
+
+def read_archive_data(blob):
+    '''
+    Returns the rows of an archived workflow compressed by archive_data().
+    '''
+    return json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+
+
+# columns filled when jobs, transfers and temporary paths are registered
+JOB_INSERT_COLUMNS = (
+    'user_id', 'drmaa_id', 'expiration_date', 'status', 'last_status_update',
+    'workflow_id', 'command', 'stdin_file', 'join_errout', 'stdout_file',
+    'stderr_file', 'working_directory', 'custom_submission',
+    'parallel_config_name', 'max_node_number', 'queue', 'name',
+    'submission_date', 'execution_date', 'ending_date', 'exit_status',
+    'exit_value', 'terminating_signal', 'resource_usage',
+    'pickled_engine_job')
+TRANSFER_INSERT_COLUMNS = (
+    'engine_file_path', 'client_file_path', 'transfer_date',
+    'expiration_date', 'user_id', 'workflow_id', 'status', 'client_paths')
+TEMPORARY_PATH_INSERT_COLUMNS = (
+    'engine_file_path', 'expiration_date', 'user_id', 'workflow_id', 'status')
+
+
+def insert_query(table, columns):
+    '''
+    INSERT statement with one parameter per column.
+    '''
+    return 'INSERT INTO %s (%s) VALUES (%s)' \
+        % (table, ', '.join(columns), ', '.join(['?'] * len(columns)))
+
+
 def print_job_status(database_file):
     connection = sqlite3.connect(
         database_file, timeout=5, isolation_level="EXCLUSIVE")
@@ -456,21 +820,862 @@ def print_tables(database_file):
     connection.close()
 
 
+class PooledConnection(object):
+    '''
+    Proxy on a persistent sqlite3 connection owned by a ConnectionPool.
+
+    It behaves like the sqlite3 connection it wraps, except for close() which
+    rolls back any uncommitted transaction and gives the connection back to
+    the pool instead of closing it. This keeps the "connect, work, commit,
+    close" sequence used all along WorkflowDatabaseServer unchanged while
+    avoiding to reopen the database file for each request.
+    '''
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self._connection.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._connection.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        if self._connection is not None:
+            connection = self._connection
+            self._connection = None
+            self._pool.release(connection)
+
+
+class ConnectionPool(object):
+    '''
+    Bounded pool of persistent sqlite3 connections on a database file.
+
+    Connections are created lazily, configured once (journal mode, pragmas)
+    and reused afterwards, so that the sqlite3 prepared statements cache of
+    each connection is also reused across requests. At most max_idle unused
+    connections are kept open; connections checked out beyond this number
+    are closed when they are released.
+
+    Connections are shared between threads (check_same_thread=False): a
+    connection is only used by the thread which acquired it, until it is
+    released.
+
+    Parameters
+    ----------
+    database_file: str
+        SQLite database file
+    isolation_level: str (optional)
+        sqlite3 isolation level of the connections
+    timeout: float (optional)
+        time to wait for a database lock, in seconds
+    max_idle: int (optional)
+        maximum number of unused connections kept open
+    journal_mode: str or None (optional)
+        SQLite journal mode (WAL, DELETE...). None keeps the database
+        setting.
+    synchronous: str or None (optional)
+        SQLite synchronous pragma value (OFF, NORMAL, FULL)
+    cache_size: int or None (optional)
+        SQLite cache_size pragma value. Negative values are in KiB.
+    cached_statements: int (optional)
+        size of the prepared statements cache of each connection
+    query_only: bool (optional)
+        if True, the connections refuse any change of the database
+    uri: bool (optional)
+        if True, database_file is an SQLite URI (Python 3 only)
+    '''
+
+    def __init__(self, database_file, isolation_level="EXCLUSIVE",
+                 timeout=10, max_idle=4, journal_mode="WAL",
+                 synchronous="NORMAL", cache_size=-16000,
+                 cached_statements=256, query_only=False, uri=False):
+        self.database_file = database_file
+        self.isolation_level = isolation_level
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.cached_statements = cached_statements
+        self.query_only = query_only
+        self.uri = uri
+        self._idle = []
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger('jobServer')
+
+    def _new_connection(self):
+        kwargs = {}
+        if self.uri:
+            kwargs['uri'] = True
+        connection = sqlite3.connect(
+            self.database_file, timeout=self.timeout,
+            isolation_level=self.isolation_level,
+            check_same_thread=False,
+            cached_statements=self.cached_statements, **kwargs)
+        try:
+            if self.journal_mode:
+                mode = connection.execute(
+                    'PRAGMA journal_mode=%s' % self.journal_mode).fetchone()
+                if mode is None or unicode(mode[0]).upper() \
+                        != self.journal_mode.upper():
+                    # WAL is not available on every filesystem (NFS...)
+                    self.logger.info('could not set journal_mode to %s on '
+                                     '%s, using %s' % (self.journal_mode,
+                                                       self.database_file,
+                                                       mode))
+            if self.synchronous:
+                connection.execute('PRAGMA synchronous=%s' % self.synchronous)
+            if self.cache_size is not None:
+                connection.execute('PRAGMA cache_size=%d' % self.cache_size)
+            if self.query_only:
+                connection.execute('PRAGMA query_only=ON')
+        except sqlite3.Error as e:
+            self.logger.warning('could not set connection pragmas on %s: '
+                                '%s' % (self.database_file, e))
+        return connection
+
+    def acquire(self):
+        '''
+        Get a connection from the pool, open a new one if none is available.
+
+        Returns
+        -------
+        connection: PooledConnection
+        '''
+        connection = None
+        with self._lock:
+            if self._idle:
+                connection = self._idle.pop()
+        if connection is None:
+            connection = self._new_connection()
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        '''
+        Give back a (raw sqlite3) connection to the pool. A pending
+        transaction is rolled back.
+        '''
+        try:
+            connection.rollback()
+        except sqlite3.Error:
+            connection.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        '''
+        Close all the idle connections. Connections currently in use are
+        closed when they are released.
+        '''
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+            self.max_idle = 0
+        for connection in idle:
+            connection.close()
+
+
+class SQLiteDatabase(object):
+    '''
+    SQLite database of a WorkflowDatabaseServer: where the database lives,
+    how it is created and how connections are opened on it.
+
+    This is not a data access layer: the server reads and writes its data
+    with SQLite SQL queries, whatever the database, and a database of
+    another kind cannot be plugged in here. The databases are selected by
+    name (the "backend" parameter of the server, and the DATABASE_BACKEND
+    configuration item) with sqlite_database().
+    '''
+
+    #: name of the database kind in SQLITE_DATABASES
+    name = None
+    #: True if the data outlives the database object
+    persistent = True
+
+    def exists(self):
+        '''
+        Tells if the database already exists.
+        '''
+        raise NotImplementedError()
+
+    def create(self):
+        '''
+        Create a new database, at version DB_VERSION.
+        '''
+        raise NotImplementedError()
+
+    def connect(self):
+        '''
+        Returns a new connection, which has to be closed after use.
+        '''
+        raise NotImplementedError()
+
+    def connection_pool(self, **kwargs):
+        '''
+        Returns a ConnectionPool on the database. kwargs are ConnectionPool
+        parameters.
+        '''
+        raise NotImplementedError()
+
+
+class SQLiteFileDatabase(SQLiteDatabase):
+    '''
+    SQLite database file, shared with other processes.
+
+    Parameters
+    ----------
+    database_file: str
+        SQLite database file
+    journal_mode: str (optional)
+        SQLite journal mode of the connections pools
+    '''
+
+    name = 'sqlite'
+
+    def __init__(self, database_file, journal_mode="WAL"):
+        self.database_file = database_file
+        self.journal_mode = journal_mode
+
+    def __str__(self):
+        return self.database_file
+
+    def exists(self):
+        return os.path.isfile(self.database_file)
+
+    def create(self):
+        create_database(self.database_file)
+
+    def connect(self):
+        return sqlite3.connect(self.database_file, timeout=10,
+                               isolation_level="EXCLUSIVE")
+
+    def connection_pool(self, **kwargs):
+        kwargs.setdefault('journal_mode', self.journal_mode)
+        return ConnectionPool(self.database_file, **kwargs)
+
+
+class SQLiteMemoryDatabase(SQLiteDatabase):
+    '''
+    SQLite in-memory database, shared by the connections of the process
+    (memdb VFS). The data is lost when the database object is deleted:
+    this is meant for light mode and tests.
+
+    Unlike a shared cache database, the connections lock the whole database
+    as with a database file, and wait for each other (timeout) instead of
+    failing: readers only see committed writes.
+
+    Parameters
+    ----------
+    name: str (optional)
+        the databases of the process with the same name share the same
+        data. By default, the database is private to the object.
+    '''
+
+    name = 'memory'
+    persistent = False
+
+    def __init__(self, name=None):
+        if sys.version_info < (3, 4) \
+                or sqlite3.sqlite_version_info < (3, 36, 0):
+            raise DatabaseError('The memory database needs '
+                                'Python >= 3.4 and SQLite >= 3.36')
+        if name is None:
+            name = 'swf_%x' % id(self)
+        # memdb databases are shared by name if the name starts with "/"
+        self.uri = 'file:/%s?vfs=memdb' \
+            % six.moves.urllib.parse.quote(name.lstrip('/'))
+        # the database lives as long as a connection is opened on it
+        self._keeper = None
+
+    def __str__(self):
+        return self.uri
+
+    def exists(self):
+        if self._keeper is None:
+            self._keeper = self.connect()
+        return six.next(self._keeper.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type='table'"))[0] != 0
+
+    def create(self):
+        if self._keeper is None:
+            self._keeper = self.connect()
+        create_database(None, self._keeper)
+
+    def connect(self):
+        return sqlite3.connect(self.uri, uri=True, timeout=10,
+                               isolation_level="EXCLUSIVE",
+                               check_same_thread=False)
+
+    def connection_pool(self, **kwargs):
+        # memdb does not support WAL
+        kwargs['journal_mode'] = None
+        return ConnectionPool(self.uri, uri=True, **kwargs)
+
+
+#: SQLite databases kinds by name
+SQLITE_DATABASES = {
+    SQLiteFileDatabase.name: SQLiteFileDatabase,
+    SQLiteMemoryDatabase.name: SQLiteMemoryDatabase,
+}
+
+
+def sqlite_database(name, database_file, journal_mode="WAL"):
+    '''
+    Returns a new SQLite database object.
+
+    Parameters
+    ----------
+    name: str
+        database kind, in SQLITE_DATABASES
+    database_file: str
+        database file of the sqlite kind, name of the database of the
+        memory kind
+    journal_mode: str (optional)
+        journal mode of the sqlite kind
+    '''
+    if name == SQLiteFileDatabase.name:
+        return SQLiteFileDatabase(database_file, journal_mode)
+    if name == SQLiteMemoryDatabase.name:
+        return SQLiteMemoryDatabase(database_file)
+    raise DatabaseError('Unknown database backend: %s (available: %s)'
+                        % (name, ', '.join(sorted(SQLITE_DATABASES))))
+
+
+class BatchConnection(object):
+    '''
+    Proxy on the connection of a group commit, given to the write methods
+    run by WorkflowDatabaseServer._commit_writes().
+
+    The transaction is managed by the group commit: commit(), rollback()
+    and close() do nothing, so that the write methods can be run unchanged
+    within a larger transaction.
+    '''
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class WriteBehindQueue(object):
+    '''
+    Queue of delayed database writes, committed by groups.
+
+    Writes are method calls recorded by submit(). A writer thread waits for
+    commit_interval seconds after the first pending write, so that other
+    writes accumulate, then calls commit_writes() which runs all of them in
+    a single transaction.
+
+    Each submitted write gets a ticket number. The queue keeps the last
+    ticket submitted by each thread, so that a thread can tell whether some
+    of its own writes are not committed yet (pending()).
+
+    Parameters
+    ----------
+    commit_writes: callable
+        function taking no argument, committing the writes returned by
+        take()
+    commit_interval: float (optional)
+        time to wait for more writes before a group commit, in seconds
+    max_pending: int (optional)
+        number of pending writes triggering a group commit without waiting
+        for commit_interval
+    '''
+
+    def __init__(self, commit_writes, commit_interval=0.005,
+                 max_pending=1000):
+        self.commit_writes = commit_writes
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        self._writes = []
+        self._submitted = 0
+        self._committed = 0
+        self._errors = {}
+        self._closed = False
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        self.logger = logging.getLogger('jobServer')
+        self._thread = threading.Thread(target=self._run,
+                                        name='database_writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, method, args, kwargs):
+        '''
+        Record a write. method(*args, **kwargs) will be called by the next
+        group commit.
+
+        Returns
+        -------
+        submitted: bool
+            False if the queue is closed: the write has to be done
+            synchronously.
+        '''
+        with self._condition:
+            if self._closed:
+                return False
+            self._submitted += 1
+            self._writes.append((threading.current_thread().ident,
+                                 method, args, kwargs))
+            self._local.ticket = self._submitted
+            if len(self._writes) == 1 \
+                    or len(self._writes) >= self.max_pending:
+                self._condition.notify()
+        return True
+
+    def take(self):
+        '''
+        Returns the pending writes, as a list of (thread ident, method, args,
+        kwargs), and the ticket of the last one. They are removed from the
+        queue and must be acknowledged with done() once committed.
+        '''
+        with self._condition:
+            writes = self._writes
+            self._writes = []
+            return writes, self._submitted
+
+    def done(self, ticket, errors):
+        '''
+        Acknowledge the writes up to ticket.
+
+        Parameters
+        ----------
+        ticket: int
+        errors: list
+            (thread ident, exception) for each failed write
+        '''
+        with self._condition:
+            self._committed = max(self._committed, ticket)
+            for ident, error in errors:
+                self._errors.setdefault(ident, error)
+
+    def pending(self):
+        '''
+        True if some writes of the calling thread are not committed yet.
+        '''
+        return getattr(self._local, 'ticket', 0) > self._committed
+
+    def pop_error(self):
+        '''
+        Returns the first failure of a write of the calling thread since the
+        last call, or None.
+        '''
+        with self._condition:
+            return self._errors.pop(threading.current_thread().ident, None)
+
+    def close(self):
+        '''
+        Stop accepting writes and stop the writer thread once the pending
+        writes are committed.
+        '''
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._writes and not self._closed:
+                    self._condition.wait()
+                if not self._writes:
+                    return
+                # let other writes accumulate
+                deadline = time.time() + self.commit_interval
+                while not self._closed \
+                        and 0 < len(self._writes) < self.max_pending:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            try:
+                self.commit_writes()
+            except Exception as e:
+                self.logger.exception('group commit failed: %s' % e)
+
+
+class BackgroundTask(object):
+    '''
+    Thread running a function when requested. Requests made while the
+    function is running are merged into a single new run.
+
+    Parameters
+    ----------
+    function: callable
+        called with the keyword arguments of the merged requests
+    name: str
+        thread name
+    '''
+
+    def __init__(self, function, name):
+        self.function = function
+        self.running = False
+        self._requested = False
+        self._kwargs = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self.logger = logging.getLogger('jobServer')
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def request(self, **kwargs):
+        '''
+        Ask for a run of the function. kwargs are boolean options: an
+        option is True in the run if it is True in any of the merged
+        requests.
+        '''
+        with self._condition:
+            self._requested = True
+            for name, value in six.iteritems(kwargs):
+                self._kwargs[name] = self._kwargs.get(name) or value
+            self._condition.notify_all()
+
+    def wait(self):
+        '''
+        Wait until the requested runs are done.
+        '''
+        with self._condition:
+            while (self._requested or self.running) \
+                    and self._thread.is_alive():
+                self._condition.wait(1.)
+
+    def close(self):
+        '''
+        Stop the thread once the current run is over. Pending requests are
+        dropped.
+        '''
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._requested and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                kwargs = self._kwargs
+                self._kwargs = {}
+                self._requested = False
+                self.running = True
+            try:
+                self.function(**kwargs)
+            except Exception as e:
+                self.logger.exception('%s failed: %s'
+                                      % (self._thread.name, e))
+            with self._condition:
+                self.running = False
+                self._condition.notify_all()
+
+
+class PeriodicTask(object):
+    '''
+    Thread running a function every interval seconds, the first time one
+    interval after its creation.
+
+    Parameters
+    ----------
+    function: callable
+        called without arguments
+    interval: float
+        time between the end of a run and the start of the next one, in
+        seconds
+    name: str
+        thread name
+    '''
+
+    def __init__(self, function, interval, name):
+        self.function = function
+        self.interval = interval
+        self._closed = False
+        self._condition = threading.Condition()
+        self.logger = logging.getLogger('jobServer')
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        '''
+        Stop the thread once the current run is over.
+        '''
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed:
+                    self._condition.wait(self.interval)
+                if self._closed:
+                    return
+            try:
+                self.function()
+            except Exception as e:
+                self.logger.exception('%s failed: %s'
+                                      % (self._thread.name, e))
+
+
+class StatusCache(object):
+    '''
+    Write-through cache of a WorkflowDatabaseServer: status and last
+    status update date of the jobs and workflows written by the server, and
+    numbers of jobs by user, queue and status.
+
+    Entries are added when the server writes a status, and the workflows
+    are evicted with their jobs when they end, so that the cache only holds
+    the active workflows. The numbers of jobs are loaded from the database
+    when needed, then kept up to date by the writes.
+
+    The cache is modified holding the server lock, and read without it.
+    It is only correct if the server is the only one writing the database,
+    as in light mode.
+    '''
+
+    def __init__(self):
+        # job_id -> [user_id, workflow_id, queue, status, date]
+        self.jobs = {}
+        # workflow_id -> [user_id, status, date]
+        self.workflows = {}
+        # workflow_id -> set of cached job ids
+        self.workflow_jobs = {}
+        # (user_id, queue, status) -> number of jobs, or None if unknown
+        self.counts = None
+
+    def clear(self):
+        self.jobs = {}
+        self.workflows = {}
+        self.workflow_jobs = {}
+        self.counts = None
+
+    def missing_jobs(self, job_ids):
+        return [job_id for job_id in job_ids if job_id not in self.jobs]
+
+    def missing_workflows(self, wf_ids):
+        return [wf_id for wf_id in wf_ids if wf_id not in self.workflows]
+
+    def add_job(self, job_id, user_id, workflow_id, queue, status, date):
+        self.jobs[job_id] = [user_id, workflow_id, queue, status, date]
+        if workflow_id is not None:
+            self.workflow_jobs.setdefault(workflow_id, set()).add(job_id)
+
+    def add_workflow(self, wf_id, user_id, status, date):
+        self.workflows[wf_id] = [user_id, status, date]
+
+    def _count(self, user_id, queue, status, increment):
+        if self.counts is not None:
+            key = (user_id, queue, status)
+            self.counts[key] = self.counts.get(key, 0) + increment
+
+    def set_job_status(self, job_id, status, date):
+        entry = self.jobs.get(job_id)
+        if entry is None:
+            # unknown previous status
+            self.counts = None
+            return
+        user_id, workflow_id, queue, previous_status = entry[:4]
+        if status != previous_status:
+            self._count(user_id, queue, previous_status, -1)
+            self._count(user_id, queue, status, 1)
+            entry[3] = status
+        entry[4] = date.replace(microsecond=0)
+
+    def set_job_date(self, job_id, date):
+        entry = self.jobs.get(job_id)
+        if entry is not None:
+            entry[4] = date.replace(microsecond=0)
+
+    def set_workflow_jobs_date(self, wf_id, date):
+        for job_id in self.workflow_jobs.get(wf_id, ()):
+            self.set_job_date(job_id, date)
+
+    def set_jobs_queue(self, job_ids, queue):
+        for job_id in job_ids:
+            entry = self.jobs.get(job_id)
+            if entry is None:
+                self.counts = None
+                continue
+            user_id, workflow_id, previous_queue, status = entry[:4]
+            self._count(user_id, previous_queue, status, -1)
+            self._count(user_id, queue, status, 1)
+            entry[2] = queue
+
+    def set_workflow_status(self, wf_id, status, date):
+        entry = self.workflows.get(wf_id)
+        if entry is not None:
+            entry[1] = status
+            entry[2] = date.replace(microsecond=0)
+        if status == constants.WORKFLOW_DONE:
+            self.evict_workflow(wf_id)
+
+    def evict_workflow(self, wf_id):
+        self.workflows.pop(wf_id, None)
+        for job_id in self.workflow_jobs.pop(wf_id, ()):
+            self.jobs.pop(job_id, None)
+
+    def job_status(self, job_id, user_id):
+        entry = self.jobs.get(job_id)
+        if entry is None or entry[0] != user_id:
+            return None
+        return (entry[3], entry[4])
+
+    def workflow_status(self, wf_id, user_id):
+        entry = self.workflows.get(wf_id)
+        if entry is None or entry[0] != user_id:
+            return None
+        return (entry[1], entry[2])
+
+    def nb_jobs(self, user_id, queue, statuses):
+        counts = self.counts
+        if counts is None:
+            return None
+        return sum([counts.get((user_id, queue, status), 0)
+                    for status in statuses])
+
+
+def write_behind(method):
+    '''
+    Decorator of the WorkflowDatabaseServer write methods which may be
+    delayed and grouped with other writes when the server works in write
+    behind mode. The decorated method must not return anything, and its
+    arguments must not be modified by the caller after the call.
+    '''
+    @functools.wraps(method)
+    def delayed_method(self, *args, **kwargs):
+        queue = self._write_queue
+        if queue is None or self._in_batch() \
+                or not queue.submit(method, (self,) + args, kwargs):
+            return method(self, *args, **kwargs)
+    return delayed_method
+
+
 class WorkflowDatabaseServer(object):
 
-    def __init__(self, database_file, tmp_file_dir_path, shared_tmp_dir=None):
+    def __init__(self, database_file, tmp_file_dir_path, shared_tmp_dir=None,
+                 persistent_connections=True, journal_mode="WAL",
+                 write_behind=False, commit_interval=0.005,
+                 background_cleaning=False, clean_batch_size=1000,
+                 file_removal_threads=1, background_sweeping=False,
+                 sweep_batch_size=1000, sweep_pause=0.,
+                 file_number_block_size=200,
+                 max_file_number_block_size=100000, backend=None,
+                 cache=False, archive_delay=None, maintenance_interval=None,
+                 vacuum_pages=1000):
         '''
         The constructor gets as parameter the database information.
 
         @type  database_file: string
-        @param database_file: the SQLite database file
+        @param database_file: the SQLite database file (name of the database
+        with the memory backend)
         @type  tmp_file_dir_path: string
         @param tmp_file_dir_path: place on the resource file system where
         the files will be transfered
+        @type  persistent_connections: bool
+        @param persistent_connections: if True (the default), database
+        connections are kept open in a pool and reused between requests.
+        If False, a new connection is opened for each request.
+        @type  journal_mode: string
+        @param journal_mode: SQLite journal mode used by pooled connections
+        (WAL by default). None keeps the mode of the database file.
+        With persistent connections, read requests (get_* methods) use
+        separate read-only connections and do not wait for the writes of
+        other threads: in WAL mode, they see the last committed state of
+        the database.
+        @type  write_behind: bool
+        @param write_behind: if True, status updates (set_jobs_status,
+        set_workflows_status, set_transfer_status...) are queued and
+        committed by groups in a writer thread. A thread always reads its
+        own writes: its pending writes are committed before any other
+        request it makes. flush() commits all the pending writes.
+        @type  commit_interval: float
+        @param commit_interval: in write behind mode, time during which
+        writes are accumulated before a group commit, in seconds.
+        @type  background_cleaning: bool
+        @param background_cleaning: if True, clean() only wakes up a
+        cleaner thread which deletes the expired items.
+        @type  clean_batch_size: int
+        @param clean_batch_size: maximum number of items of each kind
+        deleted in a transaction by clean().
+        @type  file_removal_threads: int
+        @param file_removal_threads: number of threads removing the files
+        of the deleted items.
+        @type  background_sweeping: bool
+        @param background_sweeping: if True, remove_non_registered_files()
+        only wakes up a sweeper thread which removes the files.
+        @type  sweep_batch_size: int
+        @param sweep_batch_size: number of directory entries examined by
+        remove_non_registered_files() between two pauses.
+        @type  sweep_pause: float
+        @param sweep_pause: pause of remove_non_registered_files() after
+        each sweep_batch_size entries, in seconds, to limit its load on
+        the file system.
+        @type  file_number_block_size: int
+        @param file_number_block_size: number of file numbers reserved at
+        once in the database (see reserve_file_numbers()).
+        @type  max_file_number_block_size: int
+        @param max_file_number_block_size: the block size doubles, up to
+        this size, when file numbers are used faster than one block per
+        second.
+        @type  backend: string or SQLiteDatabase
+        @param backend: SQLite database kind (see SQLITE_DATABASES): the
+        database file (sqlite, the default) or an in-memory database.
+        @type  cache: bool
+        @param cache: if True, the status of the active jobs and workflows
+        and the numbers of running jobs are kept in memory (see
+        StatusCache) and read from there. Only valid if the server is the
+        only one writing the database, as in light mode.
+        @type  archive_delay: timedelta
+        @param archive_delay: the workflows done for longer than this are
+        moved to the archive by maintenance() (see archive_workflows()).
+        None (the default) disables the archival.
+        @type  maintenance_interval: float
+        @param maintenance_interval: if not None, maintenance() is run by a
+        thread every maintenance_interval seconds.
+        @type  vacuum_pages: int
+        @param vacuum_pages: maximum number of free pages released by each
+        incremental vacuum of maintenance().
         '''
 
         self._tmp_file_dir_path = tmp_file_dir_path
         self._database_file = database_file
+        if backend is None or isinstance(backend, six.string_types):
+            backend = sqlite_database(backend or SQLiteFileDatabase.name,
+                                      database_file, journal_mode)
+        self._backend = backend
+        self._connection_pool = None
+        self._read_connection_pool = None
+        if persistent_connections:
+            self._connection_pool = backend.connection_pool()
+            # read transactions are opened explicitly (see _connect())
+            self._read_connection_pool = backend.connection_pool(
+                isolation_level=None, max_idle=8, journal_mode=None,
+                query_only=True)
         if shared_tmp_dir:
             self._shared_temp_dir = shared_tmp_dir
         else:
@@ -480,16 +1685,40 @@ class WorkflowDatabaseServer(object):
         EngineTemporaryPath.temporary_directory = self._shared_temp_dir
 
         self._lock = threading.RLock()
+        self._write_queue = None
+        self._batch_connection = None
+        self._batch_thread = None
+        self.clean_batch_size = clean_batch_size
+        self.file_removal_threads = file_removal_threads
+        self._cleaner = None
+        self._cleaning_counts = None
+        self.sweep_batch_size = sweep_batch_size
+        self.sweep_pause = sweep_pause
+        self._sweeper = None
+        self.archive_delay = archive_delay
+        self.vacuum_pages = vacuum_pages
+        self._maintenance = None
+        self._cache = None
+        if cache:
+            self._cache = StatusCache()
+        self._cleaning_total = dict((name, 0) for name in CLEANING_COUNTS)
 
         self.logger = logging.getLogger('jobServer')
         self.logger.debug("=> starting database server")
-        self._free_file_counters = []
+        # reserved file numbers: [_next_file_number, _file_number_limit[
+        self._next_file_number = 0
+        self._file_number_limit = 0
+        self.file_number_block_size = file_number_block_size
+        self.max_file_number_block_size = max_file_number_block_size
+        self._file_number_block = file_number_block_size
+        self._last_file_number_block_time = None
 
         with self._lock:
-            if not os.path.isfile(database_file):
-                print("Database creation " + database_file)
-                self.logger.info("Database creation " + database_file)
-                create_database(database_file)
+            if not backend.exists():
+                if backend.persistent:
+                    print("Database creation %s" % backend)
+                self.logger.info("Database creation %s" % backend)
+                backend.create()
             else:
                 connection = self._connect()
                 cursor = connection.cursor()
@@ -506,7 +1735,14 @@ class WorkflowDatabaseServer(object):
                             "SELECT count(*) FROM workflows WHERE "
                             "queue=?", ["default queue"]))[0]
                     elif unicode(version) != unicode(DB_VERSION):
-                        raise Exception('Wrong db version')
+                        if not can_upgrade_database(version):
+                            raise Exception('Wrong db version')
+                        cursor.close()
+                        self.logger.info("Database upgrade %s from version "
+                                         "%s to %s" % (database_file, version,
+                                                       DB_VERSION))
+                        upgrade_database(connection)
+                        cursor = connection.cursor()
                 except Exception as e:
                     cursor.close()
                     connection.close()
@@ -520,22 +1756,204 @@ class WorkflowDatabaseServer(object):
                                         " the file " +
                                         str(database_file) + " \n"
                                         "  3. Clear the content of the directory: " + repr(tmp_file_dir_path))
+                cursor.close()
+                connection.close()
+
+        if write_behind:
+            # the writer connection manages its transactions explicitly
+            self._writer_connections = backend.connection_pool(
+                isolation_level=None, max_idle=1)
+            self._write_queue = WriteBehindQueue(self._commit_writes,
+                                                 commit_interval)
+        if background_cleaning:
+            self._cleaner = BackgroundTask(self._background_clean,
+                                           'database_cleaner')
+        if background_sweeping:
+            self._sweeper = BackgroundTask(self._sweep_non_registered_files,
+                                           'database_sweeper')
+        if maintenance_interval is not None:
+            self._maintenance = PeriodicTask(self.maintenance,
+                                             maintenance_interval,
+                                             'database_maintenance')
 
     def __del__(self):
         # send VACUUM command ?
-        pass
+        self.close_connections()
+
+    def close_connections(self):
+        '''
+        Close the persistent database connections kept by the server.
+        In write behind mode, the pending writes are committed and the
+        writer thread is stopped: later writes are synchronous.
+        '''
+        for task in (getattr(self, '_cleaner', None),
+                     getattr(self, '_sweeper', None),
+                     getattr(self, '_maintenance', None)):
+            if task is not None:
+                task.close()
+        queue = getattr(self, '_write_queue', None)
+        if queue is not None:
+            queue.close()
+            self._commit_writes()
+            self._writer_connections.close()
+        for pool in (getattr(self, '_connection_pool', None),
+                     getattr(self, '_read_connection_pool', None)):
+            if pool is not None:
+                pool.close()
+
+    def flush(self):
+        '''
+        Write barrier: in write behind mode, commit all the pending writes,
+        whatever the thread which made them. Does nothing otherwise.
+
+        Raises DatabaseError if a write of the calling thread failed since
+        the last flush().
+        '''
+        if self._write_queue is None:
+            return
+        self._commit_writes()
+        error = self._write_queue.pop_error()
+        if error is not None:
+            raise DatabaseError('delayed write failed: %s' % error)
+
+    def _in_batch(self):
+        return self._batch_thread is threading.current_thread()
+
+    def _commit_writes(self):
+        '''
+        Group commit: run all the writes pending in the write queue in a
+        single transaction. A failing write is rolled back alone (savepoint)
+        and does not prevent the others from being committed.
+        '''
+        with self._lock:
+            writes, ticket = self._write_queue.take()
+            if not writes:
+                return
+            errors = []
+            connection = self._writer_connections.acquire()
+            self._batch_connection = BatchConnection(connection)
+            self._batch_thread = threading.current_thread()
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                for ident, method, args, kwargs in writes:
+                    connection.execute('SAVEPOINT delayed_write')
+                    try:
+                        method(*args, **kwargs)
+                    except Exception as e:
+                        self.logger.error('delayed %s failed: %s'
+                                          % (method.__name__, e))
+                        connection.execute('ROLLBACK TO delayed_write')
+                        errors.append((ident, e))
+                    connection.execute('RELEASE delayed_write')
+                connection.execute('COMMIT')
+            except Exception as e:
+                self.logger.error('group commit of %d writes failed: %s'
+                                  % (len(writes), e))
+                try:
+                    connection.execute('ROLLBACK')
+                except sqlite3.Error:
+                    pass
+                errors = [(ident, e) for ident, method, args, kwargs
+                          in writes]
+                if self._cache is not None:
+                    # the cache was written through by the discarded writes
+                    self._cache.clear()
+            finally:
+                self._batch_connection = None
+                self._batch_thread = None
+                connection.close()
+            self._write_queue.done(ticket, errors)
+
+    def _connect(self, read_only=False):
+        '''
+        Returns a database connection. The connection must be closed after
+        use.
 
-    def _connect(self):
+        Read only connections do not require to hold self._lock: each one
+        works in a read transaction, so that all the queries made on it see
+        the same state of the database.
+        '''
+        if self._batch_connection is not None and self._in_batch():
+            return self._batch_connection
+        self._read_own_writes()
         try:
-            connection = sqlite3.connect(
-                self._database_file, timeout=10, isolation_level="EXCLUSIVE")
+            if read_only and self._read_connection_pool is not None:
+                connection = self._read_connection_pool.acquire()
+                connection.execute('BEGIN')
+            elif self._connection_pool is not None:
+                connection = self._connection_pool.acquire()
+            else:
+                connection = self._backend.connect()
         except Exception as e:
-            raise (DatabaseError,
-                   DatabaseError('On database file %s: %s: %s \n'
-                                 % (self._database_file, type(e), e)),
-                   sys.exc_info()[2])
+            six.reraise(DatabaseError,
+                        DatabaseError('On database %s: %s: %s \n'
+                                      % (self._backend, type(e), e)),
+                        sys.exc_info()[2])
         return connection
 
+    def _read_own_writes(self):
+        '''
+        Read your writes: commit the pending writes of the calling thread
+        before it accesses the database (or the cache) again.
+        '''
+        if self._write_queue is not None and self._write_queue.pending():
+            self._commit_writes()
+
+    def _cache_jobs(self, cursor, job_ids):
+        '''
+        Load in the cache the jobs which are not cached yet, before writing
+        them.
+        '''
+        for chunk in chunks(self._cache.missing_jobs(job_ids)):
+            for job_id, user_id, workflow_id, queue, status, date \
+                    in list(cursor.execute(
+                        'SELECT id, user_id, workflow_id, queue, status, '
+                        'last_status_update FROM jobs WHERE id IN (%s)'
+                        % ','.join(['?'] * len(chunk)), chunk)):
+                self._cache.add_job(job_id, user_id, workflow_id,
+                                    self._string_conversion(queue),
+                                    self._string_conversion(status),
+                                    self._str_to_date_conversion(date))
+
+    def _cache_workflows(self, cursor, wf_ids):
+        '''
+        Load in the cache the workflows which are not cached yet, before
+        writing them.
+        '''
+        for chunk in chunks(self._cache.missing_workflows(wf_ids)):
+            for wf_id, user_id, status, date in list(cursor.execute(
+                    'SELECT id, user_id, status, last_status_update '
+                    'FROM workflows WHERE id IN (%s)'
+                    % ','.join(['?'] * len(chunk)), chunk)):
+                self._cache.add_workflow(wf_id, user_id,
+                                         self._string_conversion(status),
+                                         self._str_to_date_conversion(date))
+
+    def _load_jobs_counts(self):
+        '''
+        Load in the cache the numbers of jobs by user, queue and status.
+        '''
+        with self._lock:
+            connection = self._connect()
+            cursor = connection.cursor()
+            try:
+                counts = dict(
+                    ((user_id, self._string_conversion(queue),
+                      self._string_conversion(status)), count)
+                    for user_id, queue, status, count in cursor.execute(
+                        'SELECT user_id, queue, status, count(*) FROM jobs '
+                        'GROUP BY user_id, status, queue'))
+            except Exception as e:
+                connection.rollback()
+                cursor.close()
+                connection.close()
+                six.reraise(DatabaseError, DatabaseError(e),
+                            sys.exc_info()[2])
+            connection.commit()
+            cursor.close()
+            connection.close()
+            self._cache.counts = counts
+
     def _user_transfer_dir_path(self, login, user_id):
         if hasattr(login, 'decode'): # python3 bytes object
             login = login.decode('utf8')
@@ -579,193 +1997,237 @@ class WorkflowDatabaseServer(object):
                 except OSError:
                     pass
 
-        self.remove_non_registered_files()
+        self.remove_non_registered_files()
+
+        return user_id
+
+    def clean(self, vacuum=False):
+        '''
+        Delete all expired jobs, transfers, workflows and archived
+        workflows, except transfers which are requested by valid job.
+
+        The expired items are deleted by batches of clean_batch_size items
+        of each kind, each batch in its own short transaction, and their
+        files are removed from the disk outside of the database lock. With
+        background cleaning, this is done in the cleaner thread and clean()
+        returns immediately.
+
+        Parameters
+        ----------
+        vacuum: bool (optional)
+            if True, vacuum the database after the cleaning
+
+        Returns
+        -------
+        counts: dict or None
+            numbers of deleted jobs, transfers, temporary_paths, workflows,
+            archived_workflows and removed files, and number of batches
+            (None with background cleaning)
+        '''
+        self.logger.debug("=> clean")
+        if self._cleaner is not None:
+            self._cleaner.request(vacuum=vacuum)
+            return None
+        counts = self._clean_expired()
+        if vacuum:
+            self.vacuum()
+        return counts
 
-        return user_id
+    def cleaning_status(self):
+        '''
+        Progress of the background cleaning.
 
-    def clean(self):
+        Returns
+        -------
+        status: dict
+            running (bool), the counts (see clean()) of the current or
+            last cleaning and the totals since the server started
         '''
-        Delete all expired jobs, transfers and workflows, except transfers which are requested
-        by valid job.
+        if self._cleaner is None:
+            return {'running': False, 'counts': self._cleaning_counts,
+                    'total': self._cleaning_total}
+        return {'running': self._cleaner.running,
+                'counts': self._cleaning_counts,
+                'total': self._cleaning_total}
+
+    def _background_clean(self, vacuum=False):
+        self._clean_expired()
+        if vacuum:
+            self.vacuum()
+
+    def _clean_expired(self):
+        counts = dict((name, 0) for name in CLEANING_COUNTS)
+        self._cleaning_counts = counts
+        start = time.time()
+        while True:
+            batch_counts, files = self._clean_batch(self.clean_batch_size)
+            self._remove_files(files)
+            batch_counts['files'] = len(files)
+            deleted = 0
+            for name, count in six.iteritems(batch_counts):
+                counts[name] += count
+                self._cleaning_total[name] += count
+                deleted += count
+            if deleted == 0:
+                break
+            counts['batches'] += 1
+            self._cleaning_total['batches'] += 1
+            self.logger.debug("clean: batch %d, %s" % (counts['batches'],
+                                                       repr(batch_counts)))
+        if counts['batches'] != 0:
+            self.logger.info("clean: %s in %.2f s"
+                             % (repr(counts), time.time() - start))
+        return counts
+
+    def _clean_batch(self, batch_size):
         '''
-        self.logger.debug("=> clean")
+        Delete at most batch_size expired jobs, transfers, temporary paths,
+        workflows and archived workflows in a single transaction.
+
+        Returns
+        -------
+        (counts, files): tuple
+            counts: dict
+                numbers of deleted jobs, transfers, temporary_paths,
+                workflows and archived_workflows
+            files: list
+                files and directories of the deleted items, to be removed
+        '''
+        today = date.today()
+        files = []
         with self._lock:
             connection = self._connect()
             cursor = connection.cursor()
-
             try:
-                #
-                # Jobs and associated files (std out, std err and ressouce
-                # usage file)
-                jobsToDelete = []
-                for row in cursor.execute(
-                        'SELECT id FROM jobs WHERE expiration_date < ?',
-                        [date.today()]):
-                    jobsToDelete.append(row[0])
-
-                maxv = sqlite3_max_variable_number()
-                nmax = maxv
-                if maxv == 0:
-                    nmax = len(jobsToDelete)
-                nchunks = int(math.ceil(float(len(jobsToDelete)) / nmax))
-
-                for chunk in range(nchunks):
-                    if chunk < nchunks - 1:
-                        n = nmax
-                    else:
-                        n = len(jobsToDelete) - chunk * nmax
-                    job_str = ','.join(['?'] * n)
+                # jobs and their std out and err files, when they were
+                # generated by the server
+                job_ids = []
+                for job_id, custom_submission, stdout_file, stderr_file \
+                        in list(cursor.execute(
+                            'SELECT id, custom_submission, stdout_file, '
+                            'stderr_file FROM jobs WHERE expiration_date<? '
+                            'LIMIT ?', [today, batch_size])):
+                    job_ids.append(job_id)
+                    if not custom_submission:
+                        files.append(self._string_conversion(stdout_file))
+                        files.append(self._string_conversion(stderr_file))
+                for chunk in chunks(job_ids):
+                    in_chunk = ','.join(['?'] * len(chunk))
                     cursor.execute('DELETE FROM ios WHERE job_id IN (%s)'
-                                   % job_str, jobsToDelete[chunk * nmax:chunk * nmax + n])
+                                   % in_chunk, chunk)
+                    cursor.execute('DELETE FROM ios_tmp WHERE job_id IN (%s)'
+                                   % in_chunk, chunk)
+                    cursor.execute('DELETE FROM jobs WHERE id IN (%s)'
+                                   % in_chunk, chunk)
+
+                # transfers which are not used by a job any longer
+                transfers = [self._string_conversion(row[0]) for row in list(
                     cursor.execute(
-                        'DELETE FROM ios_tmp WHERE job_id IN (%s)' % job_str,
-                        jobsToDelete[chunk * nmax:chunk * nmax + n])
-
-                    for stdof, stdef in cursor.execute(
-                            '''SELECT
-                            stdout_file,
-                            stderr_file
-                            FROM jobs
-                            WHERE id IN (%s) AND custom_submission''' % job_str,
-                            jobsToDelete[chunk * nmax:chunk * nmax + n]):
-                        self.__removeFile(self._string_conversion(stdof))
-                        self.__removeFile(self._string_conversion(stdef))
-
-                cursor.execute(
-                    'DELETE FROM jobs WHERE expiration_date < ?',
-                    [date.today()])
-
-                #
-                # Transfers
-
-                # get back the expired transfers
-                transfersToDelete = set()
-                for row in cursor.execute(
-                        'SELECT engine_file_path FROM transfers WHERE expiration_date < ?',
-                        [date.today()]):
-                    transfersToDelete.add(row[0])
-
-                # check that they are not currently used (as an input of output
-                # of a job)
-                if len(transfersToDelete) != 0:
-                    transfers_list = list(transfersToDelete)
-                    nmax = maxv
-                    if nmax == 0:
-                        nmax = len(transfersToDelete)
-                    nchunks = int(math.ceil(float(len(transfersToDelete))
-                                            / nmax))
-                    for chunk in range(nchunks):
-                        if chunk < nchunks - 1:
-                            n = nmax
-                        else:
-                            n = len(transfersToDelete) - chunk * nmax
-                        for engine_file_path in cursor.execute(
-                                'SELECT DISTINCT engine_file_path FROM ios '
-                                'WHERE engine_file_path IN (%s)'
-                                % ','.join(['?'] * n),
-                                transfers_list[chunk * nmax:chunk * nmax + n]):
-                            transfersToDelete.remove(engine_file_path)
-
-                # delete transfers data and associated engine file
-                if len(transfersToDelete) != 0:
-                    transfers_list = list(transfersToDelete)
-                    nmax = maxv
-                    if nmax == 0:
-                        nmax = len(transfersToDelete)
-                    nchunks = int(math.ceil(float(len(transfersToDelete))
-                                            / nmax))
-                    for chunk in range(nchunks):
-                        if chunk < nchunks - 1:
-                            n = nmax
-                        else:
-                            n = len(transfersToDelete) - chunk * nmax
-                        cursor.execute(
-                            'DELETE FROM transfers '
-                            'WHERE engine_file_path IN (%s)'
-                            % ','.join(['?'] * n),
-                            transfers_list[chunk * nmax:chunk * nmax + n])
-                    for engine_file_path in transfersToDelete:
-                        self.__removeFile(engine_file_path)
-
-                #
-                # temporary_paths
+                        'SELECT engine_file_path FROM transfers '
+                        'WHERE expiration_date<? AND NOT EXISTS '
+                        '(SELECT 1 FROM ios WHERE ios.engine_file_path'
+                        '=transfers.engine_file_path) LIMIT ?',
+                        [today, batch_size]))]
+                for chunk in chunks(transfers):
+                    cursor.execute(
+                        'DELETE FROM transfers WHERE engine_file_path IN (%s)'
+                        % ','.join(['?'] * len(chunk)), chunk)
+                files += transfers
 
-                # get back the expired temp_path_id
-                tmpToDelete = {}
-                for row in cursor.execute(
+                # temporary paths which are not used by a job any longer
+                temp_path_ids = []
+                for temp_path_id, engine_file_path in list(cursor.execute(
                         'SELECT temp_path_id, engine_file_path '
-                        'FROM temporary_paths WHERE expiration_date < ?',
-                        [date.today()]):
-                    tmpToDelete[row[0]] = row[1]
-
-                # check that they are not currently used (as an input of output
-                # of a job)
-                if len(tmpToDelete) != 0:
-                    nmax = maxv
-                    if nmax == 0:
-                        nmax = len(tmpToDelete)
-                    nchunks = int(math.ceil(float(len(tmpToDelete)) / nmax))
-                    tkeys = keys(tmpToDelete)
-                    for chunk in range(nchunks):
-                        if chunk < nchunks - 1:
-                            n = nmax
-                        else:
-                            n = len(tmpToDelete) - chunk * nmax
-                        for temp_path_id in cursor.execute(
-                                'SELECT DISTINCT temp_path_id FROM ios_tmp '
-                                'WHERE temp_path_id IN (%s)'
-                                % ','.join(['?'] * n),
-                                tkeys[chunk * nmax:chunk * nmax + n]):
-                            tmpToDelete.remove(temp_path_id)
-
-                # delete temporary_paths data and associated engine file
-                if len(tmpToDelete) != 0:
-                    nmax = maxv
-                    if nmax == 0:
-                        nmax = len(tmpToDelete)
-                    nchunks = int(math.ceil(float(len(tmpToDelete)) / nmax))
-                    tkeys = keys(tmpToDelete)
-                    for chunk in range(nchunks):
-                        if chunk < nchunks - 1:
-                            n = nmax
-                        else:
-                            n = len(tmpToDelete) - chunk * nmax
-                        cursor.execute(
-                            'DELETE FROM temporary_paths '
-                            'WHERE temp_path_id IN (%s)'
-                            % ','.join(['?'] * n),
-                            tkeys[chunk * nmax:chunk * nmax + n])
-                    for engine_file_path in six.itervalues(tmpToDelete):
-                        self.__removeFile(engine_file_path)
-
-                #
-                # Workflows
-
-                cursor.execute(
-                    'DELETE FROM workflows WHERE expiration_date < ?',
-                    [date.today()])
-
+                        'FROM temporary_paths '
+                        'WHERE expiration_date<? AND NOT EXISTS '
+                        '(SELECT 1 FROM ios_tmp WHERE ios_tmp.temp_path_id'
+                        '=temporary_paths.temp_path_id) LIMIT ?',
+                        [today, batch_size])):
+                    temp_path_ids.append(temp_path_id)
+                    files.append(self._string_conversion(engine_file_path))
+                for chunk in chunks(temp_path_ids):
+                    cursor.execute(
+                        'DELETE FROM temporary_paths '
+                        'WHERE temp_path_id IN (%s)'
+                        % ','.join(['?'] * len(chunk)), chunk)
+
+                # workflows and their pending ended transfers events
+                workflow_ids = [row[0] for row in list(cursor.execute(
+                    'SELECT id FROM workflows WHERE expiration_date<? '
+                    'LIMIT ?', [today, batch_size]))]
+                for chunk in chunks(workflow_ids):
+                    in_chunk = ','.join(['?'] * len(chunk))
+                    cursor.execute('DELETE FROM ended_transfers '
+                                   'WHERE workflow_id IN (%s)' % in_chunk,
+                                   chunk)
+                    cursor.execute('DELETE FROM workflows WHERE id IN (%s)'
+                                   % in_chunk, chunk)
+
+                # archived workflows and the files of their elements
+                archived_ids = []
+                for wf_id, data in list(cursor.execute(
+                        'SELECT id, data FROM archived_workflows '
+                        'WHERE expiration_date<? LIMIT ?',
+                        [today, batch_size])):
+                    archived_ids.append(wf_id)
+                    files += read_archive_data(data)['files']
+                for chunk in chunks(archived_ids):
+                    cursor.execute(
+                        'DELETE FROM archived_workflows WHERE id IN (%s)'
+                        % ','.join(['?'] * len(chunk)), chunk)
             except Exception as e:
                 connection.rollback()
                 cursor.close()
                 connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
-            cursor.close()
+                six.reraise(DatabaseError, DatabaseError(e),
+                            sys.exc_info()[2])
             connection.commit()
+            cursor.close()
             connection.close()
-
-            # self.remove_non_registered_files()
+            if self._cache is not None:
+                for job_id in job_ids:
+                    self._cache.jobs.pop(job_id, None)
+                for wf_id in workflow_ids:
+                    self._cache.evict_workflow(wf_id)
+                if job_ids:
+                    self._cache.counts = None
+
+        counts = {'jobs': len(job_ids),
+                  'transfers': len(transfers),
+                  'temporary_paths': len(temp_path_ids),
+                  'workflows': len(workflow_ids),
+                  'archived_workflows': len(archived_ids)}
+        return counts, [path for path in files if path]
+
+    def _remove_files(self, paths):
+        '''
+        Remove files or directories, using file_removal_threads threads.
+        '''
+        if self.file_removal_threads > 1 and len(paths) > 1:
+            pool = ThreadPool(min(self.file_removal_threads, len(paths)))
+            try:
+                pool.map(self.__removeFile, paths)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for path in paths:
+                self.__removeFile(path)
 
     def vacuum(self):
         '''
         Resize the database file, so that it shrinks to the necessary size, not more.
+
+        The database is switched to the incremental auto vacuum mode at the
+        same time, so that the later vacuums may be incremental (see
+        incremental_vacuum()).
         '''
         self.logger.debug('=> vacuum')
         with self._lock:
             connection = self._connect()
             cursor = connection.cursor()
             try:
+                cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
                 cursor.execute('VACUUM')
             except Exception as e:
                 cursor.close()
@@ -774,55 +2236,341 @@ class WorkflowDatabaseServer(object):
             cursor.close()
             connection.close()
 
-    def remove_non_registered_files(self):
-        self.logger.debug("=> remove_non_registered_files")
-        registered_engine_paths = []
-        registered_users = []
+    def incremental_vacuum(self, pages=None):
+        '''
+        Release at most pages free pages of the database file (all of them
+        if pages is None). Unlike vacuum(), the database is not rebuilt,
+        so that the cost is proportional to the number of released pages.
+
+        It does nothing on databases created before the incremental auto
+        vacuum mode, until they are vacuumed by vacuum().
+
+        Returns
+        -------
+        released: int
+            number of released pages
+        '''
+        self.logger.debug('=> incremental_vacuum')
         with self._lock:
             connection = self._connect()
             cursor = connection.cursor()
             try:
-                for row in cursor.execute('SELECT engine_file_path FROM transfers'):
-                    engine_path = row[0]
-                    registered_engine_paths.append(
-                        self._string_conversion(engine_path))
-                for row in cursor.execute('SELECT stdout_file FROM jobs'):
-                    stdout_file = row[0]
-                    if stdout_file:
-                        registered_engine_paths.append(
-                            self._string_conversion(stdout_file))
-                for row in cursor.execute('SELECT stderr_file FROM jobs'):
-                    stderr_file = row[0]
-                    if stderr_file:
-                        registered_engine_paths.append(
-                            self._string_conversion(stderr_file))
-                for row in cursor.execute('SELECT id, login FROM users'):
-                    user_id, login = row
-                    registered_users.append((user_id, login))
+                released = 0
+                auto_vacuum = six.next(cursor.execute(
+                    'PRAGMA auto_vacuum'))[0]
+                if auto_vacuum == 2:  # incremental
+                    free_pages = six.next(cursor.execute(
+                        'PRAGMA freelist_count'))[0]
+                    # the pragma releases a page at each step: it is run
+                    # as a script, which steps it to the end
+                    if pages is None:
+                        cursor.executescript('PRAGMA incremental_vacuum')
+                    else:
+                        cursor.executescript('PRAGMA incremental_vacuum(%d)'
+                                             % pages)
+                    released = free_pages - six.next(cursor.execute(
+                        'PRAGMA freelist_count'))[0]
+                connection.commit()
             except Exception as e:
                 cursor.close()
                 connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+                six.reraise(DatabaseError, DatabaseError(e),
+                            sys.exc_info()[2])
+            cursor.close()
+            connection.close()
+        return released
+
+    def maintenance(self):
+        '''
+        Periodic maintenance of the database, run every maintenance_interval
+        seconds when it is set: archival of the workflows done for longer
+        than archive_delay (if it is set), then incremental vacuum of at
+        most vacuum_pages pages.
+
+        Returns
+        -------
+        counts: dict
+            numbers of archived_workflows and of released pages
+        '''
+        archived = 0
+        if self.archive_delay is not None:
+            archived = self.archive_workflows(self.archive_delay)
+        released = self.incremental_vacuum(self.vacuum_pages)
+        if archived or released:
+            self.logger.info('maintenance: %d workflows archived, %d pages '
+                             'released' % (archived, released))
+        return {'archived_workflows': archived, 'pages': released}
+
+    def archive_workflows(self, delay=timedelta(0)):
+        '''
+        Move the workflows done for longer than delay out of the live
+        tables (workflows, jobs, transfers...), into the archived_workflows
+        table, where each workflow takes a single row holding its
+        compressed elements. This keeps the live tables small, and the
+        queries on them fast, on resources which run many workflows.
+
+        The archived workflows are still listed by get_workflows() and
+        their elements are returned by get_archived_workflow(), but they
+        cannot be restarted any longer. They are deleted, with their files,
+        at their expiration date by clean(). The workflows are archived by
+        batches of clean_batch_size workflows, each batch in its own
+        transaction.
+
+        The transfers and temporary paths which are also used by jobs of
+        other workflows stay in the live tables.
+
+        Parameters
+        ----------
+        delay: timedelta
+            only the workflows which status did not change since delay are
+            archived
+
+        Returns
+        -------
+        archived: int
+            number of archived workflows
+        '''
+        self.logger.debug("=> archive_workflows")
+        before = datetime.now() - delay
+        archived = 0
+        while True:
+            count = self._archive_batch(before, self.clean_batch_size)
+            if count == 0:
+                break
+            archived += count
+        return archived
+
+    def _archive_batch(self, before, batch_size):
+        '''
+        Archive at most batch_size workflows done before the date before,
+        in a single transaction.
+
+        Returns
+        -------
+        archived: int
+            number of archived workflows
+        '''
+        now = datetime.now()
+        with self._lock:
+            connection = self._connect()
+            cursor = connection.cursor()
+            try:
+                workflows = select_rows(
+                    cursor,
+                    'SELECT * FROM workflows '
+                    'WHERE status=? AND last_status_update<? LIMIT ?',
+                    [constants.WORKFLOW_DONE, before, batch_size])
+                job_ids = []
+                for workflow in workflows:
+                    wf_id = workflow['id']
+                    data = {'workflow': workflow, 'ios': [], 'ios_tmp': []}
+                    jobs = select_rows(
+                        cursor, 'SELECT * FROM jobs WHERE workflow_id=?',
+                        [wf_id])
+                    data['jobs'] = jobs
+                    wf_job_ids = [job['id'] for job in jobs]
+                    for chunk in chunks(wf_job_ids):
+                        in_chunk = ','.join(['?'] * len(chunk))
+                        for table in ('ios', 'ios_tmp'):
+                            data[table] += select_rows(
+                                cursor,
+                                'SELECT * FROM %s WHERE job_id IN (%s)'
+                                % (table, in_chunk), chunk)
+                            cursor.execute(
+                                'DELETE FROM %s WHERE job_id IN (%s)'
+                                % (table, in_chunk), chunk)
+                        cursor.execute('DELETE FROM jobs WHERE id IN (%s)'
+                                       % in_chunk, chunk)
+                    job_ids += wf_job_ids
+                    files = []
+                    for job in jobs:
+                        if not job['custom_submission']:
+                            files += [job['stdout_file'], job['stderr_file']]
+
+                    # transfers and temporary paths which are not used by
+                    # the jobs of other workflows
+                    data['transfers'] = select_rows(
+                        cursor,
+                        'SELECT * FROM transfers WHERE workflow_id=? '
+                        'AND NOT EXISTS (SELECT 1 FROM ios '
+                        'WHERE ios.engine_file_path'
+                        '=transfers.engine_file_path)', [wf_id])
+                    transfers = [transfer['engine_file_path']
+                                 for transfer in data['transfers']]
+                    for chunk in chunks(transfers):
+                        cursor.execute(
+                            'DELETE FROM transfers '
+                            'WHERE engine_file_path IN (%s)'
+                            % ','.join(['?'] * len(chunk)), chunk)
+                    files += transfers
+                    data['temporary_paths'] = select_rows(
+                        cursor,
+                        'SELECT * FROM temporary_paths WHERE workflow_id=? '
+                        'AND NOT EXISTS (SELECT 1 FROM ios_tmp '
+                        'WHERE ios_tmp.temp_path_id'
+                        '=temporary_paths.temp_path_id)', [wf_id])
+                    temp_path_ids = []
+                    for temp in data['temporary_paths']:
+                        temp_path_ids.append(temp['temp_path_id'])
+                        files.append(temp['engine_file_path'])
+                    for chunk in chunks(temp_path_ids):
+                        cursor.execute(
+                            'DELETE FROM temporary_paths '
+                            'WHERE temp_path_id IN (%s)'
+                            % ','.join(['?'] * len(chunk)), chunk)
+                    data['files'] = [path for path in files if path]
+
+                    cursor.execute('DELETE FROM ended_transfers '
+                                   'WHERE workflow_id=?', [wf_id])
+                    cursor.execute('DELETE FROM workflows WHERE id=?',
+                                   [wf_id])
+                    cursor.execute(
+                        'INSERT INTO archived_workflows (id, user_id, name, '
+                        'expiration_date, status, last_status_update, '
+                        'archive_date, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (wf_id, workflow['user_id'], workflow['name'],
+                         workflow['expiration_date'], workflow['status'],
+                         workflow['last_status_update'], now,
+                         archive_data(data)))
+            except Exception as e:
+                connection.rollback()
+                cursor.close()
+                connection.close()
+                six.reraise(DatabaseError, DatabaseError(e),
+                            sys.exc_info()[2])
+            connection.commit()
+            cursor.close()
+            connection.close()
+            if self._cache is not None:
+                for job_id in job_ids:
+                    self._cache.jobs.pop(job_id, None)
+                for workflow in workflows:
+                    self._cache.evict_workflow(workflow['id'])
+                if job_ids:
+                    self._cache.counts = None
+        return len(workflows)
+
+    def get_archived_workflow(self, wf_id, user_id):
+        '''
+        Returns the rows of an archived workflow (see archive_workflows()).
+
+        Returns
+        -------
+        data: dict
+            the rows of the workflow and of its elements as dictionaries
+            column -> value: workflow (dict), jobs, transfers,
+            temporary_paths, ios and ios_tmp (lists), and files, the list
+            of the files of the elements.
+        '''
+        self.logger.debug("=> get_archived_workflow")
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            data = None
+            for row in cursor.execute(
+                    'SELECT data FROM archived_workflows '
+                    'WHERE id=? AND user_id=?', [wf_id, user_id]):
+                data = read_archive_data(row[0])
+        except Exception as e:
             cursor.close()
             connection.close()
+            six.reraise(DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
+        if data is None:
+            raise UnknownObjectError("The workflow id " + repr(wf_id)
+                                     + " is not archived or does not belong "
+                                     "to user " + repr(user_id))
+        return data
+
+    def remove_non_registered_files(self):
+        '''
+        Remove the files of the users transfer directories which are not
+        registered in the database as transfers, temporary paths or job
+        std out and err files. Files modified after the start of the sweep
+        are kept, since they may belong to items being registered.
 
-        for user_info in registered_users:
-            user_id, login = user_info
+        With background sweeping, this is done in the sweeper thread and
+        the function returns immediately.
+
+        Returns
+        -------
+        removed: int or None
+            number of removed files (None with background sweeping)
+        '''
+        self.logger.debug("=> remove_non_registered_files")
+        if self._sweeper is not None:
+            self._sweeper.request()
+            return None
+        return self._sweep_non_registered_files()
+
+    def _sweep_non_registered_files(self):
+        start = time.time()
+        registered_engine_paths = set()
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            for query in ('SELECT engine_file_path FROM transfers',
+                          'SELECT engine_file_path FROM temporary_paths',
+                          'SELECT stdout_file FROM jobs',
+                          'SELECT stderr_file FROM jobs'):
+                for row in cursor.execute(query):
+                    if row[0]:
+                        registered_engine_paths.add(
+                            self._string_conversion(row[0]))
+            for row in cursor.execute('SELECT data FROM archived_workflows'):
+                registered_engine_paths.update(
+                    read_archive_data(row[0])['files'])
+            registered_users = list(
+                cursor.execute('SELECT id, login FROM users'))
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            six.reraise(DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
+
+        scanned = 0
+        removed = 0
+        to_remove = []
+        for user_id, login in registered_users:
             directory_path = self._user_transfer_dir_path(login, user_id)
-            for name in os.listdir(directory_path):
-                engine_path = os.path.join(directory_path, name)
-                if not engine_path in registered_engine_paths:
-                    self.logger.debug(
-                        "remove_non_registered_files, not registered " + engine_path + " to delete!")
-                    self.__removeFile(engine_path)
+            try:
+                engine_paths = scan_directory(directory_path)
+                for engine_path in engine_paths:
+                    scanned += 1
+                    if engine_path not in registered_engine_paths:
+                        try:
+                            if os.lstat(engine_path).st_mtime < start:
+                                to_remove.append(engine_path)
+                        except OSError:
+                            pass  # removed meanwhile
+                    if scanned % self.sweep_batch_size == 0:
+                        self._remove_files(to_remove)
+                        removed += len(to_remove)
+                        to_remove = []
+                        if self.sweep_pause > 0:
+                            time.sleep(self.sweep_pause)
+            except OSError as e:
+                self.logger.warning(
+                    "remove_non_registered_files, cannot scan %s: %s"
+                    % (directory_path, e))
+        self._remove_files(to_remove)
+        removed += len(to_remove)
+        self.logger.info("remove_non_registered_files: %d files removed "
+                         "out of %d in %.2f s"
+                         % (removed, scanned, time.time() - start))
+        return removed
 
     def reserve_file_numbers(self, external_cursor=None, num_files=200):
         '''
         Reserve a range of numbers in the fileCounter table, which may be used
         as suffix in files managed by Soma-Workflow on server side and stored n
-        the database. Allocated numbers are stored internally in the
-        self._free_file_counters list, and are guaranteed not to be reused by
-        other database clients.
+        the database. Allocated numbers are kept internally as the range
+        [self._next_file_number, self._file_number_limit[, and are guaranteed
+        not to be reused by other database clients. If the reserved numbers
+        follow the current range, the range is extended, otherwise the
+        remaining numbers of the current range are dropped.
 
         Numbers are preallocated by blocks for efficiency matters: allocating
         them individually when needed, during databasing operations (open
@@ -851,8 +2599,9 @@ class WorkflowDatabaseServer(object):
                     # *very* costy... (about 0.1 second per call)
                     cursor.execute(
                         'UPDATE fileCounter SET count=count+%d' % num_files)
-                self._free_file_counters = list(range(count,
-                                                      count + num_files))
+                if count != self._file_number_limit:
+                    self._next_file_number = count
+                self._file_number_limit = count + num_files
                 return count
             except Exception as e:
                 if not external_cursor:
@@ -864,16 +2613,22 @@ class WorkflowDatabaseServer(object):
                     connection.commit()
                     connection.close()
 
+    def available_file_numbers(self):
+        '''
+        Number of reserved file numbers not used yet.
+        '''
+        return self._file_number_limit - self._next_file_number
+
     def ensure_file_numbers_available(self, num_files, num_realloc=0,
                                       external_cursor=None):
         '''
-        Make sure the internal preallocated file numbers stack contains enough
+        Make sure the internal preallocated file numbers range contains enough
         elements. If not, more are allocated using reserve_file_numbers().
 
         Parameters
         ----------
         num_files: int
-            number needed in the stack. If the stack is smaller, reallocation
+            number needed in the range. If the range is smaller, reallocation
             is performed
         num_realloc: int (default: 0)
             when reallocation is performed, this number is used. If smaller
@@ -883,24 +2638,43 @@ class WorkflowDatabaseServer(object):
             when reallocation is needed, the database cursor may be used.
         '''
         with self._lock:
-            if len(self._free_file_counters) >= num_files:
+            if self.available_file_numbers() >= num_files:
                 return
-            num_alloc = num_files - len(self._free_file_counters)
-            if num_realloc > num_alloc:
-                num_alloc = num_realloc
-            self.reserve_file_numbers(external_cursor, num_alloc)
+            self.reserve_file_numbers(external_cursor,
+                                      max(num_files, num_realloc))
+
+    def _file_number_block_size(self):
+        '''
+        Size of the next block of file numbers: it doubles when blocks are
+        used up quickly (during a large submission), and gets back to
+        file_number_block_size otherwise.
+        '''
+        now = time.time()
+        if self._last_file_number_block_time is not None \
+                and now - self._last_file_number_block_time \
+                < FILE_NUMBER_GROWTH_INTERVAL:
+            self._file_number_block = min(self._file_number_block * 2,
+                                          self.max_file_number_block_size)
+        else:
+            self._file_number_block = self.file_number_block_size
+        self._last_file_number_block_time = now
+        return self._file_number_block
 
     def get_new_file_number(self, external_cursor=None):
         '''
-        Get a file counter number in the internal preallocated list, and
-        generate new ones if needed.
+        Get a file counter number in the internal preallocated range, and
+        reserve new ones if needed.
 
         Used to allocate file names on server side for file transfers and
         stdout / stderr streams for jobs (see generate_file_path()).
         '''
         with self._lock:
-            self.ensure_file_numbers_available(1, 200, external_cursor)
-            return self._free_file_counters.pop(0)
+            if self._next_file_number >= self._file_number_limit:
+                self.reserve_file_numbers(external_cursor,
+                                          self._file_number_block_size())
+            number = self._next_file_number
+            self._next_file_number += 1
+            return number
 
     def generate_file_path(self,
                            user_id,
@@ -1019,38 +2793,13 @@ class WorkflowDatabaseServer(object):
             else:
                 cursor = external_cursor
 
-            if engine_transfer.client_paths:
-                engine_transfer.engine_path = self.generate_file_path(user_id,
-                                                                      external_cursor=cursor)
-            else:
-                engine_transfer.engine_path = self.generate_file_path(user_id,
-                                                                      engine_transfer.client_path,
-                                                                      external_cursor=cursor)
-            client_path_std = None
-            if engine_transfer.client_paths:
-                client_path_std = file_separator.join(
-                    engine_transfer.client_paths)
+            values = self._transfer_values(engine_transfer, user_id,
+                                           expiration_date, cursor)
 
             try:
-                cursor.execute('''INSERT INTO transfers
-                        (engine_file_path,
-                         client_file_path,
-                         transfer_date,
-                         expiration_date,
-                         user_id,
-                         workflow_id,
-                         status,
-                         client_paths)
-                        VALUES (?, ?, ?, ?,
-                                ?, ?, ?, ?)''',
-                              (engine_transfer.engine_path,
-                               engine_transfer.client_path,
-                               date.today(),
-                               expiration_date,
-                               user_id,
-                               engine_transfer.workflow_id,
-                               engine_transfer.status,
-                               client_path_std))
+                cursor.execute(insert_query('transfers',
+                                            TRANSFER_INSERT_COLUMNS),
+                               values)
             except Exception as e:
                 if not external_cursor:
                     connection.rollback()
@@ -1064,6 +2813,32 @@ class WorkflowDatabaseServer(object):
 
         return engine_transfer
 
+    def _transfer_values(self, engine_transfer, user_id, expiration_date,
+                         cursor, login=None):
+        '''
+        Allocates the engine path of a transfer, and returns the values of
+        its row in the transfers table (see TRANSFER_INSERT_COLUMNS).
+        '''
+        if engine_transfer.client_paths:
+            engine_transfer.engine_path = self.generate_file_path(
+                user_id, external_cursor=cursor, login=login)
+        else:
+            engine_transfer.engine_path = self.generate_file_path(
+                user_id, engine_transfer.client_path,
+                external_cursor=cursor, login=login)
+        client_path_std = None
+        if engine_transfer.client_paths:
+            client_path_std = file_separator.join(
+                engine_transfer.client_paths)
+        return (engine_transfer.engine_path,
+                engine_transfer.client_path,
+                date.today(),
+                expiration_date,
+                user_id,
+                engine_transfer.workflow_id,
+                engine_transfer.status,
+                client_path_std)
+
     def add_temporary_path(self,
                            engine_temp,
                            user_id,
@@ -1090,23 +2865,12 @@ class WorkflowDatabaseServer(object):
             else:
                 cursor = external_cursor
 
-            engine_path = engine_temp.get_engine_path()
-            if engine_path is None:
-                engine_path = ''
-
             try:
-                cursor.execute('''INSERT INTO temporary_paths
-                        (engine_file_path,
-                         expiration_date,
-                         user_id,
-                         workflow_id,
-                         status)
-                        VALUES (?, ?, ?, ?, ?)''',
-                              (engine_path,
-                               expiration_date,
-                               user_id,
-                               engine_temp.workflow_id,
-                               engine_temp.status))
+                cursor.execute(
+                    insert_query('temporary_paths',
+                                 TEMPORARY_PATH_INSERT_COLUMNS),
+                    self._temporary_path_values(engine_temp, user_id,
+                                                expiration_date))
                 engine_temp.temp_path_id = cursor.lastrowid
             except Exception as e:
                 if not external_cursor:
@@ -1121,6 +2885,20 @@ class WorkflowDatabaseServer(object):
 
         return engine_temp
 
+    def _temporary_path_values(self, engine_temp, user_id, expiration_date):
+        '''
+        Returns the values of the row of a temporary path in the
+        temporary_paths table (see TEMPORARY_PATH_INSERT_COLUMNS).
+        '''
+        engine_path = engine_temp.get_engine_path()
+        if engine_path is None:
+            engine_path = ''
+        return (engine_path,
+                expiration_date,
+                user_id,
+                engine_temp.workflow_id,
+                engine_temp.status)
+
     def _check_transfer(self, connection, cursor, engine_file_path, user_id):
         try:
             sel = cursor.execute(
@@ -1187,7 +2965,7 @@ class WorkflowDatabaseServer(object):
             connection.commit()
             cursor.close()
             connection.close()
-            self.clean()
+        self.clean()
 
     def remove_temporary(self, temp_path_id, user_id):
         '''
@@ -1215,7 +2993,7 @@ class WorkflowDatabaseServer(object):
             connection.commit()
             cursor.close()
             connection.close()
-            self.clean()
+        self.clean()
 
     def get_transfer_information(self,
                                  engine_file_path,
@@ -1230,47 +3008,46 @@ class WorkflowDatabaseServer(object):
         @returns: (engine_file_path, client_file_path, expiration_date, workflow_id, client_paths, transfer_type, status)
         '''
         self.logger.debug("=> get_transfer_information")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            self._check_transfer(connection, cursor, engine_file_path, user_id)
-            try:
-                (engine_file_path,
-                 client_file_path,
-                 expiration_date,
-                 workflow_id,
-                 client_paths,
-                 transfer_type,
-                 status) = six.next(cursor.execute(
-                    '''SELECT
-                    engine_file_path,
-                    client_file_path,
-                    expiration_date,
-                    workflow_id,
-                    client_paths,
-                    transfer_type,
-                    status
-                    FROM transfers
-                    WHERE engine_file_path=?''',
-                    [engine_file_path]))
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
-            engine_file_path = self._string_conversion(engine_file_path)
-            client_file_path = self._string_conversion(client_file_path)
-            expiration_date = self._str_to_date_conversion(expiration_date)
-            if client_paths:
-                client_paths = self._string_conversion(
-                    client_paths).split(file_separator)
-            else:
-                client_path = None
-            transfer_type = self._string_conversion(transfer_type)
-            status = self._string_conversion(status)
-
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        self._check_transfer(connection, cursor, engine_file_path, user_id)
+        try:
+            (engine_file_path,
+             client_file_path,
+             expiration_date,
+             workflow_id,
+             client_paths,
+             transfer_type,
+             status) = six.next(cursor.execute(
+                '''SELECT
+                engine_file_path,
+                client_file_path,
+                expiration_date,
+                workflow_id,
+                client_paths,
+                transfer_type,
+                status
+                FROM transfers
+                WHERE engine_file_path=?''',
+                [engine_file_path]))
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+
+        engine_file_path = self._string_conversion(engine_file_path)
+        client_file_path = self._string_conversion(client_file_path)
+        expiration_date = self._str_to_date_conversion(expiration_date)
+        if client_paths:
+            client_paths = self._string_conversion(
+                client_paths).split(file_separator)
+        else:
+            client_path = None
+        transfer_type = self._string_conversion(transfer_type)
+        status = self._string_conversion(status)
+
+        cursor.close()
+        connection.close()
         return (engine_file_path,
                 client_file_path,
                 expiration_date,
@@ -1292,38 +3069,37 @@ class WorkflowDatabaseServer(object):
         @returns: (temp_path_id, engine_file_path, expiration_date, workflow_id, status)
         '''
         self.logger.debug("=> get_temporary_information")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            self._check_transfer(connection, cursor, engine_file_path, user_id)
-            try:
-                (engine_file_path,
-                 client_file_path,
-                 expiration_date,
-                 workflow_id,
-                 client_paths,
-                 transfer_type,
-                 status) = six.next(cursor.execute(
-                    '''SELECT
-                    temp_path_id,
-                    engine_file_path,
-                    expiration_date,
-                    workflow_id,
-                    status
-                    FROM temporary_paths
-                    WHERE temp_path_id=?''',
-                    [temp_path_id]))
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
-            engine_file_path = self._string_conversion(engine_file_path)
-            expiration_date = self._str_to_date_conversion(expiration_date)
-            status = self._string_conversion(status)
-
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        self._check_transfer(connection, cursor, engine_file_path, user_id)
+        try:
+            (engine_file_path,
+             client_file_path,
+             expiration_date,
+             workflow_id,
+             client_paths,
+             transfer_type,
+             status) = six.next(cursor.execute(
+                '''SELECT
+                temp_path_id,
+                engine_file_path,
+                expiration_date,
+                workflow_id,
+                status
+                FROM temporary_paths
+                WHERE temp_path_id=?''',
+                [temp_path_id]))
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+
+        engine_file_path = self._string_conversion(engine_file_path)
+        expiration_date = self._str_to_date_conversion(expiration_date)
+        status = self._string_conversion(status)
+
+        cursor.close()
+        connection.close()
         return (temp_path_id,
                 engine_file_path,
                 expiration_date,
@@ -1339,47 +3115,191 @@ class WorkflowDatabaseServer(object):
             return self.get_temporary_status(engine_file_path, user_id)
 
         self.logger.debug("=> get_transfer_status")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            self._check_transfer(connection, cursor, engine_file_path, user_id)
-            try:
-                status = six.next(cursor.execute(
-                    'SELECT status FROM transfers WHERE engine_file_path=?',
-                    [engine_file_path]))[0]
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-            status = self._string_conversion(status)
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        self._check_transfer(connection, cursor, engine_file_path, user_id)
+        try:
+            status = six.next(cursor.execute(
+                'SELECT status FROM transfers WHERE engine_file_path=?',
+                [engine_file_path]))[0]
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        status = self._string_conversion(status)
+        cursor.close()
+        connection.close()
+
+        return status
+
+    def get_temporary_status(self, temp_path_id, user_id):
+        '''
+        Returns the temporary path status stored in the database.
+        '''
+        self.logger.debug("=> get_temporary_status")
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        self._check_temporary(connection, cursor, temp_path_id, user_id)
+        try:
+            status = six.next(cursor.execute(
+                'SELECT status FROM temporary_paths WHERE temp_path_id=?',
+                [temp_path_id]))[0]
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        status = self._string_conversion(status)
+        cursor.close()
+        connection.close()
+
+        return status
+
+    def get_transfers_status(self, engine_paths, user_id=None):
+        '''
+        Returns the status of several transfers and temporary paths at once.
+
+        Parameters
+        ----------
+        engine_paths: sequence
+            transfers engine file paths (str) and temporary paths ids (int)
+        user_id: UserIdentifier (optional)
+            if given, only the transfers belonging to this user are returned
+
+        Returns
+        -------
+        status: dict
+            engine path or temporary path id -> status, as defined in
+            constants.FILE_TRANSFER_STATUS. Unknown ids are not in the dict.
+        '''
+        self.logger.debug("=> get_transfers_status")
+        transfer_ids = []
+        temp_ids = []
+        for engine_path in engine_paths:
+            if type(engine_path) is int:
+                temp_ids.append(engine_path)
+            else:
+                transfer_ids.append(engine_path)
+        if user_id is None:
+            user_filter = ''
+            user_arg = []
+        else:
+            user_filter = ' AND user_id=?'
+            user_arg = [user_id]
+        nmax = sqlite3_max_variable_number()
+        if nmax != 0:
+            nmax -= len(user_arg)
+        status = {}
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            for chunk in chunks(transfer_ids, nmax):
+                for engine_path, tr_status in cursor.execute(
+                        'SELECT engine_file_path, status FROM transfers '
+                        'WHERE engine_file_path IN (%s)%s'
+                        % (','.join(['?'] * len(chunk)), user_filter),
+                        chunk + user_arg):
+                    status[self._string_conversion(engine_path)] \
+                        = self._string_conversion(tr_status)
+            for chunk in chunks(temp_ids, nmax):
+                for temp_path_id, tr_status in cursor.execute(
+                        'SELECT temp_path_id, status '
+                        'FROM temporary_paths '
+                        'WHERE temp_path_id IN (%s)%s'
+                        % (','.join(['?'] * len(chunk)), user_filter),
+                        chunk + user_arg):
+                    status[temp_path_id] \
+                        = self._string_conversion(tr_status)
+        except Exception as e:
             cursor.close()
             connection.close()
-
+            six.reraise(DatabaseError, DatabaseError(e),
+                        sys.exc_info()[2])
+        cursor.close()
+        connection.close()
         return status
 
-    def get_temporary_status(self, temp_path_id, user_id):
+    def _new_revision(self, cursor):
         '''
-        Returns the temporary path status stored in the database.
+        Increment the database revision number. Rows modified in the same
+        transaction should be given the revision
+        (SELECT value FROM db_revision) + 1 before this call.
         '''
-        self.logger.debug("=> get_temporary_status")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            self._check_temporary(connection, cursor, temp_path_id, user_id)
-            try:
-                status = six.next(cursor.execute(
-                    'SELECT status FROM temporary_paths WHERE temp_path_id=?',
-                    [temp_path_id]))[0]
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-            status = self._string_conversion(status)
+        cursor.execute('UPDATE db_revision SET value=value+1')
+
+    def get_transfers_changes(self, workflow_ids, since_revision,
+                              user_id=None):
+        '''
+        Returns the transfers and temporary paths of the given workflows
+        which status changed after a given revision.
+
+        When nothing changed in the database since since_revision, the cost
+        is a single one-row query.
+
+        Parameters
+        ----------
+        workflow_ids: sequence of WorkflowIdentifier
+        since_revision: int
+            revision number returned by a former call, or 0 to get all the
+            modified transfers.
+        user_id: UserIdentifier (optional)
+            if given, only the transfers belonging to this user are returned
+
+        Returns
+        -------
+        (revision, status): tuple
+            revision: int
+                current revision number, to be used as since_revision in the
+                next call
+            status: dict
+                engine path or temporary path id -> status, as defined in
+                constants.FILE_TRANSFER_STATUS
+        '''
+        self.logger.debug("=> get_transfers_changes")
+        if user_id is None:
+            user_filter = ''
+            user_arg = []
+        else:
+            user_filter = ' AND user_id=?'
+            user_arg = [user_id]
+        nmax = sqlite3_max_variable_number()
+        if nmax != 0:
+            nmax -= 2 + len(user_arg)
+        status = {}
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            revision = six.next(cursor.execute(
+                'SELECT value FROM db_revision'))[0]
+            if revision != since_revision:
+                for chunk in chunks(workflow_ids, nmax):
+                    args = chunk + [since_revision, revision] + user_arg
+                    for engine_path, tr_status in cursor.execute(
+                            'SELECT engine_file_path, status '
+                            'FROM transfers WHERE workflow_id IN (%s) '
+                            'AND revision>? AND revision<=?%s'
+                            % (','.join(['?'] * len(chunk)),
+                               user_filter), args):
+                        status[self._string_conversion(engine_path)] \
+                            = self._string_conversion(tr_status)
+                    for temp_path_id, tr_status in cursor.execute(
+                            'SELECT temp_path_id, status '
+                            'FROM temporary_paths '
+                            'WHERE workflow_id IN (%s) '
+                            'AND revision>? AND revision<=?%s'
+                            % (','.join(['?'] * len(chunk)),
+                               user_filter), args):
+                        status[temp_path_id] \
+                            = self._string_conversion(tr_status)
+        except Exception as e:
             cursor.close()
             connection.close()
+            six.reraise(DatabaseError, DatabaseError(e),
+                        sys.exc_info()[2])
+        cursor.close()
+        connection.close()
+        return (revision, status)
 
-        return status
-
+    @write_behind
     def set_transfer_status(self, engine_file_path, status):
         '''
         Updates the transfer status in the database.
@@ -1398,8 +3318,13 @@ class WorkflowDatabaseServer(object):
             cursor = connection.cursor()
             try:
                 cursor.execute(
-                    'UPDATE transfers SET status=? WHERE engine_file_path=?',
-                    (status, engine_file_path))
+                    '''UPDATE transfers
+                    SET status=?,
+                        revision=(SELECT value FROM db_revision) + 1
+                    WHERE engine_file_path=? AND status!=?''',
+                    (status, engine_file_path, status))
+                if cursor.rowcount > 0:
+                    self._new_revision(cursor)
             except Exception as e:
                 connection.rollback()
                 cursor.close()
@@ -1409,6 +3334,7 @@ class WorkflowDatabaseServer(object):
             cursor.close()
             connection.close()
 
+    @write_behind
     def set_temporary_status(self, temp_path_id, status):
         '''
         Updates the temporary path status in the database.
@@ -1425,8 +3351,13 @@ class WorkflowDatabaseServer(object):
             cursor = connection.cursor()
             try:
                 cursor.execute(
-                    'UPDATE temporary_paths SET status=? WHERE temp_path_id=?',
-                    (status, temp_path_id))
+                    '''UPDATE temporary_paths
+                    SET status=?,
+                        revision=(SELECT value FROM db_revision) + 1
+                    WHERE temp_path_id=? AND status!=?''',
+                    (status, temp_path_id, status))
+                if cursor.rowcount > 0:
+                    self._new_revision(cursor)
             except Exception as e:
                 connection.rollback()
                 cursor.close()
@@ -1443,7 +3374,11 @@ class WorkflowDatabaseServer(object):
             cursor = connection.cursor()
             try:
                 cursor.execute(
-                    'UPDATE transfers SET transfer_type=? WHERE engine_file_path=?', (transfer_type, engine_file_path))
+                    'UPDATE transfers SET transfer_type=?, '
+                    'revision=(SELECT value FROM db_revision) + 1 '
+                    'WHERE engine_file_path=?',
+                    (transfer_type, engine_file_path))
+                self._new_revision(cursor)
             except Exception as e:
                 connection.rollback()
                 cursor.close()
@@ -1458,63 +3393,94 @@ class WorkflowDatabaseServer(object):
         To signal that a transfer belonging to a workflow finished.
         '''
         self.logger.debug("=> add_workflow_ended_transfer")
-        separator = ", "
         with self._lock:
             connection = self._connect()
             cursor = connection.cursor()
             try:
-                str_ended_transfers = six.next(cursor.execute(
-                    'SELECT ended_transfers FROM workflows WHERE id=?',
-                    [workflow_id]))[0]
-                if str_ended_transfers != None:
-                    ended_transfers = self._string_conversion(
-                        str_ended_transfers).split(separator)
-                    ended_transfers.append(engine_file_path)
-                    str_ended_transfers = separator.join(ended_transfers)
-                else:
-                    str_ended_transfers = engine_file_path
                 cursor.execute(
-                    'UPDATE workflows SET ended_transfers=? WHERE id=?',
-                    (str_ended_transfers, workflow_id))
+                    'INSERT INTO ended_transfers '
+                    '(workflow_id, engine_file_path) VALUES (?, ?)',
+                    (workflow_id, engine_file_path))
             except Exception as e:
                 connection.rollback()
                 cursor.close()
                 connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+                six.reraise(DatabaseError, DatabaseError(e),
+                            sys.exc_info()[2])
             connection.commit()
             cursor.close()
             connection.close()
 
-    def pop_workflow_ended_transfer(self, workflow_id):
+    def pop_workflows_ended_transfers(self, workflow_ids):
         '''
-        Returns the ended transfers for a workflow and clear the ended transfer list.
+        Returns the ended transfers of several workflows and remove them
+        from the ended transfers queue.
+
+        Parameters
+        ----------
+        workflow_ids: sequence of WorkflowIdentifier
+
+        Returns
+        -------
+        ended_transfers: dict
+            workflow_id -> list of engine file paths, in the order they
+            ended, for the workflows which have ended transfers
         '''
-        self.logger.debug("=> pop_workflow_ended_transfer")
-        separator = ", "
-        ended_transfers = []
+        self.logger.debug("=> pop_workflows_ended_transfers")
+        ended_transfers = {}
+        # most of the time there is no event: check it without the lock
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            empty = six.next(cursor.execute(
+                'SELECT count(*) FROM (SELECT 1 FROM ended_transfers '
+                'LIMIT 1)'))[0] == 0
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            six.reraise(DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
+        if empty:
+            return ended_transfers
+
         with self._lock:
             connection = self._connect()
             cursor = connection.cursor()
             try:
-                str_ended_transfers = six.next(cursor.execute(
-                    'SELECT ended_transfers FROM workflows WHERE id=?',
-                    [workflow_id]))[0]
-                if str_ended_transfers != None:
-                    ended_transfers = self._string_conversion(
-                        str_ended_transfers).split(separator)
-                cursor.execute(
-                    'UPDATE workflows SET ended_transfers=? WHERE id=?',
-                    (None, workflow_id))
+                event_ids = []
+                for chunk in chunks(workflow_ids):
+                    for event_id, workflow_id, engine_file_path in list(
+                            cursor.execute(
+                                'SELECT id, workflow_id, engine_file_path '
+                                'FROM ended_transfers '
+                                'WHERE workflow_id IN (%s) ORDER BY id'
+                                % ','.join(['?'] * len(chunk)), chunk)):
+                        event_ids.append(event_id)
+                        ended_transfers.setdefault(workflow_id, []).append(
+                            self._string_conversion(engine_file_path))
+                for chunk in chunks(event_ids):
+                    cursor.execute(
+                        'DELETE FROM ended_transfers WHERE id IN (%s)'
+                        % ','.join(['?'] * len(chunk)), chunk)
             except Exception as e:
                 connection.rollback()
                 cursor.close()
                 connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+                six.reraise(DatabaseError, DatabaseError(e),
+                            sys.exc_info()[2])
             connection.commit()
             cursor.close()
             connection.close()
         return ended_transfers
 
+    def pop_workflow_ended_transfer(self, workflow_id):
+        '''
+        Returns the ended transfers for a workflow and clear the ended transfer list.
+        '''
+        return self.pop_workflows_ended_transfers(
+            [workflow_id]).get(workflow_id, [])
+
     #
     # WORKFLOWS
 
@@ -1572,43 +3538,88 @@ class WorkflowDatabaseServer(object):
 
                 engine_workflow.wf_id = cursor.lastrowid
 
-                # the transfers must be registered before the jobs
+                if login is None:
+                    login = self.get_user_login(user_id, cursor)
+
+                # all the rows are prepared first, then inserted at once.
+                # The INSERT above holds the database write lock, so the
+                # temporary paths and jobs ids can be assigned by blocks.
+                # The transfers must be registered before the jobs.
+                transfer_rows = []
+                temp_rows = []
+                temp_path_id = self._first_free_id(
+                    cursor, 'temporary_paths', 'temp_path_id')
                 for transfer in six.itervalues(
                         engine_workflow.transfer_mapping):
                     transfer.workflow_id = engine_workflow.wf_id
-                    self.add_transfer(transfer,
-                                      user_id,
-                                      engine_workflow.expiration_date,
-                                      external_cursor=cursor)
-                    if isinstance(transfer, FileTransfer):
+                    if isinstance(transfer, TemporaryPath):
+                        transfer.temp_path_id = temp_path_id
+                        temp_path_id += 1
+                        temp_rows.append(
+                            (transfer.temp_path_id,)
+                            + self._temporary_path_values(
+                                transfer, user_id,
+                                engine_workflow.expiration_date))
                         engine_workflow.registered_tr[
-                            transfer.engine_path] = transfer
+                            transfer.temp_path_id] = transfer
                     else:
+                        transfer_rows.append(self._transfer_values(
+                            transfer, user_id,
+                            engine_workflow.expiration_date, cursor, login))
                         engine_workflow.registered_tr[
-                            transfer.temp_path_id] = transfer
-
-                job_info = []
-
-                if login is None:
-                    login = self.get_user_login(cursor)
-
+                            transfer.engine_path] = transfer
+                cursor.executemany(
+                    insert_query('transfers', TRANSFER_INSERT_COLUMNS),
+                    transfer_rows)
+                cursor.executemany(
+                    insert_query('temporary_paths',
+                                 ('temp_path_id',)
+                                 + TEMPORARY_PATH_INSERT_COLUMNS),
+                    temp_rows)
+
+                job_values = []
+                ios_rows = []
+                ios_tmp_rows = []
+                job_id = self._first_free_id(cursor, 'jobs')
                 for job in six.itervalues(engine_workflow.job_mapping):
                     job.workflow_id = engine_workflow.wf_id
-                    job = self.add_job(user_id,
-                                       job,
-                                       engine_workflow.expiration_date,
-                                       external_cursor=cursor,
-                                       login=login)
-                    job_info.append(
-                        (job.job_id, job.stdout_file, job.stderr_file))
+                    job.job_id = job_id
+                    job_id += 1
+                    values, ios, ios_tmp = self._job_values(
+                        user_id, job, engine_workflow.expiration_date,
+                        cursor, login)
+                    job_values.append((job.job_id, values))
+                    ios_rows.extend((job.job_id, engine_path, is_input)
+                                    for engine_path, is_input in ios)
+                    ios_tmp_rows.extend((job.job_id, temp_id, is_input)
+                                        for temp_id, is_input in ios_tmp)
                     engine_workflow.registered_jobs[job.job_id] = job
 
-                pickled_workflow = pickle.dumps(engine_workflow)
-
+                # the workflow is stored as a structure, each job definition
+                # in its own row (see EngineWorkflow.to_structure())
+                structure, job_definitions = engine_workflow.to_structure()
+                cursor.executemany(
+                    insert_query('jobs', ('id',) + JOB_INSERT_COLUMNS
+                                 + ('definition',)),
+                    [(job_id,) + values
+                     + (json.dumps(job_definitions[job_id]),)
+                     for job_id, values in job_values])
+                cursor.executemany(
+                    insert_query('ios', ('job_id', 'engine_file_path',
+                                         'is_input')),
+                    ios_rows)
+                cursor.executemany(
+                    insert_query('ios_tmp', ('job_id', 'temp_path_id',
+                                             'is_input')),
+                    ios_tmp_rows)
+
+                # the pickle is kept for get_engine_workflow(): loading it
+                # is faster than rebuilding the workflow from its structure
                 cursor.execute('''UPDATE workflows
-                          SET pickled_engine_workflow=?
+                          SET structure=?, pickled_engine_workflow=?
                           WHERE id=?''',
-                              (pickled_workflow,
+                              (json.dumps(structure),
+                               sqlite3.Binary(pickle.dumps(engine_workflow)),
                                engine_workflow.wf_id))
             except Exception as e:
                 connection.rollback()
@@ -1618,6 +3629,8 @@ class WorkflowDatabaseServer(object):
             connection.commit()
             cursor.close()
             connection.close()
+            if self._cache is not None:
+                self._cache.counts = None
 
         return engine_workflow
 
@@ -1644,6 +3657,9 @@ class WorkflowDatabaseServer(object):
                     'UPDATE transfers SET expiration_date=? WHERE workflow_id=?', (yesterday, wf_id))
                 cursor.execute(
                     'UPDATE temporary_paths SET expiration_date=? WHERE workflow_id=?', (yesterday, wf_id))
+                # an archived workflow is deleted with its files by clean()
+                cursor.execute(
+                    'UPDATE archived_workflows SET expiration_date=? WHERE id=?', (yesterday, wf_id))
             except Exception as e:
                 connection.rollback()
                 cursor.close()
@@ -1654,8 +3670,7 @@ class WorkflowDatabaseServer(object):
             cursor.close()
             connection.commit()
             connection.close()
-            self.clean()
-            self.vacuum()
+        self.clean(vacuum=True)
 
     def change_workflow_expiration_date(self, wf_id, new_date, user_id):
         '''
@@ -1686,37 +3701,167 @@ class WorkflowDatabaseServer(object):
         Returns a EngineWorkflow object.
         The wf_id must be valid.
 
+        The workflow is unpickled from pickled_engine_workflow, which is
+        faster than rebuilding it from its structure (see
+        EngineWorkflow.from_structure(), used for the workflows stored
+        without pickle), then the state of its elements is read from their
+        rows.
+
         @type wf_id: C{WorflowIdentifier}
         @rtype: C{EngineWorkflow}
         @return: workflow object
         '''
         self.logger.debug("=> get_engine_workflow")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
             self._check_workflow(connection, cursor, wf_id, user_id)
-
-            try:
-                pickled_workflow = six.next(cursor.execute(
-                    '''SELECT
-                    pickled_engine_workflow
-                    FROM workflows WHERE id=?''',
-                    [wf_id]))[0]
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        except UnknownObjectError:
             cursor.close()
             connection.close()
+            return self._archived_engine_workflow(wf_id, user_id)
 
+        jobs = []
+        transfers = []
+        job_definitions = {}
+        try:
+            (pickled_workflow, structure, name, queue, expiration_date,
+             status) = six.next(cursor.execute(
+                '''SELECT
+                pickled_engine_workflow,
+                structure,
+                name,
+                queue,
+                expiration_date,
+                status
+                FROM workflows WHERE id=?''',
+                [wf_id]))
+            if structure or pickled_workflow:
+                jobs = list(cursor.execute(
+                    '''SELECT id,
+                    status,
+                    queue,
+                    drmaa_id,
+                    custom_submission,
+                    stdout_file,
+                    stderr_file,
+                    exit_status,
+                    exit_value,
+                    terminating_signal,
+                    resource_usage
+                    FROM jobs WHERE workflow_id=?''', [wf_id]))
+                transfers = list(cursor.execute(
+                    '''SELECT engine_file_path, status
+                    FROM transfers WHERE workflow_id=?''', [wf_id]))
+                transfers += list(cursor.execute(
+                    '''SELECT temp_path_id, status
+                    FROM temporary_paths WHERE workflow_id=?''', [wf_id]))
+            if structure and not pickled_workflow:
+                job_definitions = dict(
+                    (job_id, json.loads(definition))
+                    for job_id, definition in cursor.execute(
+                        '''SELECT id, definition
+                        FROM jobs WHERE workflow_id=?''', [wf_id]))
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            six.reraise(DatabaseError, DatabaseError(e),
+                        sys.exc_info()[2])
+        cursor.close()
+        connection.close()
+        return self._engine_workflow(wf_id, pickled_workflow, structure,
+                                     job_definitions, name, queue,
+                                     expiration_date, status, jobs,
+                                     transfers)
+
+    def _archived_engine_workflow(self, wf_id, user_id):
+        '''
+        get_engine_workflow() for an archived workflow, rebuilt from its
+        structure (see archive_workflows()).
+        '''
+        data = self.get_archived_workflow(wf_id, user_id)
+        workflow = data['workflow']
+        job_definitions = {}
+        if workflow.get('structure'):
+            job_definitions = dict((job['id'], json.loads(job['definition']))
+                                   for job in data['jobs']
+                                   if job.get('definition'))
+        jobs = [tuple(job[column] for column in (
+                    'id', 'status', 'queue', 'drmaa_id', 'custom_submission',
+                    'stdout_file', 'stderr_file', 'exit_status', 'exit_value',
+                    'terminating_signal', 'resource_usage'))
+                for job in data['jobs']]
+        transfers = [(transfer['engine_file_path'], transfer['status'])
+                     for transfer in data['transfers']]
+        transfers += [(temp['temp_path_id'], temp['status'])
+                      for temp in data['temporary_paths']]
+        return self._engine_workflow(wf_id, None, workflow.get('structure'),
+                                     job_definitions, workflow['name'],
+                                     workflow['queue'],
+                                     workflow['expiration_date'],
+                                     workflow['status'], jobs, transfers)
+
+    def _engine_workflow(self, wf_id, pickled_workflow, structure,
+                         job_definitions, name, queue, expiration_date,
+                         status, jobs, transfers):
+        '''
+        Build the EngineWorkflow of get_engine_workflow() from its pickle
+        or its structure, and set the state of its elements from their rows
+        (jobs: (id, status, queue, drmaa_id, custom_submission, stdout_file,
+        stderr_file, exit_status, exit_value, terminating_signal,
+        resource_usage), transfers: (engine_file_path or temp_path_id,
+        status)).
+        '''
         if pickled_workflow:
-            pickled_workflow = pickled_workflow.encode('utf-8')
-            workflow = pickle.loads(pickled_workflow)
+            if not isinstance(pickled_workflow, bytes):
+                pickled_workflow = pickled_workflow.encode('utf-8')
+            with gc_paused():
+                workflow = pickle.loads(pickled_workflow)
+            workflow.queue = self._string_conversion(queue)
+            workflow.expiration_date = self._str_to_date_conversion(
+                expiration_date)
+            workflow.name = self._string_conversion(name)
+        elif structure:
+            # workflows registered without pickle
+            with gc_paused():
+                workflow = EngineWorkflow.from_structure(
+                    json.loads(structure),
+                    job_definitions,
+                    wf_id,
+                    self._string_conversion(queue),
+                    self._str_to_date_conversion(expiration_date),
+                    self._string_conversion(name))
         else:
-            workflow = None
+            return None
+
+        workflow.status = self._string_conversion(status)
+        for (job_id, job_status, job_queue, drmaa_id, custom_submission,
+             stdout_file, stderr_file, exit_status, exit_value,
+             terminating_signal, resource_usage) in jobs:
+            job = workflow.registered_jobs.get(job_id)
+            if job is None:
+                continue
+            job.status = self._string_conversion(job_status)
+            job.queue = self._string_conversion(job_queue)
+            job.drmaa_id = self._string_conversion(drmaa_id)
+            if not custom_submission:
+                job.stdout_file = self._string_conversion(stdout_file)
+                job.stderr_file = self._string_conversion(stderr_file)
+            job.exit_status = self._string_conversion(exit_status)
+            job.exit_value = exit_value
+            job.terminating_signal = self._string_conversion(
+                terminating_signal)
+            job.str_rusage = self._string_conversion(resource_usage)
+        for transfer_id, transfer_status in transfers:
+            if not isinstance(transfer_id, int):
+                transfer_id = self._string_conversion(transfer_id)
+            transfer = workflow.registered_tr.get(transfer_id)
+            if transfer is not None:
+                transfer.status = self._string_conversion(transfer_status)
 
         return workflow
 
+    @write_behind
     def set_workflow_status(self, wf_id, status, force=False):
         '''
         Updates the workflow status in the database.
@@ -1732,6 +3877,8 @@ class WorkflowDatabaseServer(object):
             # TBI if the status is not valid raise an exception ??
             connection = self._connect()
             cursor = connection.cursor()
+            updated = False
+            now = datetime.now()
             try:
                 prev_status = six.next(cursor.execute(
                     '''SELECT status
@@ -1741,13 +3888,16 @@ class WorkflowDatabaseServer(object):
                 if force or \
                         (prev_status != constants.DELETE_PENDING and
                             prev_status != constants.KILL_PENDING):
+                    if self._cache is not None:
+                        self._cache_workflows(cursor, [wf_id])
                     cursor.execute('''UPDATE workflows
                         SET status=?,
                         last_status_update=?
                         WHERE id=?''',
                                   (status,
-                                    datetime.now(),
+                                    now,
                                     wf_id))
+                    updated = True
                     self.logger.debug("===> workflow_status updated")
                 else:
                     self.logger.debug("===> (workflow_status not updated)")
@@ -1762,31 +3912,128 @@ class WorkflowDatabaseServer(object):
             connection.commit()
             cursor.close()
             connection.close()
+            if updated and self._cache is not None:
+                self._cache.set_workflow_status(wf_id, status, now)
 
-    def get_workflow_status(self, wf_id, user_id):
+    @write_behind
+    def set_workflows_status(self, wf_status, force=False):
         '''
-        Returns the workflow status stored in the database
-        (updated by L{DrmaaWorkflowEngine}) and the date of its last update.
+        Updates the status of several workflows at once, like
+        set_jobs_status() does for jobs: workflows which status did not
+        change are not written, except their last_status_update date which
+        is refreshed once every update_interval.
+
+        Parameters
+        ----------
+        wf_status: dict
+            workflow id -> status, as defined in constants.WORKFLOW_STATUS
+        force: bool
+            if True, the status of workflows pending for deletion or kill is
+            updated too.
         '''
-        self.logger.debug("=> get_workflow_status, wf_id: %s, user_id: %s"
-            % (wf_id, user_id))
+        self.logger.debug("=> set_workflows_status")
         with self._lock:
             connection = self._connect()
             cursor = connection.cursor()
-            self._check_workflow(connection, cursor, wf_id, user_id)
+            now = datetime.now()
+            status_to_update = []
+            date_to_update = []
             try:
-                (status, strdate) = six.next(cursor.execute(
-                    '''SELECT status, last_status_update
-                    FROM workflows WHERE id=?''',
-                    [wf_id]))
+                if self._cache is not None:
+                    self._cache_workflows(cursor, list(wf_status.keys()))
+                for chunk in chunks(wf_status):
+                    for wf_id, previous_status, last_update in cursor.execute(
+                            'SELECT id, status, last_status_update '
+                            'FROM workflows WHERE id IN (%s)'
+                            % ','.join(['?'] * len(chunk)), chunk):
+                        status = wf_status[wf_id]
+                        previous_status = self._string_conversion(
+                            previous_status)
+                        if previous_status != status:
+                            if force or \
+                                    (previous_status != constants.DELETE_PENDING
+                                     and previous_status
+                                     != constants.KILL_PENDING):
+                                status_to_update.append((status, now, wf_id))
+                        elif force or now \
+                                - self._str_to_date_conversion(last_update) \
+                                > update_interval:
+                            # update just last_status_update after a given
+                            # time (typically 30 s), all workflows at once
+                            date_to_update.append(wf_id)
+                if status_to_update:
+                    cursor.executemany('''UPDATE workflows
+                        SET status=?,
+                        last_status_update=?
+                        WHERE id=?''', status_to_update)
+                nmax = sqlite3_max_variable_number()
+                if nmax != 0:
+                    nmax -= 1
+                for chunk in chunks(date_to_update, nmax):
+                    cursor.execute(
+                        'UPDATE workflows SET last_status_update=? '
+                        'WHERE id IN (%s)' % ','.join(['?'] * len(chunk)),
+                        [now] + chunk)
             except Exception as e:
+                connection.rollback()
                 cursor.close()
                 connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-            status = self._string_conversion(status)
-            date = self._str_to_date_conversion(strdate)
+                self.logger.error(
+                    "===> workflows_status update failed, error: %s, : %s"
+                    % (str(type(e)), str(e)))
+                six.reraise(DatabaseError, DatabaseError(e),
+                            sys.exc_info()[2])
+            connection.commit()
+            cursor.close()
+            connection.close()
+            if self._cache is not None:
+                for status, date, wf_id in status_to_update:
+                    self._cache.set_workflow_status(wf_id, status, date)
+                for wf_id in date_to_update:
+                    entry = self._cache.workflows.get(wf_id)
+                    if entry is not None:
+                        entry[2] = now.replace(microsecond=0)
+
+    def get_workflow_status(self, wf_id, user_id):
+        '''
+        Returns the workflow status stored in the database
+        (updated by L{DrmaaWorkflowEngine}) and the date of its last update.
+        The status of an archived workflow is read from archived_workflows.
+        '''
+        self.logger.debug("=> get_workflow_status, wf_id: %s, user_id: %s"
+            % (wf_id, user_id))
+        if self._cache is not None:
+            self._read_own_writes()
+            status = self._cache.workflow_status(wf_id, user_id)
+            if status is not None:
+                return status
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            row = cursor.execute(
+                '''SELECT status, last_status_update
+                FROM workflows WHERE id=? AND user_id=?''',
+                [wf_id, user_id]).fetchone()
+            if row is None:
+                row = cursor.execute(
+                    '''SELECT status, last_status_update
+                    FROM archived_workflows WHERE id=? AND user_id=?''',
+                    [wf_id, user_id]).fetchone()
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        if row is None:
             cursor.close()
             connection.close()
+            raise UnknownObjectError("The workflow id " + repr(wf_id)
+                                     + " is not valid or does not belong to "
+                                     "user " + repr(user_id))
+        (status, strdate) = row
+        status = self._string_conversion(status)
+        date = self._str_to_date_conversion(strdate)
+        cursor.close()
+        connection.close()
         self.logger.debug("===> status: %s, date: %s" % (status, strdate))
         return (status, date)
 
@@ -1826,109 +4073,21 @@ class WorkflowDatabaseServer(object):
         )
         '''
         self.logger.debug("=> get_detailed_workflow_status, wf_id: %s" % wf_id)
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-
-            try:
-                # workflow status
-                (wf_status, wf_queue) = six.next(cursor.execute(
-                    '''SELECT
-                    status,
-                    queue
-                    FROM workflows WHERE id=?''',
-                    [wf_id]))  # supposes that the wf_id is valid
-
-                workflow_status = ([], [], wf_status, wf_queue, [])
-                # jobs
-                for row in cursor.execute('''SELECT id,
-                                            status,
-                                            exit_status,
-                                            exit_value,
-                                            terminating_signal,
-                                            resource_usage,
-                                            submission_date,
-                                            execution_date,
-                                            ending_date,
-                                            queue
-                                     FROM jobs WHERE workflow_id=?''',
-                                     [wf_id]):
-                    job_id, status, exit_status, exit_value, term_signal, \
-                    resource_usage, submission_date, execution_date, \
-                    ending_date, queue = row
-
-                    submission_date = self._str_to_date_conversion(
-                        submission_date)
-                    execution_date = self._str_to_date_conversion(
-                        execution_date)
-                    ending_date = self._str_to_date_conversion(ending_date)
-                    queue = self._string_conversion(queue)
-
-                    workflow_status[0].append(
-                        (job_id, status, queue,
-                         (exit_status, exit_value, term_signal,
-                          resource_usage),
-                         (submission_date, execution_date, ending_date,
-                          queue)))
-
-                # transfers
-                for row in cursor.execute('''SELECT engine_file_path,
-                                            client_file_path,
-                                            client_paths,
-                                            status,
-                                            transfer_type
-                                     FROM transfers WHERE workflow_id=?''',
-                                     [wf_id]):
-                    (engine_file_path,
-                     client_file_path,
-                     client_paths,
-                     status,
-                     transfer_type) = row
-
-                    engine_file_path = self._string_conversion(
-                        engine_file_path)
-                    client_file_path = self._string_conversion(
-                        client_file_path)
-                    status = self._string_conversion(status)
-                    transfer_type = self._string_conversion(transfer_type)
-                    if client_paths:
-                        client_paths = self._string_conversion(
-                            client_paths).split(file_separator)
-                    else:
-                        client_paths = None
-
-                    workflow_status[1].append((engine_file_path,
-                                               client_file_path,
-                                               client_paths,
-                                               status,
-                                               transfer_type))
-
-                # temporary_paths
-                for row in cursor.execute('''SELECT temp_path_id,
-                                            engine_file_path,
-                                            status
-                                  FROM temporary_paths WHERE workflow_id=?''',
-                                  [wf_id]):
-                    (temp_path_id,
-                     engine_file_path,
-                     status) = row
-
-                    engine_file_path = self._string_conversion(
-                        engine_file_path)
-                    status = self._string_conversion(status)
-
-                    workflow_status[4].append((temp_path_id,
-                                               engine_file_path,
-                                               status))
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
 
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        try:
+            workflow_status = self._detailed_workflow_status(cursor, wf_id)
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
 
-        self.logger.debug("===> status: %s, queue: %s" % (wf_status, wf_queue))
+        wf_status = workflow_status[2]
+        self.logger.debug("===> status: %s, queue: %s"
+                          % (wf_status, workflow_status[3]))
         if check_status and wf_status == constants.WORKFLOW_IN_PROGRESS:
             done = []
             not_done = []
@@ -1946,6 +4105,367 @@ class WorkflowDatabaseServer(object):
                 self.set_workflow_status(wf_id, constants.WORKFLOW_DONE, True)
         return workflow_status
 
+    def get_detailed_workflow_status_changes(self, wf_id,
+                                             since_revision=None):
+        '''
+        Incremental version of get_detailed_workflow_status(): only the
+        jobs, transfers and temporary paths modified after a given database
+        revision are returned. The workflow status and queue are always
+        returned.
+
+        Parameters
+        ----------
+        wf_id: WorflowIdentifier
+        since_revision: int (optional)
+            revision number returned by a former call. If None, all the
+            elements are returned.
+
+        Returns
+        -------
+        (revision, workflow_status): tuple
+            revision: int
+                current revision number, to be used as since_revision in the
+                next call
+            workflow_status: tuple
+                same as the get_detailed_workflow_status() result, restricted
+                to the modified elements
+        '''
+        self.logger.debug("=> get_detailed_workflow_status_changes, wf_id: "
+                          "%s, since revision %s" % (wf_id, since_revision))
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            revision = six.next(cursor.execute(
+                'SELECT value FROM db_revision'))[0]
+            if since_revision is None:
+                workflow_status = self._detailed_workflow_status(cursor,
+                                                                 wf_id)
+            else:
+                workflow_status = self._detailed_workflow_status(
+                    cursor, wf_id, (since_revision, revision))
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            six.reraise(DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
+        return (revision, workflow_status)
+
+    def get_workflows_summary(self, user_id, workflow_ids=None):
+        '''
+        Aggregated status of workflows: jobs counts and timing information,
+        computed by the database without reading the jobs one by one.
+
+        Parameters
+        ----------
+        user_id: UserIdentifier
+        workflow_ids: sequence of WorflowIdentifier (optional)
+            if not given, all the workflows of the user are summarized
+
+        Returns
+        -------
+        summary: dict
+            workflow id -> dict with the items:
+
+            * name, status, queue: the workflow name, status and queue
+            * job_count: number of jobs
+            * status_counts: dict job status -> number of jobs
+            * queue_counts: dict queue -> dict job status -> number of jobs
+            * progress: percentage of ended (done or failed) jobs
+            * first_submission_date, first_execution_date,
+              last_ending_date: dates (or None) over all the jobs
+            * mean_duration: mean execution time of the ended jobs, in
+              seconds (or None)
+            * eta: estimated end date, extrapolated from the rate of ended
+              jobs since the first execution (or None)
+
+            The archived workflows (see archive_workflows()) are summarized
+            too, from the jobs rows of their archive.
+        '''
+        self.logger.debug("=> get_workflows_summary")
+
+        def new_summary(name, status, queue):
+            return {
+                'name': self._string_conversion(name),
+                'status': self._string_conversion(status),
+                'queue': self._string_conversion(queue),
+                'job_count': 0,
+                'status_counts': {},
+                'queue_counts': {},
+                'progress': 0.,
+                'first_submission_date': None,
+                'first_execution_date': None,
+                'last_ending_date': None,
+                'mean_duration': None,
+                'eta': None}
+
+        summary = {}
+        archives = []
+        nmax = sqlite3_max_variable_number()
+        if nmax != 0:
+            nmax -= 1
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            if workflow_ids:
+                rows = []
+                for chunk in chunks(list(workflow_ids), nmax):
+                    rows += cursor.execute(
+                        'SELECT id, name, status, queue FROM workflows '
+                        'WHERE id IN (%s) AND user_id=?'
+                        % ','.join(['?'] * len(chunk)), chunk + [user_id])
+                live_ids = set(row[0] for row in rows)
+                archived_ids = [wf_id for wf_id in workflow_ids
+                                if wf_id not in live_ids]
+                for chunk in chunks(archived_ids, nmax):
+                    archives += cursor.execute(
+                        'SELECT id, name, status, data '
+                        'FROM archived_workflows '
+                        'WHERE id IN (%s) AND user_id=?'
+                        % ','.join(['?'] * len(chunk)), chunk + [user_id])
+            else:
+                rows = list(cursor.execute(
+                    'SELECT id, name, status, queue FROM workflows '
+                    'WHERE user_id=?', [user_id]))
+                archives = list(cursor.execute(
+                    'SELECT id, name, status, data FROM archived_workflows '
+                    'WHERE user_id=?', [user_id]))
+            for wf_id, name, status, queue in rows:
+                summary[wf_id] = new_summary(name, status, queue)
+
+            for chunk in chunks(list(summary.keys())):
+                in_chunk = ','.join(['?'] * len(chunk))
+                for wf_id, queue, status, count in cursor.execute(
+                        'SELECT workflow_id, queue, status, count(*) '
+                        'FROM jobs WHERE workflow_id IN (%s) '
+                        'GROUP BY workflow_id, queue, status'
+                        % in_chunk, chunk):
+                    wf_summary = summary[wf_id]
+                    queue = self._string_conversion(queue)
+                    status = self._string_conversion(status)
+                    wf_summary['job_count'] += count
+                    wf_summary['status_counts'][status] \
+                        = wf_summary['status_counts'].get(status, 0) + count
+                    wf_summary['queue_counts'].setdefault(
+                        queue, {})[status] = count
+                for (wf_id, submission_date, execution_date, ending_date,
+                     mean_duration) in cursor.execute(
+                        'SELECT workflow_id, min(submission_date), '
+                        'min(execution_date), max(ending_date), '
+                        'avg((julianday(ending_date) '
+                        '     - julianday(execution_date)) * 86400.) '
+                        'FROM jobs WHERE workflow_id IN (%s) '
+                        'GROUP BY workflow_id' % in_chunk, chunk):
+                    wf_summary = summary[wf_id]
+                    wf_summary['first_submission_date'] \
+                        = self._str_to_date_conversion(submission_date)
+                    wf_summary['first_execution_date'] \
+                        = self._str_to_date_conversion(execution_date)
+                    wf_summary['last_ending_date'] \
+                        = self._str_to_date_conversion(ending_date)
+                    wf_summary['mean_duration'] = mean_duration
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            six.reraise(DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
+
+        # the same aggregates, computed from the archived jobs rows
+        for wf_id, name, status, data in archives:
+            data = read_archive_data(data)
+            wf_summary = new_summary(name, status, data['workflow']['queue'])
+            summary[wf_id] = wf_summary
+            submission_dates = []
+            execution_dates = []
+            ending_dates = []
+            durations = []
+            for job in data['jobs']:
+                queue = self._string_conversion(job['queue'])
+                status = self._string_conversion(job['status'])
+                wf_summary['job_count'] += 1
+                wf_summary['status_counts'][status] \
+                    = wf_summary['status_counts'].get(status, 0) + 1
+                queue_counts = wf_summary['queue_counts'].setdefault(queue,
+                                                                     {})
+                queue_counts[status] = queue_counts.get(status, 0) + 1
+                submission_date = self._str_to_date_conversion(
+                    job['submission_date'])
+                execution_date = self._str_to_date_conversion(
+                    job['execution_date'])
+                ending_date = self._str_to_date_conversion(
+                    job['ending_date'])
+                if submission_date is not None:
+                    submission_dates.append(submission_date)
+                if execution_date is not None:
+                    execution_dates.append(execution_date)
+                if ending_date is not None:
+                    ending_dates.append(ending_date)
+                    if execution_date is not None:
+                        durations.append(
+                            (ending_date - execution_date).total_seconds())
+            if submission_dates:
+                wf_summary['first_submission_date'] = min(submission_dates)
+            if execution_dates:
+                wf_summary['first_execution_date'] = min(execution_dates)
+            if ending_dates:
+                wf_summary['last_ending_date'] = max(ending_dates)
+            if durations:
+                wf_summary['mean_duration'] = sum(durations) / len(durations)
+
+        now = datetime.now()
+        for wf_summary in six.itervalues(summary):
+            job_count = wf_summary['job_count']
+            if job_count == 0:
+                continue
+            ended = wf_summary['status_counts'].get(constants.DONE, 0) \
+                + wf_summary['status_counts'].get(constants.FAILED, 0)
+            wf_summary['progress'] = 100. * ended / job_count
+            start = wf_summary['first_execution_date']
+            if ended != 0 and ended != job_count and start is not None:
+                elapsed = now - start
+                wf_summary['eta'] = now + elapsed * (job_count - ended) \
+                    // ended
+        return summary
+
+    def _detailed_workflow_status(self, cursor, wf_id, revisions=None):
+        '''
+        Query the status of the workflow elements for
+        get_detailed_workflow_status() and
+        get_detailed_workflow_status_changes(). If revisions is given as
+        (since_revision, revision), only the elements which revision is in
+        this range are returned.
+        '''
+        if revisions is None:
+            revision_filter = ''
+            revision_args = []
+        else:
+            revision_filter = ' AND revision>? AND revision<=?'
+            revision_args = list(revisions)
+        # workflow status
+        archived = None
+        row = cursor.execute(
+            '''SELECT
+            status,
+            queue
+            FROM workflows WHERE id=?''',
+            [wf_id]).fetchone()
+        if row is None:
+            # the elements of an archived workflow are read from its archive
+            for data, in cursor.execute(
+                    'SELECT data FROM archived_workflows WHERE id=?',
+                    [wf_id]):
+                archived = read_archive_data(data)
+            if archived is None:
+                raise UnknownObjectError("The workflow id " + repr(wf_id)
+                                         + " is not valid")
+            row = (archived['workflow']['status'],
+                   archived['workflow']['queue'])
+        (wf_status, wf_queue) = row
+
+        def archived_rows(table, columns):
+            if archived is None:
+                return []
+            return [tuple(element[column] for column in columns)
+                    for element in archived[table]
+                    if revisions is None
+                    or revisions[0] < (element.get('revision') or 0)
+                    <= revisions[1]]
+
+        workflow_status = ([], [], wf_status, wf_queue, [])
+        # jobs
+        for row in list(cursor.execute('''SELECT id,
+                                    status,
+                                    exit_status,
+                                    exit_value,
+                                    terminating_signal,
+                                    resource_usage,
+                                    submission_date,
+                                    execution_date,
+                                    ending_date,
+                                    queue
+                             FROM jobs WHERE workflow_id=?%s'''
+                             % revision_filter, [wf_id] + revision_args)) \
+                + archived_rows('jobs', (
+                    'id', 'status', 'exit_status', 'exit_value',
+                    'terminating_signal', 'resource_usage',
+                    'submission_date', 'execution_date', 'ending_date',
+                    'queue')):
+            job_id, status, exit_status, exit_value, term_signal, \
+            resource_usage, submission_date, execution_date, \
+            ending_date, queue = row
+
+            submission_date = self._str_to_date_conversion(
+                submission_date)
+            execution_date = self._str_to_date_conversion(
+                execution_date)
+            ending_date = self._str_to_date_conversion(ending_date)
+            queue = self._string_conversion(queue)
+
+            workflow_status[0].append(
+                (job_id, status, queue,
+                 (exit_status, exit_value, term_signal,
+                  resource_usage),
+                 (submission_date, execution_date, ending_date,
+                  queue)))
+
+        # transfers
+        for row in list(cursor.execute('''SELECT engine_file_path,
+                                    client_file_path,
+                                    client_paths,
+                                    status,
+                                    transfer_type
+                             FROM transfers WHERE workflow_id=?%s'''
+                             % revision_filter, [wf_id] + revision_args)) \
+                + archived_rows('transfers', (
+                    'engine_file_path', 'client_file_path', 'client_paths',
+                    'status', 'transfer_type')):
+            (engine_file_path,
+             client_file_path,
+             client_paths,
+             status,
+             transfer_type) = row
+
+            engine_file_path = self._string_conversion(
+                engine_file_path)
+            client_file_path = self._string_conversion(
+                client_file_path)
+            status = self._string_conversion(status)
+            transfer_type = self._string_conversion(transfer_type)
+            if client_paths:
+                client_paths = self._string_conversion(
+                    client_paths).split(file_separator)
+            else:
+                client_paths = None
+
+            workflow_status[1].append((engine_file_path,
+                                       client_file_path,
+                                       client_paths,
+                                       status,
+                                       transfer_type))
+
+        # temporary_paths
+        for row in list(cursor.execute('''SELECT temp_path_id,
+                                    engine_file_path,
+                                    status
+                          FROM temporary_paths WHERE workflow_id=?%s'''
+                          % revision_filter, [wf_id] + revision_args)) \
+                + archived_rows('temporary_paths', (
+                    'temp_path_id', 'engine_file_path', 'status')):
+            (temp_path_id,
+             engine_file_path,
+             status) = row
+
+            engine_file_path = self._string_conversion(
+                engine_file_path)
+            status = self._string_conversion(status)
+
+            workflow_status[4].append((temp_path_id,
+                                       engine_file_path,
+                                       status))
+
+        return workflow_status
+
     #
     # JOBS
     def _check_job(self, connection, cursor, job_id, user_id):
@@ -1972,35 +4492,34 @@ class WorkflowDatabaseServer(object):
 
     def is_valid_job(self, job_id, user_id):
         self.logger.debug("=> is_valid_job")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            last_status_update = None
-            try:
-                sel = cursor.execute(
-                    '''SELECT last_status_update
-                    FROM jobs
-                    WHERE id=?''',
-                    [job_id])
-                last_status_update = six.next(sel)[0]
-                count = 1
-            except StopIteration:
-                count = 0
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        last_status_update = None
+        try:
+            sel = cursor.execute(
+                '''SELECT last_status_update
+                FROM jobs
+                WHERE id=?''',
+                [job_id])
+            last_status_update = six.next(sel)[0]
+            count = 1
+        except StopIteration:
+            count = 0
+        except Exception as e:
             cursor.close()
             connection.close()
-            last_status_update = self._str_to_date_conversion(
-                last_status_update)
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
+        last_status_update = self._str_to_date_conversion(
+            last_status_update)
         return (count != 0, last_status_update)
 
 
     def get_user_login(self, user_id, external_cursor=None):
         self.logger.debug("=> get_user_login")
         if not external_cursor:
-            connection = self._connect()
+            connection = self._connect(read_only=True)
             cursor = connection
         else:
             cursor = external_cursor
@@ -2045,15 +4564,6 @@ class WorkflowDatabaseServer(object):
             expiration_date = datetime.now() + timedelta(
                 hours=engine_job.disposal_timeout)
 
-        parallel_config_name = None
-        max_node_number = 1
-        if engine_job.parallel_job_info:
-            parallel_config_name, max_node_number \
-                = engine_job.parallel_job_info
-        command_info = ""
-        for command_element in engine_job.plain_command():
-            command_info = command_info + " " + repr(command_element)
-
         with self._lock:
             if not external_cursor:
                 self.logger.debug("=> add_job")
@@ -2062,104 +4572,14 @@ class WorkflowDatabaseServer(object):
             else:
                 cursor = external_cursor
 
-            if login is None:
-                login = self.get_user_login(user_id, cursor)
-
-            try:
-
-                if not engine_job.plain_stdout():
-                    engine_job.stdout_file = self.generate_file_path(
-                        user_id, external_cursor=cursor, login=login)
-                    engine_job.stderr_file = self.generate_file_path(
-                        user_id, external_cursor=cursor, login=login)
-                    custom_submission = False  # the std out and err file has to be removed with the job
-                else:
-                    custom_submission = True  # the std out and err file won't to be removed with the job
-
-                referenced_input_files = []
-                referenced_input_temp = []
-                for ft in engine_job.referenced_input_files:
-                    eft = engine_job.transfer_mapping[ft]
-                    if isinstance(eft, FileTransfer):
-                        referenced_input_files.append(eft.engine_path)
-                    else:
-                        referenced_input_temp.append(eft.temp_path_id)
-
-                referenced_output_files = []
-                referenced_output_temp = []
-                for ft in engine_job.referenced_output_files:
-                    eft = engine_job.transfer_mapping[ft]
-                    if isinstance(eft, FileTransfer):
-                        referenced_output_files.append(eft.engine_path)
-                    else:
-                        referenced_output_temp.append(eft.temp_path_id)
-
-                cursor.execute('''INSERT INTO jobs
-                         (user_id,
-
-                          drmaa_id,
-                          expiration_date,
-                          status,
-                          last_status_update,
-                          workflow_id,
-
-                          command,
-                          stdin_file,
-                          join_errout,
-                          stdout_file,
-                          stderr_file,
-                          working_directory,
-                          custom_submission,
-                          parallel_config_name,
-                          max_node_number,
-                          queue,
-
-                          name,
-                          submission_date,
-                          execution_date,
-                          ending_date,
-
-                          exit_status,
-                          exit_value,
-                          terminating_signal,
-                          resource_usage,
-
-                          pickled_engine_job)
-                          VALUES (?, ?, ?, ?, ?,
-                                  ?, ?, ?, ?, ?,
-                                  ?, ?, ?, ?, ?,
-                                  ?, ?, ?, ?, ?,
-                                  ?, ?, ?, ?, ?)''',
-                              (user_id,
+            if login is None:
+                login = self.get_user_login(user_id, cursor)
 
-                                  None,  # drmaa_id
-                                  expiration_date,
-                                  constants.NOT_SUBMITTED,  # status
-                                  datetime.now(),  # last_status_update
-                                  engine_job.workflow_id,
-
-                                  command_info,
-                                  engine_job.plain_stdin(),
-                                  engine_job.join_stderrout,
-                                  engine_job.plain_stdout(),
-                                  engine_job.plain_stderr(),
-                                  engine_job.plain_working_directory(),
-                                  custom_submission,
-                                  parallel_config_name,
-                                  max_node_number,
-                                  engine_job.queue,
-
-                                  engine_job.name,
-                                  None,  # submission_date,
-                                  None,  # execution_date,
-                                  None,  # ending_date,
-                                  None,  # exit_status,
-                                  None,  # exit_value,
-                                  None,  # terminating_signal,
-                                  None,  # resource_usage,
-
-                                  None  # pickled_engine_job
-                               ))
+            try:
+                values, ios, ios_tmp = self._job_values(
+                    user_id, engine_job, expiration_date, cursor, login)
+                cursor.execute(insert_query('jobs', JOB_INSERT_COLUMNS),
+                               values)
 
                 job_id = cursor.lastrowid
                 engine_job.job_id = job_id
@@ -2169,33 +4589,18 @@ class WorkflowDatabaseServer(object):
                         'UPDATE jobs SET pickled_engine_job=? WHERE id=?',
                                   (pickled_engine_job, job_id))
 
-                for engine_path in referenced_input_files:
-                    cursor.execute('''INSERT INTO ios (job_id,
-                                             engine_file_path,
-                                             is_input)
-                             VALUES (?, ?, ?)''',
-                                  (job_id, engine_path, True))
-
-                for engine_path in referenced_output_files:
-                    cursor.execute('''INSERT INTO ios (job_id,
+                cursor.executemany('''INSERT INTO ios (job_id,
                                              engine_file_path,
                                              is_input)
-                            VALUES (?, ?, ?)''',
-                                   (job_id, engine_path, False))
-
-                for temp_path_id in referenced_input_temp:
-                    cursor.execute('''INSERT INTO ios_tmp (job_id,
-                                             temp_path_id,
-                                             is_input)
                              VALUES (?, ?, ?)''',
-                                  (job_id, temp_path_id, True))
-
-                for temp_path_id in referenced_output_temp:
-                    cursor.execute('''INSERT INTO ios_tmp (job_id,
+                                   [(job_id, engine_path, is_input)
+                                    for engine_path, is_input in ios])
+                cursor.executemany('''INSERT INTO ios_tmp (job_id,
                                              temp_path_id,
                                              is_input)
                              VALUES (?, ?, ?)''',
-                                  (job_id, temp_path_id, False))
+                                   [(job_id, temp_path_id, is_input)
+                                    for temp_path_id, is_input in ios_tmp])
 
             except Exception as e:
                 if not external_cursor:
@@ -2207,9 +4612,101 @@ class WorkflowDatabaseServer(object):
                 connection.commit()
                 cursor.close()
                 connection.close()
+            if self._cache is not None:
+                self._cache.counts = None
 
         return engine_job
 
+    def _job_values(self, user_id, engine_job, expiration_date, cursor,
+                    login):
+        '''
+        Allocates the standard output and error files of a job, and returns
+        the values of its row in the jobs table (see JOB_INSERT_COLUMNS) and
+        its rows in the ios and ios_tmp tables.
+
+        Returns
+        -------
+        values: tuple
+        ios: list of (engine_path, is_input)
+        ios_tmp: list of (temp_path_id, is_input)
+        '''
+        parallel_config_name = None
+        max_node_number = 1
+        if engine_job.parallel_job_info:
+            parallel_config_name, max_node_number \
+                = engine_job.parallel_job_info
+        command_info = ""
+        for command_element in engine_job.plain_command():
+            command_info = command_info + " " + repr(command_element)
+
+        if not engine_job.plain_stdout():
+            engine_job.stdout_file = self.generate_file_path(
+                user_id, external_cursor=cursor, login=login)
+            engine_job.stderr_file = self.generate_file_path(
+                user_id, external_cursor=cursor, login=login)
+            custom_submission = False  # the std out and err file has to be removed with the job
+        else:
+            custom_submission = True  # the std out and err file won't to be removed with the job
+
+        ios = []
+        ios_tmp = []
+        for files, is_input in ((engine_job.referenced_input_files, True),
+                                (engine_job.referenced_output_files, False)):
+            for ft in files:
+                eft = engine_job.transfer_mapping[ft]
+                if isinstance(eft, FileTransfer):
+                    ios.append((eft.engine_path, is_input))
+                else:
+                    ios_tmp.append((eft.temp_path_id, is_input))
+
+        values = (user_id,
+
+                  None,  # drmaa_id
+                  expiration_date,
+                  constants.NOT_SUBMITTED,  # status
+                  datetime.now(),  # last_status_update
+                  engine_job.workflow_id,
+
+                  command_info,
+                  engine_job.plain_stdin(),
+                  engine_job.join_stderrout,
+                  engine_job.plain_stdout(),
+                  engine_job.plain_stderr(),
+                  engine_job.plain_working_directory(),
+                  custom_submission,
+                  parallel_config_name,
+                  max_node_number,
+                  engine_job.queue,
+
+                  engine_job.name,
+                  None,  # submission_date,
+                  None,  # execution_date,
+                  None,  # ending_date,
+                  None,  # exit_status,
+                  None,  # exit_value,
+                  None,  # terminating_signal,
+                  None,  # resource_usage,
+
+                  None)  # pickled_engine_job
+        return values, ios, ios_tmp
+
+    def _first_free_id(self, cursor, table, id_column='id'):
+        '''
+        Returns the first identifier which has never been used in a table
+        with an AUTOINCREMENT primary key, so that a block of rows can be
+        inserted with explicit identifiers. The cursor transaction must
+        already hold the database write lock.
+        '''
+        last_id = 0
+        for (last_id,) in cursor.execute(
+                'SELECT seq FROM sqlite_sequence WHERE name=?', [table]):
+            break
+        max_id = six.next(cursor.execute(
+            'SELECT max(%s) FROM %s' % (id_column, table)))[0]
+        if max_id is not None and max_id > last_id:
+            last_id = max_id
+        return last_id + 1
+
     def get_engine_job(self, job_id, user_id):
         '''
         Returns a EngineJob object.
@@ -2220,22 +4717,21 @@ class WorkflowDatabaseServer(object):
         @return: workflow object
         '''
         self.logger.debug("=> get_engine_job")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            self._check_job(connection, cursor, job_id, user_id)
-            try:
-                (pickled_job, workflow_id) = six.next(cursor.execute(
-                    '''SELECT
-                    pickled_engine_job,
-                    workflow_id
-                    FROM jobs WHERE id=?''', [job_id]))
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        self._check_job(connection, cursor, job_id, user_id)
+        try:
+            (pickled_job, workflow_id) = six.next(cursor.execute(
+                '''SELECT
+                pickled_engine_job,
+                workflow_id
+                FROM jobs WHERE id=?''', [job_id]))
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
 
         if pickled_job:
             pickled_job = pickled_job.encode('utf-8')
@@ -2274,8 +4770,9 @@ class WorkflowDatabaseServer(object):
             cursor.close()
             connection.commit()
             connection.close()
-            self.clean()
+        self.clean()
 
+    @write_behind
     def set_queue(self, queue_name, job_ids, wf_id=None):
         '''
         job_ids: list of job_id
@@ -2287,15 +4784,20 @@ class WorkflowDatabaseServer(object):
             connection = self._connect()
             cursor = connection.cursor()
             try:
+                if self._cache is not None:
+                    self._cache_jobs(cursor, job_ids)
                 if wf_id != None:
                     cursor.execute(
                         '''UPDATE workflows SET queue=? WHERE id=?''',
                         (queue_name, wf_id))
 
                 cursor.execute(
-                    '''UPDATE jobs SET queue=? WHERE id in (%s)'''
+                    '''UPDATE jobs SET queue=?,
+                    revision=(SELECT value FROM db_revision) + 1
+                    WHERE id in (%s)'''
                     % ','.join(['?'] * len(job_ids)),
                     list(itertools.chain((queue_name, ), job_ids)))
+                self._new_revision(cursor)
             except Exception as e:
                 connection.rollback()
                 cursor.close()
@@ -2304,7 +4806,10 @@ class WorkflowDatabaseServer(object):
             connection.commit()
             cursor.close()
             connection.close()
+            if self._cache is not None:
+                self._cache.set_jobs_queue(job_ids, queue_name)
 
+    @write_behind
     def set_jobs_status(self, job_status, force=False):
         '''
         job_status: dictionary: job_id -> status
@@ -2351,7 +4856,10 @@ class WorkflowDatabaseServer(object):
             cursor = connection.cursor()
             now = datetime.now()
             date_to_update = []
+            updated = []
             try:
+                if self._cache is not None:
+                    self._cache_jobs(cursor, jkeys)
                 for (job_id, status, previous_status, last_update,
                      execution_date, ending_date) in statuses:
                     do_update = force or \
@@ -2380,9 +4888,13 @@ class WorkflowDatabaseServer(object):
                         cursor.execute('''UPDATE jobs SET status=?,
                                             last_status_update=?,
                                             execution_date=?,
-                                            ending_date=? WHERE id=?''',
+                                            ending_date=?,
+                                            revision=(SELECT value
+                                                      FROM db_revision) + 1
+                                            WHERE id=?''',
                                        (status, now, execution_date,
                                         ending_date, job_id))
+                        updated.append((job_id, status))
                 if len(date_to_update) != 0:
                     # update last_status_update for all jobs which may
                     # become outdated
@@ -2399,6 +4911,8 @@ class WorkflowDatabaseServer(object):
                             % ','.join(['?'] * n),
                             [now] + date_to_update[chunk * nmax:
                                                    chunk * nmax + n])
+                if updated:
+                    self._new_revision(cursor)
             except Exception as e:
                 connection.rollback()
                 cursor.close()
@@ -2407,7 +4921,61 @@ class WorkflowDatabaseServer(object):
             connection.commit()
             cursor.close()
             connection.close()
+            if self._cache is not None:
+                for job_id, status in updated:
+                    self._cache.set_job_status(job_id, status, now)
+                for job_id in date_to_update:
+                    self._cache.set_job_date(job_id, now)
+
+    @write_behind
+    def refresh_jobs_status_date(self, job_ids=[], workflow_ids=[]):
+        '''
+        Sets the last_status_update date of jobs to now, without reading or
+        changing their status: this is a heartbeat telling that the jobs
+        status is up to date.
+
+        Parameters
+        ----------
+        job_ids: sequence of JobIdentifier
+            jobs to refresh
+        workflow_ids: sequence of WorkflowIdentifier
+            all the jobs of these workflows are refreshed
+        '''
+        self.logger.debug("=> refresh_jobs_status_date")
+        nmax = sqlite3_max_variable_number()
+        if nmax != 0:
+            nmax -= 1
+        with self._lock:
+            connection = self._connect()
+            cursor = connection.cursor()
+            now = datetime.now()
+            try:
+                for chunk in chunks(workflow_ids, nmax):
+                    cursor.execute(
+                        'UPDATE jobs SET last_status_update=? '
+                        'WHERE workflow_id IN (%s)'
+                        % ','.join(['?'] * len(chunk)), [now] + chunk)
+                for chunk in chunks(job_ids, nmax):
+                    cursor.execute(
+                        'UPDATE jobs SET last_status_update=? '
+                        'WHERE id IN (%s)'
+                        % ','.join(['?'] * len(chunk)), [now] + chunk)
+            except Exception as e:
+                connection.rollback()
+                cursor.close()
+                connection.close()
+                six.reraise(DatabaseError, DatabaseError(e),
+                            sys.exc_info()[2])
+            connection.commit()
+            cursor.close()
+            connection.close()
+            if self._cache is not None:
+                for wf_id in workflow_ids:
+                    self._cache.set_workflow_jobs_date(wf_id, now)
+                for job_id in job_ids:
+                    self._cache.set_job_date(job_id, now)
 
+    @write_behind
     def set_job_status(self, job_id, status, force=False):
         '''
         Updates the job status in the database.
@@ -2448,23 +5016,34 @@ class WorkflowDatabaseServer(object):
                     ending_date = datetime.now()
                     if not execution_date:
                         execution_date = datetime.now()
+            updated = False
             if force or \
                     (previous_status != constants.DELETE_PENDING and
                      previous_status != constants.KILL_PENDING):
+                now = datetime.now()
                 try:
+                    if self._cache is not None:
+                        self._cache_jobs(connection, [job_id])
                     connection.execute('''UPDATE jobs SET status=?,
                                           last_status_update=?,
                                           execution_date=?,
-                                          ending_date=? WHERE id=?''',
-                                  (status, datetime.now(),
+                                          ending_date=?,
+                                          revision=(SELECT value
+                                                    FROM db_revision) + 1
+                                          WHERE id=?''',
+                                  (status, now,
                                     execution_date, ending_date,
                                     job_id))
+                    self._new_revision(connection)
+                    updated = True
                 except Exception as e:
                     connection.rollback()
                     connection.close()
                     raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
             connection.commit()
             connection.close()
+            if updated and self._cache is not None:
+                self._cache.set_job_status(job_id, status, now)
 
     def get_job_status(self, job_id, user_id):
         '''
@@ -2474,29 +5053,34 @@ class WorkflowDatabaseServer(object):
         other user.
         '''
         self.logger.debug("=> get_job_status")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            self._check_job(connection, cursor, job_id, user_id)
-            try:
-                (status,
-                 strdate) = six.next(cursor.execute(
-                    '''SELECT status, last_status_update
-                    FROM jobs
-                    WHERE id=?''',
-                    [job_id]))
+        if self._cache is not None:
+            self._read_own_writes()
+            status = self._cache.job_status(job_id, user_id)
+            if status is not None:
+                return status
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        self._check_job(connection, cursor, job_id, user_id)
+        try:
+            (status,
+             strdate) = six.next(cursor.execute(
+                '''SELECT status, last_status_update
+                FROM jobs
+                WHERE id=?''',
+                [job_id]))
 
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-            status = self._string_conversion(status)
-            date = self._str_to_date_conversion(strdate)
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        status = self._string_conversion(status)
+        date = self._str_to_date_conversion(strdate)
+        cursor.close()
+        connection.close()
 
         return (status, date)
 
+    @write_behind
     def set_submission_information(self, drmaa_ids, submission_date):
         '''
         Set the submission information of the job and reset information
@@ -2510,7 +5094,10 @@ class WorkflowDatabaseServer(object):
         with self._lock:
             connection = self._connect()
             cursor = connection.cursor()
+            now = datetime.now()
             try:
+                if self._cache is not None:
+                    self._cache_jobs(cursor, list(drmaa_ids.keys()))
                 for job_id, drmaa_id in six.iteritems(drmaa_ids):
                     cursor.execute('''UPDATE jobs
                             SET drmaa_id=?,
@@ -2522,12 +5109,13 @@ class WorkflowDatabaseServer(object):
                                 terminating_signal=?,
                                 resource_usage=?,
                                 execution_date=?,
-                                ending_date=?
+                                ending_date=?,
+                                revision=(SELECT value FROM db_revision) + 1
                                 WHERE id=?''',
                                   (drmaa_id,
                                    submission_date,
                                    constants.UNDETERMINED,
-                                   datetime.now(),
+                                   now,
                                    None,
                                    None,
                                    None,
@@ -2535,6 +5123,8 @@ class WorkflowDatabaseServer(object):
                                    None,
                                    None,
                                    job_id))
+                if drmaa_ids:
+                    self._new_revision(cursor)
             except Exception as e:
                 connection.rollback()
                 cursor.close()
@@ -2543,6 +5133,10 @@ class WorkflowDatabaseServer(object):
             connection.commit()
             cursor.close()
             connection.close()
+            if self._cache is not None:
+                for job_id in drmaa_ids:
+                    self._cache.set_job_status(job_id, constants.UNDETERMINED,
+                                               now)
 
     def get_drmaa_job_id(self, job_id):
         '''
@@ -2554,26 +5148,25 @@ class WorkflowDatabaseServer(object):
         @return: DRMAA job identifier (job identifier on DRMS if submitted via DRMAA)
         '''
         self.logger.debug("=> get_drmaa_job_id")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            try:
-                sel = cursor.execute(
-                    'SELECT drmaa_id FROM jobs WHERE id=?',
-                    [job_id])
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
-            try:
-                drmaa_id = six.next(sel)[0]
-            except StopIteration:
-                drmaa_id = None
-
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            sel = cursor.execute(
+                'SELECT drmaa_id FROM jobs WHERE id=?',
+                [job_id])
+        except Exception as e:
             cursor.close()
             connection.close()
-            return drmaa_id
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+
+        try:
+            drmaa_id = six.next(sel)[0]
+        except StopIteration:
+            drmaa_id = None
+
+        cursor.close()
+        connection.close()
+        return drmaa_id
 
     def get_std_out_err_file_path(self, job_id, user_id):
         '''
@@ -2585,29 +5178,28 @@ class WorkflowDatabaseServer(object):
         @return: (stdout_file_path, stderr_file_path)
         '''
         self.logger.debug("=> get_std_out_err_file_path")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            try:
-                sel = cursor.execute(
-                    'SELECT stdout_file, stderr_file FROM jobs WHERE id=?',
-                    [job_id])
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
-            try:
-                result = six.next(sel)
-            except StopIteration:
-                cursor.close()
-                connection.close()
-                raise UnknownObjectError("The job id " + repr(job_id)
-                                         + " is not valid or does not belong "
-                                         "to user " + repr(user_id))
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            sel = cursor.execute(
+                'SELECT stdout_file, stderr_file FROM jobs WHERE id=?',
+                [job_id])
+        except Exception as e:
+            cursor.close()
+            connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
 
+        try:
+            result = six.next(sel)
+        except StopIteration:
             cursor.close()
             connection.close()
+            raise UnknownObjectError("The job id " + repr(job_id)
+                                     + " is not valid or does not belong "
+                                     "to user " + repr(user_id))
+
+        cursor.close()
+        connection.close()
         stdout_file_path = self._string_conversion(result[0])
         stderr_file_path = self._string_conversion(result[1])
         return (stdout_file_path, stderr_file_path)
@@ -2621,24 +5213,23 @@ class WorkflowDatabaseServer(object):
         @return: (exit_status, exit_value, terminating_signal, resource_usage)
         '''
         self.logger.debug("=> get_job_exit_info")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            self._check_job(connection, cursor, job_id, user_id)
-            try:
-                result = six.next(cursor.execute(
-                    '''SELECT exit_status,
-                              exit_value,
-                              terminating_signal,
-                              resource_usage
-                    FROM jobs WHERE id=?''',
-                    [job_id]))
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        self._check_job(connection, cursor, job_id, user_id)
+        try:
+            result = six.next(cursor.execute(
+                '''SELECT exit_status,
+                          exit_value,
+                          terminating_signal,
+                          resource_usage
+                FROM jobs WHERE id=?''',
+                [job_id]))
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
         exit_status = self._string_conversion(result[0])
         exit_value = result[1]
         terminating_signal = self._string_conversion(result[2])
@@ -2646,6 +5237,7 @@ class WorkflowDatabaseServer(object):
 
         return (exit_status, exit_value, terminating_signal, resource_usage)
 
+    @write_behind
     def set_jobs_exit_info(self, job_dict):
         self.logger.debug("=> set_jobs_exit_info")
         with self._lock:
@@ -2705,7 +5297,9 @@ class WorkflowDatabaseServer(object):
                 cursor.execute('''UPDATE jobs SET exit_status=?,
                                       exit_value=?,
                                       terminating_signal=?,
-                                      resource_usage=?
+                                      resource_usage=?,
+                                      revision=(SELECT value
+                                                FROM db_revision) + 1
                                       WHERE id=?''',
                               (exit_status,
                                 exit_value,
@@ -2713,6 +5307,7 @@ class WorkflowDatabaseServer(object):
                                 resource_usage,
                                 job_id)
                                 )
+                self._new_revision(cursor)
             except Exception as e:
                 if not external_cursor:
                     connection.rollback()
@@ -2774,27 +5369,26 @@ class WorkflowDatabaseServer(object):
             request = request + ")"
             argument = job_ids
 
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            result = {}
-            try:
-                for row in cursor.execute(request, argument):
-                    jid, name, command, submission_date = row
-                    result[jid] = (self._string_conversion(name),
-                                   self._string_conversion(command),
-                                   self._str_to_date_conversion(submission_date))
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        result = {}
+        try:
+            for row in cursor.execute(request, argument):
+                jid, name, command, submission_date = row
+                result[jid] = (self._string_conversion(name),
+                               self._string_conversion(command),
+                               self._str_to_date_conversion(submission_date))
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
 
-            return result
+        cursor.close()
+        connection.close()
 
-    def nb_running_jobs(self, user_id, queue_name=None):
+        return result
+
+    def nb_running_jobs(self, user_id, queue_name=None, cached=True):
         '''
         Returns the number of job of the user with the status
         constants.RUNNING or constants.QUEUED_ACTIVE in the queue queue_name.
@@ -2806,6 +5400,8 @@ class WorkflowDatabaseServer(object):
         ----------
         user_id: UserIdentifier
         queue_name: str or None
+        cached: bool
+            see nb_jobs()
 
         Returns
         -------
@@ -2813,9 +5409,10 @@ class WorkflowDatabaseServer(object):
         '''
         self.logger.debug("=> nb_running_jobs")
         return self.nb_jobs(user_id, queue_name,
-                            [constants.RUNNING, constants.QUEUED_ACTIVE])
+                            [constants.RUNNING, constants.QUEUED_ACTIVE],
+                            cached=cached)
 
-    def nb_queued_jobs(self, user_id, queue_name=None):
+    def nb_queued_jobs(self, user_id, queue_name=None, cached=True):
         '''
         Returns the number of job of the user with the status
         constants.QUEUED_ACTIVE in the queue queue_name.
@@ -2824,15 +5421,18 @@ class WorkflowDatabaseServer(object):
         ----------
         user_id: UserIdentifier
         queue_name: str or None
+        cached: bool
+            see nb_jobs()
 
         Returns
         -------
         number of jobs: int
         '''
         self.logger.debug("=> nb_queued_jobs")
-        return self.nb_jobs(user_id, queue_name, [constants.QUEUED_ACTIVE])
+        return self.nb_jobs(user_id, queue_name, [constants.QUEUED_ACTIVE],
+                            cached=cached)
 
-    def nb_jobs(self, user_id, queue_name, status):
+    def nb_jobs(self, user_id, queue_name, status, cached=True):
         '''
         Returns the number of job of the user with the given statuses
         in the queue queue_name.
@@ -2842,6 +5442,10 @@ class WorkflowDatabaseServer(object):
         user_id: UserIdentifier
         queue_name: str or None
         status: str among constants.JOB_STATUS, or list
+        cached: bool
+            if False, the number is counted in the database even if the
+            server has a status cache, to take into account the changes
+            made by others.
 
         Returns
         -------
@@ -2849,37 +5453,44 @@ class WorkflowDatabaseServer(object):
         '''
         if not isinstance(status, list) and not isinstance(status, tuple):
             status = [status]
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            try:
-                if queue_name != None:
-                    count = six.next(cursor.execute(
-                        "SELECT count(*) FROM jobs WHERE "
-                        "user_id=? and ( status=?"
-                        + " or status=?" * len(status) + ") "
-                        "and queue=?",
-                        [user_id,]
-                        + status
-                        + [constants.UNDETERMINED,
-                           queue_name]))[0]
-                else:
-                    count = six.next(cursor.execute(
-                        "SELECT count(*) FROM jobs WHERE "
-                        "user_id=? and ( status=?"
-                        + " or status=?" * len(status) + ") "
-                        "and queue ISNULL",
-                        [user_id,]
-                        + status
-                        + [constants.UNDETERMINED]))[0]
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
+        self._read_own_writes()
+        if self._cache is not None and cached:
+            if self._cache.counts is None:
+                self._load_jobs_counts()
+            count = self._cache.nb_jobs(
+                user_id, queue_name, set(list(status) + [constants.UNDETERMINED]))
+            if count is not None:
+                return count
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        try:
+            if queue_name != None:
+                count = six.next(cursor.execute(
+                    "SELECT count(*) FROM jobs WHERE "
+                    "user_id=? and ( status=?"
+                    + " or status=?" * len(status) + ") "
+                    "and queue=?",
+                    [user_id,]
+                    + status
+                    + [constants.UNDETERMINED,
+                       queue_name]))[0]
+            else:
+                count = six.next(cursor.execute(
+                    "SELECT count(*) FROM jobs WHERE "
+                    "user_id=? and ( status=?"
+                    + " or status=?" * len(status) + ") "
+                    "and queue ISNULL",
+                    [user_id,]
+                    + status
+                    + [constants.UNDETERMINED]))[0]
+        except Exception as e:
             cursor.close()
             connection.close()
-            return count
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+
+        cursor.close()
+        connection.close()
+        return count
 
     def jobs_to_delete_and_kill(self, user_id):
         '''
@@ -2890,30 +5501,29 @@ class WorkflowDatabaseServer(object):
         @returns: job with status constants.DELETE_PENDING
         '''
         self.logger.debug("=> jobs_to_delete_and_kill")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            job_to_delete_ids = []
-            job_to_kill_ids = []
-            try:
-                for row in cursor.execute("SELECT id FROM jobs "
-                                          "WHERE user_id=? AND status=?",
-                                          [user_id, constants.DELETE_PENDING]):
-                    jid = row[0]
-                    job_to_delete_ids.append(jid)
-                for row in cursor.execute("SELECT id FROM jobs "
-                                          "WHERE user_id=? AND status=?",
-                                          [user_id, constants.KILL_PENDING]):
-                    jid = row[0]
-                    job_to_kill_ids.append(jid)
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        job_to_delete_ids = []
+        job_to_kill_ids = []
+        try:
+            for row in cursor.execute("SELECT id FROM jobs "
+                                      "WHERE user_id=? AND status=?",
+                                      [user_id, constants.DELETE_PENDING]):
+                jid = row[0]
+                job_to_delete_ids.append(jid)
+            for row in cursor.execute("SELECT id FROM jobs "
+                                      "WHERE user_id=? AND status=?",
+                                      [user_id, constants.KILL_PENDING]):
+                jid = row[0]
+                job_to_kill_ids.append(jid)
+        except Exception as e:
             cursor.close()
             connection.close()
-            return (job_to_delete_ids, job_to_kill_ids)
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+
+        cursor.close()
+        connection.close()
+        return (job_to_delete_ids, job_to_kill_ids)
 
     # TRANSFERS
     def get_transfers(self, user_id, transfer_ids=None):
@@ -2945,30 +5555,29 @@ class WorkflowDatabaseServer(object):
             request = request + ")"
             argument = transfer_ids
 
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            result = {}
-            try:
-                for row in cursor.execute(request, argument):
-                    engine_file, client_file_path, expiration_date, client_paths = row
-                    engine_file = self._string_conversion(engine_file)
-                    if client_paths:
-                        client_paths = self._string_conversion(
-                            client_paths).split(file_separator)
-                    else:
-                        client_paths = None
-                    result[engine_file] = (
-                        self._string_conversion(client_file_path),
-                        self._str_to_date_conversion(
-                            expiration_date),
-                        client_paths)
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        result = {}
+        try:
+            for row in cursor.execute(request, argument):
+                engine_file, client_file_path, expiration_date, client_paths = row
+                engine_file = self._string_conversion(engine_file)
+                if client_paths:
+                    client_paths = self._string_conversion(
+                        client_paths).split(file_separator)
+                else:
+                    client_paths = None
+                result[engine_file] = (
+                    self._string_conversion(client_file_path),
+                    self._str_to_date_conversion(
+                        expiration_date),
+                    client_paths)
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
         return result
 
     def get_temporaries(self, user_id, temp_ids=None):
@@ -2998,24 +5607,23 @@ class WorkflowDatabaseServer(object):
             request = request + ")"
             argument = transfer_ids
 
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            result = {}
-            try:
-                for row in cursor.execute(request, argument):
-                    temp_path_id, engine_file, expiration_date = row
-                    if engine_file:
-                        engine_file = self._string_conversion(engine_file)
-                    result[temp_path_id] = (
-                        self._string_conversion(engine_file),
-                        self._str_to_date_conversion(expiration_date))
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        result = {}
+        try:
+            for row in cursor.execute(request, argument):
+                temp_path_id, engine_file, expiration_date = row
+                if engine_file:
+                    engine_file = self._string_conversion(engine_file)
+                result[temp_path_id] = (
+                    self._string_conversion(engine_file),
+                    self._str_to_date_conversion(expiration_date))
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
         return result
 
     # WORKFLOWS
@@ -3041,71 +5649,79 @@ class WorkflowDatabaseServer(object):
 
     def is_valid_workflow(self, wf_id, user_id):
         self.logger.debug("=> is_valid_workflow")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            last_status_update = None
-            try:
-                sel = cursor.execute(
-                    '''SELECT
-                    last_status_update
-                    FROM workflows
-                    WHERE id=?''',
-                    [wf_id])
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
-            try:
-                last_status_update = six.next(sel)[0]
-                valid = True
-            except StopIteration:
-                valid = False
-
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        last_status_update = None
+        try:
+            sel = cursor.execute(
+                '''SELECT
+                last_status_update
+                FROM workflows
+                WHERE id=?
+                UNION ALL
+                SELECT last_status_update
+                FROM archived_workflows
+                WHERE id=?''',
+                [wf_id, wf_id])
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+
+        try:
+            last_status_update = six.next(sel)[0]
+            valid = True
+        except StopIteration:
+            valid = False
 
-            last_status_update = self._str_to_date_conversion(
-                last_status_update)
+        cursor.close()
+        connection.close()
+
+        last_status_update = self._str_to_date_conversion(
+            last_status_update)
         return (valid, last_status_update)
 
     def get_workflows(self, user_id, workflow_ids=None):
         '''
         Returns information about the workflows owned by the user or
-        specified in the sequence workflow_ids
+        specified in the sequence workflow_ids, including the archived
+        workflows (see archive_workflows()).
 
         @type user_id: C{UserIdentifier}
         @rtype: sequence of workflows id
         '''
         self.logger.debug("=> get_workflows")
+        # the archived workflows are listed too
         if not workflow_ids:
-            request = "SELECT id, name, expiration_date FROM workflows WHERE user_id=?"
-            argument = [user_id]
+            requests = [("SELECT id, name, expiration_date FROM %s "
+                         "WHERE user_id=?" % table, [user_id])
+                        for table in ('workflows', 'archived_workflows')]
         else:
-            request = '''SELECT id, name, expiration_date
-                   FROM workflows WHERE id IN (? '''
-            for i in range(1, len(workflow_ids)):
-                request = request + ",? "
-            request = request + ")"
-            argument = workflow_ids
-
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            result = {}
+            requests = []
+            for chunk in chunks(workflow_ids):
+                in_chunk = ','.join(['?'] * len(chunk))
+                requests += [("SELECT id, name, expiration_date FROM %s "
+                              "WHERE id IN (%s)" % (table, in_chunk), chunk)
+                             for table in ('workflows',
+                                           'archived_workflows')]
+
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        result = {}
 
-            try:
+        try:
+            for request, argument in requests:
                 for row in cursor.execute(request, argument):
                     wf_id, name, expiration_date = row
-                    result[wf_id] = (self._string_conversion(name),
-                                     self._str_to_date_conversion(expiration_date))
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+                    result[wf_id] = (
+                        self._string_conversion(name),
+                        self._str_to_date_conversion(expiration_date))
+        except Exception as e:
             cursor.close()
             connection.close()
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+        cursor.close()
+        connection.close()
         return result
 
     def workflows_to_delete_and_kill(self, user_id):
@@ -3117,30 +5733,29 @@ class WorkflowDatabaseServer(object):
         @returns: workflows with status constants.DELETE_PENDING
         '''
         self.logger.debug("=> workflows_to_delete_and_kill")
-        with self._lock:
-            connection = self._connect()
-            cursor = connection.cursor()
-            wf_to_delete_ids = []
-            wf_to_kill_ids = []
-            try:
-                for row in cursor.execute("SELECT id FROM workflows "
-                                          "WHERE user_id=? AND status=?",
-                                          [user_id, constants.DELETE_PENDING]):
-                    wf_id = row[0]
-                    wf_to_delete_ids.append(wf_id)
-                for row in cursor.execute("SELECT id FROM workflows "
-                                          "WHERE user_id=? AND status=?",
-                                          [user_id, constants.KILL_PENDING]):
-                    wf_id = row[0]
-                    wf_to_kill_ids.append(wf_id)
-            except Exception as e:
-                cursor.close()
-                connection.close()
-                raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
-
+        connection = self._connect(read_only=True)
+        cursor = connection.cursor()
+        wf_to_delete_ids = []
+        wf_to_kill_ids = []
+        try:
+            for row in cursor.execute("SELECT id FROM workflows "
+                                      "WHERE user_id=? AND status=?",
+                                      [user_id, constants.DELETE_PENDING]):
+                wf_id = row[0]
+                wf_to_delete_ids.append(wf_id)
+            for row in cursor.execute("SELECT id FROM workflows "
+                                      "WHERE user_id=? AND status=?",
+                                      [user_id, constants.KILL_PENDING]):
+                wf_id = row[0]
+                wf_to_kill_ids.append(wf_id)
+        except Exception as e:
             cursor.close()
             connection.close()
-            return (wf_to_delete_ids, wf_to_kill_ids)
+            raise (DatabaseError, DatabaseError(e), sys.exc_info()[2])
+
+        cursor.close()
+        connection.close()
+        return (wf_to_delete_ids, wf_to_kill_ids)
 
 
     #
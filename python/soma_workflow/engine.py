@@ -24,8 +24,8 @@ import logging
 import stat
 import hashlib
 import operator
-import itertools
 import atexit
+import heapq
 import six
 
 # import cProfile
@@ -46,6 +46,27 @@ refreshment_interval = 1.  # seconds
 # if the last status update is older than the refreshment_timeout
 # the status is changed into WARNING
 refreshment_timeout = 90  # seconds
+# interval between two refreshments of the last status update date of the
+# jobs which status did not change. Must be shorter than refreshment_timeout.
+status_date_refreshment_interval = 30  # seconds
+# interval between two reconciliations of the numbers of running and queued
+# jobs of the limited queues, maintained by the engine loop, with the
+# database
+queue_counts_reconciliation_interval = 30  # seconds
+# maximum interval between two iterations of the engine loop when it is not
+# woken up by events (see WorkflowEngineLoop.notify()), with a scheduler
+# which notifies the job status changes. The loop then only polls as a
+# safety net.
+safety_sweep_interval = 10.  # seconds
+
+# contribution of the job status to the number of running (+queued) jobs
+# and to the number of queued jobs of a queue, as counted by
+# WorkflowDatabaseServer.nb_running_jobs() and nb_queued_jobs()
+_queue_count_increments = {
+    constants.RUNNING: (1, 0),
+    constants.QUEUED_ACTIVE: (1, 1),
+    constants.UNDETERMINED: (1, 1),
+}
 
 
 def _out_to_date(last_status_update):
@@ -85,6 +106,98 @@ class EngineLoopThread(threading.Thread):
         # print("Soma workflow engine thread ended nicely.")
 
 
+class PendingJobQueue(object):
+
+    '''
+    Jobs waiting to be submitted in a queue of the scheduler, taken by
+    decreasing priority, and in their arrival order for a same priority.
+
+    With fair_share, the jobs of the workflows which have jobs waiting are
+    interleaved (the standalone jobs count as one more workflow): the next
+    job is taken from the workflow which had the fewest jobs taken, so that
+    one large workflow cannot delay the others. The priority then only
+    orders the jobs of a same workflow.
+    '''
+
+    def __init__(self, fair_share=False):
+        self.fair_share = fair_share
+        # heap entries [-priority, arrival number, job or None if removed]
+        # dict job -> entry
+        self._entries = {}
+        # dict workflow id (or None without fair share) -> heap of entries
+        self._heaps = {}
+        # number of jobs taken from each workflow, since it has waiting
+        # jobs, dict workflow id -> int
+        self._taken = {}
+        # heap of [number of jobs taken, arrival number, workflow id] of
+        # the workflows with waiting jobs
+        self._workflows = []
+        self._arrivals = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, job):
+        return job in self._entries
+
+    def push(self, job):
+        self._arrivals += 1
+        entry = [-job.priority, self._arrivals, job]
+        self._entries[job] = entry
+        key = job.workflow_id if self.fair_share else None
+        heap = self._heaps.get(key)
+        if heap is None:
+            heap = self._heaps[key] = []
+            if self.fair_share:
+                # start on par with the workflows already waiting
+                taken = self._workflows[0][0] if self._workflows else 0
+                self._taken[key] = taken
+                heapq.heappush(self._workflows,
+                               [taken, self._arrivals, key])
+        heapq.heappush(heap, entry)
+
+    def pop(self):
+        '''
+        Remove and return the next job to submit.
+        '''
+        if not self._entries:
+            raise IndexError('pop from an empty PendingJobQueue')
+        while True:
+            if self.fair_share:
+                key = self._workflows[0][2]
+            else:
+                key = None
+            heap = self._heaps[key]
+            # skip the removed jobs
+            while heap and heap[0][2] is None:
+                heapq.heappop(heap)
+            if heap:
+                break
+            self._drop(key)
+        job = heapq.heappop(heap)[2]
+        del self._entries[job]
+        if self.fair_share:
+            self._taken[key] += 1
+            if heap:
+                self._arrivals += 1
+                heapq.heapreplace(self._workflows,
+                                  [self._taken[key], self._arrivals, key])
+            else:
+                self._drop(key)
+        elif not heap:
+            del self._heaps[key]
+        return job
+
+    def remove(self, job):
+        self._entries.pop(job)[2] = None
+
+    def _drop(self, key):
+        del self._heaps[key]
+        if self.fair_share:
+            del self._taken[key]
+            heapq.heappop(self._workflows)
+
+
 class WorkflowEngineLoop(object):
 
     # jobs managed by the current engine process instance.
@@ -116,12 +229,41 @@ class WorkflowEngineLoop(object):
     # Submission pending queues.
     # For each limited queue, a submission pending queue is needed to store the
     # jobs that couldn't be submitted.
-    # Dictionary queue name (str) => pending jobs (list)
+    # Dictionary queue name (str) => pending jobs (PendingJobQueue)
     _pending_queues = None
+    # share the submissions between the workflows (see PendingJobQueue)
+    _fair_share = None
+    # Numbers of running (+queued) and queued jobs of the user in the
+    # limited queues, loaded from the database and kept up to date with the
+    # job status changes written by the loop.
+    # Dictionary queue name (str) => [nb running jobs, nb queued jobs],
+    # None if unknown
+    _queue_counts = None
+    # last reconciliation of _queue_counts with the database (datetime)
+    _queue_counts_date = None
     # boolean
     _running = None
-    # boolean
-    _j_wf_ended = None
+    # database revision of the last transfer status update
+    # (see WorkflowDatabaseServer.get_transfers_changes)
+    _transfers_revision = None
+    # last refreshment of the jobs last status update date (datetime)
+    _status_date_refreshment = None
+    # events which occurred since the loop last woke up (list of str, see
+    # notify())
+    _events = None
+    # threading.Condition notified with the events
+    _wakeup = None
+    # jobs submitted to the scheduler which did not end yet, which status
+    # is followed using Scheduler.poll_changes()
+    # dict scheduler job id -> EngineJob
+    _scheduler_jobs = None
+    # jobs which status was changed by the loop since the last database
+    # update, dict job id -> EngineJob
+    _dirty_jobs = None
+    # transfers and temporary paths of the managed workflows
+    # dict engine path or temporary path id -> EngineTransfer or
+    # EngineTemporaryPath
+    _transfers = None
 
     _lock = None
 
@@ -132,7 +274,8 @@ class WorkflowEngineLoop(object):
                  scheduler,
                  path_translation=None,
                  queue_limits={},
-                 running_jobs_limits={}):
+                 running_jobs_limits={},
+                 fair_share=False):
 
         self.logger = logging.getLogger('engine.WorkflowEngineLoop')
 
@@ -154,6 +297,20 @@ class WorkflowEngineLoop(object):
             'running_jobs_limits ' + repr(self._running_jobs_limits))
 
         self._pending_queues = {}
+        self._fair_share = fair_share
+
+        self._scheduler_jobs = {}
+        self._dirty_jobs = {}
+        self._transfers = {}
+
+        self._queue_counts = None
+
+        self._submission_metrics = {'jobs': 0, 'errors': 0, 'batches': 0,
+                                    'time': 0., 'last_rate': None}
+
+        self._transfers_revision = 0
+
+        self._status_date_refreshment = datetime.now()
 
         # The running flag is set to True at the beginning, not in start_loop(),
         # to overcome race conditions which may occur in this situation:
@@ -182,19 +339,63 @@ class WorkflowEngineLoop(object):
         self._user_login = userLogin
         self.logger.debug("user_id : " + repr(self._user_id))
 
-        self._j_wf_ended = True
-
         self._lock = threading.RLock()
 
+        self._events = []
+        self._wakeup = threading.Condition(threading.Lock())
+        if self._scheduler is not None:
+            self._scheduler.add_status_changes_callback(
+                self._scheduler_status_changed)
+
     def are_jobs_and_workflow_done(self):
         with self._lock:
             ended = len(self._jobs) == 0 and len(self._workflows) == 0
             return ended
 
+    def notify(self, event=None):
+        '''
+        Wake up the loop, which processes the event without waiting for
+        the end of the time interval.
+
+        * event *string*
+            event description, for the logs
+        '''
+        with self._wakeup:
+            self._events.append(event)
+            self._wakeup.notify()
+
+    def _scheduler_status_changed(self):
+        self.notify('scheduler')
+
+    def _wait_for_events(self, time_interval):
+        '''
+        Wait until an event occurs (see notify()), or at most time_interval
+        seconds if the scheduler has to be polled, or safety_sweep_interval
+        seconds if it notifies the job status changes.
+
+        * returns: *list of string*
+            the events
+        '''
+        if self._scheduler is not None \
+                and self._scheduler.notifies_status_changes:
+            time_interval = max(time_interval, safety_sweep_interval)
+        with self._wakeup:
+            if not self._events and self._running:
+                self._wakeup.wait(time_interval)
+            events = self._events
+            self._events = []
+        return events
+
     def start_loop(self, time_interval):
         '''
         Start the workflow engine loop. The loop will run until stop() is
         called.
+
+        Each iteration processes the jobs and workflows, then the loop
+        waits for events (see notify()): jobs status changes, submissions,
+        deletions, ended transfers... Without events, it iterates every
+        time_interval seconds, or every safety_sweep_interval seconds if the
+        scheduler notifies the job status changes.
         '''
         # one_wf_processed = False
         # Modif: don't set the running flag here, because the loop may be
@@ -203,18 +404,20 @@ class WorkflowEngineLoop(object):
         # get here (typically in a secondary thread)
         # self._running = True
 
-        drms_error_jobs = {}
+        # jobs which ended out of the scheduler status update (step 2): DRMS
+        # errors, barrier jobs... They are processed by the next iteration.
+        ended_out_of_poll = {}
         idle_cmpt = 0
         while True:
             if not self._running:
                 break
             with self._lock:
-                ended_jobs = drms_error_jobs  # {}
+                ended_jobs = ended_out_of_poll
                 wf_to_inspect = set()  # set of workflow id
-                for job in six.itervalues(drms_error_jobs):
+                for job in six.itervalues(ended_out_of_poll):
                     if job.workflow_id != -1:
                         wf_to_inspect.add(job.workflow_id)
-                drms_error_jobs = {}
+                ended_out_of_poll = {}
 
                 if not (len(self._jobs) == 0 and len(self._workflows) == 0):
                     idle_cmpt = 0
@@ -256,11 +459,17 @@ class WorkflowEngineLoop(object):
                             self.logger.debug("Delete job : " + repr(job_id))
                             self._database_server.delete_job(job_id)
                             del self._jobs[job_id]
+                            self._dirty_jobs.pop(job_id, None)
+                            self._queue_counts = None
                         else:
                             job = self._jobs[job_id]
                             self._database_server.set_job_status(job_id,
                                                                  job.status,
                                                                  force=True)
+                            self._count_status_change(job.queue,
+                                                      job.db_status,
+                                                      job.status)
+                            job.db_status = job.status
                             if stopped:
                                 ended_jobs[job_id] = self._jobs[job_id]
                                 if job.workflow_id != -1:
@@ -274,7 +483,8 @@ class WorkflowEngineLoop(object):
                             self.logger.debug(
                                 "Delete workflow : " + repr(wf_id))
                             self._database_server.delete_workflow(wf_id)
-                            del self._workflows[wf_id]
+                            self._unmanage_workflow(wf_id)
+                            self._queue_counts = None
                         else:
                             ended_jobs.update(ended_jobs_in_wf)
                             wf_to_inspect.add(wf_id)
@@ -282,92 +492,107 @@ class WorkflowEngineLoop(object):
                 # --- 2. Update job status from the scheduler -----------------
                 # get back the termination status and terminate the jobs which
                 # ended
-                wf_jobs = {}
-                wf_transfers = {}
-                for wf in six.itervalues(self._workflows):
-                    # one_wf_processed = True
-                    # TBI add a condition on the workflow status
-                    wf_jobs.update(wf.registered_jobs)
-                    wf_transfers.update(wf.registered_tr)
-
-                for job in itertools.chain(six.itervalues(self._jobs),
-                                           six.itervalues(wf_jobs)):
-                    if job.exit_status == None and job.drmaa_id != None:
-                        try:
-                            job.status = self._scheduler.get_job_status(
+                # only the jobs which status changed are processed
+                if self._scheduler_jobs:
+                    (status_changes, status_errors) \
+                        = self._scheduler.poll_changes(self._scheduler_jobs)
+                else:
+                    status_changes = status_errors = {}
+                for drmaa_id, e in six.iteritems(status_errors):
+                    job = self._scheduler_jobs.pop(drmaa_id, None)
+                    if job is None:
+                        continue
+                    self.logger.debug(
+                        "!!!ERROR!!! get_job_status %s: %s" % (type(e), e))
+                    job.status = constants.FAILED
+                    job.exit_status = constants.EXIT_ABORTED
+                    stderr_file = open(job.stderr_file, "wa")
+                    stderr_file.write(
+                        "Error while requesting the job status %s: %s \nWarning: the job may still be running.\n" % (type(e), e))
+                    stderr_file.close()
+                    ended_out_of_poll[job.job_id] = job
+                    self._dirty_jobs[job.job_id] = job
+                for drmaa_id, status in six.iteritems(status_changes):
+                    job = self._scheduler_jobs.get(drmaa_id)
+                    if job is None:
+                        # not followed any longer (killed, deleted...)
+                        continue
+                    job.status = status
+                    self._dirty_jobs[job.job_id] = job
+                    self.logger.debug(
+                        "job " + repr(job.job_id) + " : " + job.status)
+                    if job.status == constants.DONE \
+                            or job.status == constants.FAILED:
+                        self.logger.debug(
+                            "End of job %s, drmaaJobId = %s, status= %s",
+                            job.job_id, job.drmaa_id, repr(job.status))
+                        del self._scheduler_jobs[drmaa_id]
+                        (job.exit_status,
+                         job.exit_value,
+                         job.terminating_signal,
+                         job.str_rusage) \
+                            = self._scheduler.get_job_exit_info(
                                 job.drmaa_id)
-                        except DRMError as e:
-                            self.logger.debug(
-                                "!!!ERROR!!! get_job_status %s: %s" % (type(e), e))
-                            job.status = constants.FAILED
-                            job.exit_status = constants.EXIT_ABORTED
-                            stderr_file = open(job.stderr_file, "wa")
-                            stderr_file.write(
-                                "Error while requesting the job status %s: %s \nWarning: the job may still be running.\n" % (type(e), e))
-                            stderr_file.close()
-                            drms_error_jobs[job.job_id] = job
+
+                        self.logger.debug("  after get_job_exit_info ")
                         self.logger.debug(
-                            "job " + repr(job.job_id) + " : " + job.status)
-                        if job.status == constants.DONE \
-                                or job.status == constants.FAILED:
-                            self.logger.debug(
-                                "End of job %s, drmaaJobId = %s, status= %s",
-                                job.job_id, job.drmaa_id, repr(job.status))
-                            (job.exit_status,
-                             job.exit_value,
-                             job.terminating_signal,
-                             job.str_rusage) \
-                                = self._scheduler.get_job_exit_info(
-                                    job.drmaa_id)
-
-                            self.logger.debug("  after get_job_exit_info ")
-                            self.logger.debug(
-                                "  => exit_status " + repr(job.exit_status))
-                            self.logger.debug(
-                                "  => exit_value " + repr(job.exit_value))
-                            self.logger.debug(
-                                "  => signal " + repr(job.terminating_signal))
-                            self.logger.debug(
-                                "  => rusage " + repr(job.str_rusage))
-
-                            if job.workflow_id != -1:
-                                wf_to_inspect.add(job.workflow_id)
-                            if job.status == constants.DONE:
-                                for ft in job.referenced_output_files:
-                                    if isinstance(ft, FileTransfer):
-                                        engine_path = job.transfer_mapping[
-                                            ft].engine_path
-                                        self._database_server.set_transfer_status(
-                                            engine_path,
-                                            constants.FILES_ON_CR)
-                                    else:
-                                        # TemporaryPath
-                                        temp_path_id = job.transfer_mapping[
-                                            ft].temp_path_id
-                                        self._database_server.set_temporary_status(
-                                            temp_path_id,
-                                            constants.FILES_ON_CR)
-
-                            ended_jobs[job.job_id] = job
-                            self.logger.debug(
-                                "  => exit_status " + repr(job.exit_status))
-                            self.logger.debug(
-                                "  => exit_value " + repr(job.exit_value))
-                            self.logger.debug(
-                                "  => signal " + repr(job.terminating_signal))
+                            "  => exit_status " + repr(job.exit_status))
+                        self.logger.debug(
+                            "  => exit_value " + repr(job.exit_value))
+                        self.logger.debug(
+                            "  => signal " + repr(job.terminating_signal))
+                        self.logger.debug(
+                            "  => rusage " + repr(job.str_rusage))
+
+                        if job.workflow_id != -1:
+                            wf_to_inspect.add(job.workflow_id)
+                        if job.status == constants.DONE:
+                            for ft in job.referenced_output_files:
+                                if isinstance(ft, FileTransfer):
+                                    engine_path = job.transfer_mapping[
+                                        ft].engine_path
+                                    self._database_server.set_transfer_status(
+                                        engine_path,
+                                        constants.FILES_ON_CR)
+                                else:
+                                    # TemporaryPath
+                                    temp_path_id = job.transfer_mapping[
+                                        ft].temp_path_id
+                                    self._database_server.set_temporary_status(
+                                        temp_path_id,
+                                        constants.FILES_ON_CR)
+
+                        ended_jobs[job.job_id] = job
+                        self.logger.debug(
+                            "  => exit_status " + repr(job.exit_status))
+                        self.logger.debug(
+                            "  => exit_value " + repr(job.exit_value))
+                        self.logger.debug(
+                            "  => signal " + repr(job.terminating_signal))
 
                 # --- 3. Get back transfered status ---------------------------
-                for engine_path, transfer in six.iteritems(wf_transfers):
-                    status = self._database_server.get_transfer_status(
-                        engine_path,
-                        self._user_id)
-                    transfer.status = status
-
-                for wf_id in six.iterkeys(self._workflows):
-                    if self._database_server.pop_workflow_ended_transfer(wf_id):
-                        self.logger.debug(
-                            "ended transfer for the workflow " + repr(wf_id))
-                        wf_to_inspect.add(wf_id)
+                # only the transfers which changed since the last loop are
+                # read back
+                if self._transfers:
+                    (self._transfers_revision, transfers_status) \
+                        = self._database_server.get_transfers_changes(
+                            list(self._workflows.keys()),
+                            self._transfers_revision, self._user_id)
+                    for engine_path, status in six.iteritems(
+                            transfers_status):
+                        if engine_path in self._transfers:
+                            self._transfers[engine_path].status = status
+
+                # a single query for the ended transfers of all workflows
+                wf_ended_transfers = {}
+                if self._workflows:
+                    wf_ended_transfers = \
+                        self._database_server.pop_workflows_ended_transfers(
+                            list(self._workflows.keys()))
+                for wf_id in wf_ended_transfers:
+                    self.logger.debug(
+                        "ended transfer for the workflow " + repr(wf_id))
+                    wf_to_inspect.add(wf_id)
 
                 # --- 4. Inspect workflows ------------------------------------
                 self.logger.debug("wf_to_inspect " + repr(wf_to_inspect))
@@ -382,6 +607,7 @@ class WorkflowEngineLoop(object):
                         "NEW status wf " + repr(wf_id) + " " + repr(status))
                     # jobs_to_run.extend(to_run)
                     ended_jobs.update(aborted_jobs)
+                    self._dirty_jobs.update(aborted_jobs)
                     for job in to_run:
                         self._pend_for_submission(job)
 
@@ -391,12 +617,22 @@ class WorkflowEngineLoop(object):
                 self.logger.debug("jobs_to_run=" + repr(jobs_to_run))
                 self.logger.debug("len(jobs_to_run)=" + repr(len(jobs_to_run)))
 
-                # --- 6. Submit jobs ------------------------------------------
+            # --- 6. Submit jobs ----------------------------------------------
+            # the engine lock is released during the submissions, which may be
+            # slow round trips to the batch system
+            submissions = self._submit_jobs(jobs_to_run)
+
+            with self._lock:
                 drmaa_id_for_db_up = {}
-                for job in jobs_to_run:
-                    try:
-                        job.drmaa_id = self._scheduler.job_submission(job)
-                    except DRMError as e:
+                for job, (drmaa_id, e) in zip(jobs_to_run, submissions):
+                    if not self._is_still_submitted(job):
+                        # stopped, deleted or restarted during the submission
+                        if e is None:
+                            self._kill_submission(job, drmaa_id)
+                        continue
+                    if e is not None:
+                        if not isinstance(e, DRMError):
+                            raise e
                         # Resubmission ?
                         # if job.queue in self._pending_queues:
                         #  self._pending_queues[job.queue].insert(0, job)
@@ -412,10 +648,26 @@ class WorkflowEngineLoop(object):
                         stderr_file.write(
                             "Error while submitting the job %s: %s\n" % (type(e), e))
                         stderr_file.close()
-                        drms_error_jobs[job.job_id] = job
+                        ended_out_of_poll[job.job_id] = job
+                    elif job.is_barrier and job.status == constants.DONE:
+                        # not run by the scheduler, which may give the same id
+                        # to all the barrier jobs: they are not followed, and
+                        # end with the next iteration
+                        job.drmaa_id = drmaa_id
+                        drmaa_id_for_db_up[job.job_id] = job.drmaa_id
+                        (job.exit_status,
+                         job.exit_value,
+                         job.terminating_signal,
+                         job.str_rusage) = (constants.FINISHED_REGULARLY, 0,
+                                            None, None)
+                        ended_out_of_poll[job.job_id] = job
+                        self.notify('barrier job')
                     else:
+                        job.drmaa_id = drmaa_id
                         drmaa_id_for_db_up[job.job_id] = job.drmaa_id
                         job.status = constants.UNDETERMINED
+                        self._scheduler_jobs[job.drmaa_id] = job
+                    self._dirty_jobs[job.job_id] = job
 
                 if drmaa_id_for_db_up:
                     self._database_server.set_submission_information(
@@ -426,13 +678,14 @@ class WorkflowEngineLoop(object):
                 ended_job_ids = []
                 ended_wf_ids = []
                 self.logger.debug("update job and wf status ~~~~~~~~~~~~~~~ ")
+                # only the jobs which status changed since the last update are
+                # sent to the database
                 job_status_for_db_up = {}
-                for job_id, job in itertools.chain(six.iteritems(self._jobs),
-                                                   six.iteritems(wf_jobs)):
-                    job_status_for_db_up[job_id] = job.status
-                    self._j_wf_ended = self._j_wf_ended and \
-                        (job.status == constants.DONE or
-                         job.status == constants.FAILED)
+                dirty_jobs = self._dirty_jobs
+                self._dirty_jobs = {}
+                for job_id, job in six.iteritems(dirty_jobs):
+                    if job.status != job.db_status:
+                        job_status_for_db_up[job_id] = job.status
                     if job_id in self._jobs and \
                         (job.status == constants.DONE or
                          job.status == constants.FAILED):
@@ -442,45 +695,145 @@ class WorkflowEngineLoop(object):
 
                 if job_status_for_db_up:
                     self._database_server.set_jobs_status(job_status_for_db_up)
+                    for job_id, status in six.iteritems(job_status_for_db_up):
+                        job = dirty_jobs[job_id]
+                        self._count_status_change(job.queue, job.db_status,
+                                                  status)
+                        job.db_status = status
+
+                # the jobs which status did not change just get a new last
+                # status update date from time to time
+                now = datetime.now()
+                if now - self._status_date_refreshment \
+                        > timedelta(seconds=status_date_refreshment_interval):
+                    self._database_server.refresh_jobs_status_date(
+                        list(self._jobs.keys()), list(self._workflows.keys()))
+                    self._status_date_refreshment = now
 
                 if len(ended_jobs):
                     self._database_server.set_jobs_exit_info(ended_jobs)
 
+                wf_status_for_db_up = {}
+                forced_wf_status_for_db_up = {}
                 for wf_id, workflow in six.iteritems(self._workflows):
-                    force = False
                     if wf_id in wf_to_kill + wf_to_delete:
-                        force = True
-                    self.logger.debug("set workflow status for: %s, status: %s"
-                        % (wf_id, workflow.status))
-                    self._database_server.set_workflow_status(
-                        wf_id, workflow.status,
-                        force=force)
+                        forced_wf_status_for_db_up[wf_id] = workflow.status
+                    else:
+                        wf_status_for_db_up[wf_id] = workflow.status
                     if workflow.status == constants.WORKFLOW_DONE:
                         ended_wf_ids.append(wf_id)
                     self.logger.debug(
                         "wf " + repr(wf_id) + " " + repr(workflow.status))
+                if wf_status_for_db_up:
+                    self._database_server.set_workflows_status(
+                        wf_status_for_db_up)
+                if forced_wf_status_for_db_up:
+                    self._database_server.set_workflows_status(
+                        forced_wf_status_for_db_up, force=True)
                 self.logger.debug("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ")
 
                 for job_id in ended_job_ids:
                     del self._jobs[job_id]
                 for wf_id in ended_wf_ids:
-                    del self._workflows[wf_id]
+                    self._unmanage_workflow(wf_id)
 
             # if len(self._workflows) == 0 and one_wf_processed:
             #  break
-            time.sleep(time_interval)
+            events = self._wait_for_events(time_interval)
+            if events:
+                self.logger.debug("events: " + repr(events))
 
     def stop_loop(self):
         with self._lock:
             self._running = False
+        self.notify('stop')
+
+    def _submit_jobs(self, jobs):
+        '''
+        Submit the jobs to the scheduler, and record the submission metrics.
+        Must be called without holding the engine lock.
+
+        * jobs *list of EngineJob*
+        * return: *list of tuple*
+            (scheduler_job_id, error) for each job, see
+            Scheduler.job_submissions()
+        '''
+        if not jobs:
+            return []
+        start = time.time()
+        submissions = self._scheduler.job_submissions(jobs)
+        duration = time.time() - start
+        errors = len([e for drmaa_id, e in submissions if e is not None])
+        rate = len(jobs) / duration if duration > 0 else None
+        with self._lock:
+            metrics = self._submission_metrics
+            metrics['jobs'] += len(jobs)
+            metrics['errors'] += errors
+            metrics['batches'] += 1
+            metrics['time'] += duration
+            metrics['last_rate'] = rate
+        self.logger.debug("%d jobs submitted in %.3f s (%d errors)"
+                          % (len(jobs), duration, errors))
+        return submissions
+
+    def _is_still_submitted(self, job):
+        '''
+        Tells if a job submitted without holding the engine lock is still
+        managed and waiting for its submission, that is if it was not
+        stopped, deleted or restarted meanwhile.
+        '''
+        if job.workflow_id == -1:
+            if self._jobs.get(job.job_id) is not job:
+                return False
+        else:
+            workflow = self._workflows.get(job.workflow_id)
+            if workflow is None \
+                    or workflow.registered_jobs.get(job.job_id) is not job:
+                return False
+        if job.queue in self._pending_queues \
+                and job in self._pending_queues[job.queue]:
+            # pending again for a new submission
+            return False
+        return job.status == constants.SUBMISSION_PENDING \
+            or (job.is_barrier and job.status == constants.DONE)
+
+    def _kill_submission(self, job, drmaa_id):
+        self.logger.debug("Kill job " + repr(job.job_id) + " drmaa id: "
+                          + repr(drmaa_id) + " stopped during submission")
+        try:
+            self._scheduler.kill_job(drmaa_id)
+        except DRMError as e:
+            self.logger.error("!!!ERROR!!! %s:%s" % (type(e), e))
+
+    def submission_metrics(self):
+        '''
+        Job submission metrics since the engine loop creation (dict):
+
+        * jobs: number of submitted jobs, including the failed submissions
+        * errors: number of failed submissions
+        * batches: number of submission stages (loop iterations which
+          submitted jobs)
+        * time: total duration of these stages, in seconds
+        * rate: mean submission rate, in jobs per second
+        * last_rate: submission rate of the last stage, in jobs per second
+
+        The rates are None until jobs were submitted.
+        '''
+        with self._lock:
+            metrics = dict(self._submission_metrics)
+        metrics['rate'] = metrics['jobs'] / metrics['time'] \
+            if metrics['time'] > 0 else None
+        return metrics
 
     def set_queue_limits(self, queue_limits):
         with self._lock:
             self._queue_limits = queue_limits
+            self._queue_counts = None
 
     def set_running_jobs_limits(self, running_jobs_limits):
         with self._lock:
             self._running_jobs_limits = running_jobs_limits
+            self._queue_counts = None
 
     def add_job(self, client_job, queue, container_command=None):
         # register
@@ -491,6 +844,7 @@ class WorkflowEngineLoop(object):
 
         engine_job = self._database_server.add_job(self._user_id, engine_job,
                                                    login=self._user_login)
+        engine_job.db_status = constants.NOT_SUBMITTED
 
         # create standard output files
         try:
@@ -524,6 +878,7 @@ class WorkflowEngineLoop(object):
         # add to the engine managed job list
         with self._lock:
             self._jobs[engine_job.job_id] = engine_job
+        self.notify('job submission')
 
         return engine_job
 
@@ -534,14 +889,62 @@ class WorkflowEngineLoop(object):
         first stored in _pending_queues waiting to be submitted.
         '''
         with self._lock:
-            if engine_job.queue in self._pending_queues:
-                self._pending_queues[engine_job.queue].append(engine_job)
-                self._pending_queues[engine_job.queue].sort(
-                    key=lambda job: job.priority,
-                    reverse=True)
-            else:
-                self._pending_queues[engine_job.queue] = [engine_job]
+            pending_queue = self._pending_queues.get(engine_job.queue)
+            if pending_queue is None:
+                pending_queue = PendingJobQueue(self._fair_share)
+                self._pending_queues[engine_job.queue] = pending_queue
+            pending_queue.push(engine_job)
             engine_job.status = constants.SUBMISSION_PENDING
+            self._dirty_jobs[engine_job.job_id] = engine_job
+
+    def _queue_count(self, queue_name):
+        '''
+        Returns the numbers of running (+queued) and queued jobs of the user
+        in the queue, [nb_running_jobs, nb_queued_jobs].
+
+        They are read from the database the first time, then maintained from
+        the job status changes written by the loop (see
+        _count_status_change()), and read again every
+        queue_counts_reconciliation_interval seconds to take into account
+        the changes made by others.
+        '''
+        now = datetime.now()
+        if self._queue_counts is None or \
+                now - self._queue_counts_date \
+                > timedelta(seconds=queue_counts_reconciliation_interval):
+            self._queue_counts = {}
+            self._queue_counts_date = now
+        count = self._queue_counts.get(queue_name)
+        if count is None:
+            # counted in the database: the status cache of the server would
+            # not see the changes made by others
+            count = [self._database_server.nb_running_jobs(self._user_id,
+                                                           queue_name,
+                                                           cached=False),
+                     self._database_server.nb_queued_jobs(self._user_id,
+                                                          queue_name,
+                                                          cached=False)]
+            self._queue_counts[queue_name] = count
+        return count
+
+    def _count_status_change(self, queue_name, previous_status, status):
+        '''
+        Updates the numbers of jobs of the queue when the status of one of
+        its jobs changes in the database from previous_status to status.
+        '''
+        if self._queue_counts is None \
+                or queue_name not in self._queue_counts:
+            return
+        if previous_status is None:
+            # the status in the database was unknown: read the counts again
+            self._queue_counts = None
+            return
+        previous = _queue_count_increments.get(previous_status, (0, 0))
+        new = _queue_count_increments.get(status, (0, 0))
+        if previous != new:
+            count = self._queue_counts[queue_name]
+            count[0] += new[0] - previous[0]
+            count[1] += new[1] - previous[1]
 
     def _get_pending_job_to_submit(self):
         '''
@@ -552,9 +955,7 @@ class WorkflowEngineLoop(object):
         for queue_name, jobs in six.iteritems(self._pending_queues):
             if jobs and queue_name in self._running_jobs_limits:
                 self.logger.debug("queue " + repr(queue_name) + " is limited: " + repr(self._running_jobs_limits[queue_name]))
-                nb_running_jobs = self._database_server.nb_running_jobs(
-                    self._user_id,
-                    queue_name)
+                nb_running_jobs = self._queue_count(queue_name)[0]
                 nb_jobs_to_run = self._running_jobs_limits[
                     queue_name] - nb_running_jobs
                 # limit also queue length
@@ -567,23 +968,21 @@ class WorkflowEngineLoop(object):
                                   + repr(nb_jobs_to_run))
                 while nb_jobs_to_run > 0 and \
                         len(self._pending_queues[queue_name]) > 0:
-                    to_run.append(self._pending_queues[queue_name].pop(0))
+                    to_run.append(self._pending_queues[queue_name].pop())
                     nb_jobs_to_run = nb_jobs_to_run - 1
             elif jobs and queue_name in self._queue_limits:
-                nb_queued_jobs = self._database_server.nb_queued_jobs(
-                    self._user_id,
-                    queue_name)
+                nb_queued_jobs = self._queue_count(queue_name)[1]
                 nb_jobs_to_run = self._queue_limits[
                     queue_name] - nb_queued_jobs
                 self.logger.debug("queue " + repr(queue_name) + " nb_queued_jobs " + repr(
                     nb_queued_jobs) + " nb_jobs_to_run " + repr(nb_jobs_to_run))
                 while nb_jobs_to_run > 0 and \
                         len(self._pending_queues[queue_name]) > 0:
-                    to_run.append(self._pending_queues[queue_name].pop(0))
+                    to_run.append(self._pending_queues[queue_name].pop())
                     nb_jobs_to_run = nb_jobs_to_run - 1
             else:
-                to_run.extend(jobs)
-                self._pending_queues[queue_name] = []
+                while jobs:
+                    to_run.append(jobs.pop())
         # self.logger.debug("to_run " + repr(to_run))
         return to_run
 
@@ -608,6 +1007,8 @@ class WorkflowEngineLoop(object):
 
         engine_workflow = self._database_server.add_workflow(
             self._user_id, engine_workflow, login=self._user_login)
+        for job in six.itervalues(engine_workflow.registered_jobs):
+            job.db_status = constants.NOT_SUBMITTED
 
         for job in six.itervalues(engine_workflow.job_mapping):
             try:
@@ -649,7 +1050,8 @@ class WorkflowEngineLoop(object):
             self._pend_for_submission(job)
         # add to the engine managed workflow list
         with self._lock:
-            self._workflows[engine_workflow.wf_id] = engine_workflow
+            self._manage_workflow(engine_workflow)
+        self.notify('workflow submission')
 
         return engine_workflow.wf_id
 
@@ -661,6 +1063,7 @@ class WorkflowEngineLoop(object):
                 if job.drmaa_id:
                     self.logger.debug("Kill job " + repr(job_id) + " drmaa id: " + repr(
                         job.drmaa_id) + " status " + repr(job.status))
+                    self._scheduler_jobs.pop(job.drmaa_id, None)
                     try:
                         self._scheduler.kill_job(job.drmaa_id)
                     except DRMError as e:
@@ -682,9 +1085,43 @@ class WorkflowEngineLoop(object):
                 job.exit_value = None
                 job.terminating_signal = None
                 job.str_rusage = None
+                self._dirty_jobs[job_id] = job
 
                 return True
 
+    def _manage_workflow(self, workflow):
+        '''
+        Add a workflow to the workflows processed by the loop, and index its
+        transfers and the jobs which are still running.
+        '''
+        self._workflows[workflow.wf_id] = workflow
+        self._transfers.update(workflow.registered_tr)
+        if workflow.registered_tr:
+            # the loop only reads back the transfers changed after its last
+            # revision (see start_loop()): the changes the workflow may have
+            # missed are read once
+            transfers_status = self._database_server.get_transfers_status(
+                list(workflow.registered_tr.keys()), self._user_id)
+            for engine_path, status in six.iteritems(transfers_status):
+                workflow.registered_tr[engine_path].status = status
+        for job in six.itervalues(workflow.registered_jobs):
+            # the status of the jobs read from the database is written back
+            # once, as when they were all compared to their database status
+            if job.status != job.db_status:
+                self._dirty_jobs[job.job_id] = job
+            # the barrier jobs are done as soon as submitted, and may share
+            # their scheduler id: they are never followed
+            if job.exit_status is None and job.drmaa_id is not None \
+                    and not job.is_barrier:
+                self._scheduler_jobs[job.drmaa_id] = job
+
+    def _unmanage_workflow(self, wf_id):
+        workflow = self._workflows.pop(wf_id)
+        for transfer_id in workflow.registered_tr:
+            self._transfers.pop(transfer_id, None)
+        for job_id in workflow.registered_jobs:
+            self._dirty_jobs.pop(job_id, None)
+
     def _stop_wf(self, wf_id):
         wf = self._workflows[wf_id]
         # self.logger.debug("wf.registered_jobs " + repr(wf.registered_jobs))
@@ -704,6 +1141,8 @@ class WorkflowEngineLoop(object):
             workflow.queue = queue
             (jobs_to_run,
              workflow.status) = workflow.restart(self._database_server, queue)
+            with self._lock:
+                self._dirty_jobs.update(workflow.registered_jobs)
             for job in jobs_to_run:
                 self._pend_for_submission(job)
         else:
@@ -716,7 +1155,8 @@ class WorkflowEngineLoop(object):
                 self._pend_for_submission(job)
             # add to the engine managed workflow list
             with self._lock:
-                self._workflows[wf_id] = workflow
+                self._manage_workflow(workflow)
+        self.notify('workflow restart')
 
     def force_stop(self, wf_id):
         if wf_id in self._workflows:
@@ -726,7 +1166,8 @@ class WorkflowEngineLoop(object):
                                                                  self._user_id)
             workflow.force_stop(self._database_server)
             with self._lock:
-                self._workflows[wf_id] = workflow
+                self._manage_workflow(workflow)
+            self.notify('workflow stop')
 
     def restart_job(self, job_id, status):
         (job, workflow_id) = self._database_server.get_engine_job(
@@ -738,6 +1179,7 @@ class WorkflowEngineLoop(object):
             # add to the engine managed job list
             with self._lock:
                 self._jobs[job.job_id] = job
+            self.notify('job restart')
         else:
 
             pass
@@ -765,7 +1207,8 @@ class WorkflowEngine(RemoteFileController):
                  path_translation=None,
                  queue_limits={},
                  running_jobs_limits={},
-                 container_command=None):
+                 container_command=None,
+                 fair_share=False):
         '''
         @type  database_server:
                L{soma_workflow.database_server.WorkflowDatabaseServer}
@@ -791,7 +1234,8 @@ class WorkflowEngine(RemoteFileController):
                                               scheduler,
                                               path_translation,
                                               queue_limits,
-                                              running_jobs_limits)
+                                              running_jobs_limits,
+                                              fair_share=fair_share)
         self.engine_loop_thread = EngineLoopThread(self.engine_loop)
         self.engine_loop_thread.setDaemon(True)
         self.engine_loop_thread.start()
@@ -800,6 +1244,17 @@ class WorkflowEngine(RemoteFileController):
     def __del__(self):
         pass
 
+    def _notify_loop(self, event):
+        '''
+        Wake up the engine loop about the database writes just made, once
+        they are committed: in write behind mode, the loop would read the
+        former state otherwise, and then sleep until its next iteration.
+        '''
+        try:
+            self._database_server.flush()
+        finally:
+            self.engine_loop.notify(event)
+
     # FILE TRANSFER ###############################################
 
     def register_transfer(self,
@@ -840,6 +1295,7 @@ class WorkflowEngine(RemoteFileController):
         Set a transfer status.
         '''
         self._database_server.set_transfer_status(engine_path, status)
+        self._notify_loop('transfer status')
 
     def delete_transfer(self, engine_path):
         '''
@@ -858,6 +1314,7 @@ class WorkflowEngine(RemoteFileController):
         if workflow_id != -1:
             self._database_server.add_workflow_ended_transfer(
                 workflow_id, engine_path)
+            self._notify_loop('transfer end')
 
     # JOB SUBMISSION ##################################################
     def submit_job(self, job, queue):
@@ -884,6 +1341,7 @@ class WorkflowEngine(RemoteFileController):
         else:
             self._database_server.set_job_status(
                 job_id, constants.DELETE_PENDING)
+            self._notify_loop('job deletion')
             if force and not self._wait_for_job_deletion(job_id):
                 self.logger.critical(
                     "!! The job may not be properly deleted !!")
@@ -928,6 +1386,7 @@ class WorkflowEngine(RemoteFileController):
 
             self._database_server.set_workflow_status(workflow_id,
                                                       constants.DELETE_PENDING)
+            self._notify_loop('workflow deletion')
             if force and not self._wait_for_wf_deletion(workflow_id):
                 self.logger.critical(
                     "The workflow may not be properly deleted.")
@@ -947,6 +1406,7 @@ class WorkflowEngine(RemoteFileController):
             else:
                 self._database_server.set_workflow_status(
                     workflow_id, constants.KILL_PENDING)
+                self._notify_loop('workflow kill')
                 self._wait_wf_status_update(
                     workflow_id, expected_status=constants.WORKFLOW_DONE)
 
@@ -999,12 +1459,26 @@ class WorkflowEngine(RemoteFileController):
         '''
         return self._database_server.get_workflows(self._user_id, workflow_ids)
 
+    def workflows_summary(self, workflow_ids=None):
+        '''
+        Implementation of soma_workflow.client.WorkflowController API
+        '''
+        return self._database_server.get_workflows_summary(self._user_id,
+                                                           workflow_ids)
+
     def workflow(self, wf_id):
         '''
         Implementation of soma_workflow.client.WorkflowController API
         '''
         return self._database_server.get_engine_workflow(wf_id, self._user_id)
 
+    def archived_workflow(self, wf_id):
+        '''
+        Implementation of soma_workflow.client.WorkflowController API
+        '''
+        return self._database_server.get_archived_workflow(wf_id,
+                                                           self._user_id)
+
     def job_status(self, job_id):
         '''
         Implementation of soma_workflow.client.WorkflowController API
@@ -1051,6 +1525,25 @@ class WorkflowEngine(RemoteFileController):
 
         return wf_status
 
+    def workflow_elements_status_changes(self, wf_id, since_revision=None):
+        '''
+        Implementation of soma_workflow.client.WorkflowController API
+        '''
+        (status,
+         last_status_update) = self._database_server.get_workflow_status(
+            wf_id, self._user_id)
+
+        revision, wf_status \
+            = self._database_server.get_detailed_workflow_status_changes(
+                wf_id, since_revision)
+        if status and \
+           not status == constants.WORKFLOW_DONE and \
+           _out_to_date(last_status_update):
+            wf_status = (wf_status[0], wf_status[1], constants.WARNING,
+                         wf_status[3], wf_status[4])
+
+        return revision, wf_status
+
     def transfer_status(self, engine_path):
         '''
         Implementation of soma_workflow.client.WorkflowController API
@@ -1182,6 +1675,7 @@ class WorkflowEngine(RemoteFileController):
             else:
                 self._database_server.set_job_status(job_id,
                                                      constants.KILL_PENDING)
+                self._notify_loop('job kill')
 
             self._wait_job_status_update(job_id)
 
@@ -1283,7 +1777,8 @@ class ConfiguredWorkflowEngine(WorkflowEngine):
             path_translation=config.get_path_translation(),
             queue_limits=config.get_queue_limits(),
             running_jobs_limits=config.get_running_jobs_limits(),
-            container_command=config.get_container_command())
+            container_command=config.get_container_command(),
+            fair_share=config.get_fair_share())
 
         self.config = config
 
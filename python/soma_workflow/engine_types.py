@@ -24,6 +24,8 @@ import tempfile
 import weakref
 import six
 import time
+import base64
+import pickle
 
 from soma_workflow.errors import JobError, WorkflowError
 import soma_workflow.constants as constants
@@ -84,6 +86,8 @@ class EngineJob(Job):
     queue = None
     # job status as defined in constants.JOB_STATUS. string
     status = None
+    # last status written in the database by the engine loop. string
+    db_status = None
     # last status update date
     last_status_update = None
     # exit status string as defined in constants. JOB_EXIT_STATUS
@@ -377,6 +381,21 @@ class EngineJob(Job):
         return success
 
 
+# version of the workflow representation built by EngineWorkflow.to_structure()
+STRUCTURE_VERSION = 1
+
+
+def _to_pickled_str(obj):
+    '''
+    Pickles an object into a string which can be stored in JSON.
+    '''
+    return base64.b64encode(pickle.dumps(obj)).decode('ascii')
+
+
+def _from_pickled_str(pickled_str):
+    return pickle.loads(base64.b64decode(pickled_str.encode('ascii')))
+
+
 class EngineWorkflow(Workflow):
     '''
     Server side representation of a :obj:`Workflow`, i.e. a list of jobs
@@ -563,6 +582,148 @@ class EngineWorkflow(Workflow):
                       " Objects of type Job or Group are required." %
                       (repr(elem)))
 
+    def to_structure(self):
+        '''
+        Structured representation of a registered workflow, stored in the
+        database instead of a pickle of the whole object (see
+        from_structure()).
+
+        It is made of the client workflow description given by
+        Workflow.to_dict(), from which the jobs definitions are split apart
+        and indexed by job id, and of the engine identifiers of the jobs,
+        transfers and temporary paths.
+
+        Returns
+        -------
+        structure: dict
+            JSON serializable description of the workflow, without the jobs
+            definitions
+        job_definitions: dict
+            job_id -> JSON serializable job definition
+        '''
+        wf_dict, job_ids, transfer_ids, temporary_ids \
+            = self._to_dict_with_ids()
+        serialized_jobs = wf_dict.pop("serialized_jobs")
+        serialized_barriers = wf_dict.pop("serialized_barriers")
+
+        engine_job_ids = {}
+        job_definitions = {}
+        for job, ident in six.iteritems(job_ids):
+            job_id = self.job_mapping[job].job_id
+            engine_job_ids[str(ident)] = job_id
+            if str(ident) in serialized_barriers:
+                definition = {"job": serialized_barriers[str(ident)],
+                              "barrier": True}
+            else:
+                definition = {"job": serialized_jobs[str(ident)]}
+            if job.user_storage is not None:
+                definition["user_storage"] = _to_pickled_str(
+                    job.user_storage)
+            job_definitions[job_id] = definition
+
+        transfers = {}
+        for file_transfer, ident in six.iteritems(transfer_ids):
+            if file_transfer in self.transfer_mapping:
+                transfers[str(ident)] \
+                    = self.transfer_mapping[file_transfer].engine_path
+        temporary_paths = {}
+        for temp_path, ident in six.iteritems(temporary_ids):
+            if temp_path in self.transfer_mapping:
+                engine_temp = self.transfer_mapping[temp_path]
+                temporary_paths[str(ident)] = (engine_temp.temp_path_id,
+                                               engine_temp.engine_path)
+
+        structure = {"version": STRUCTURE_VERSION,
+                     "workflow": wf_dict,
+                     "job_ids": engine_job_ids,
+                     "transfers": transfers,
+                     "temporary_paths": temporary_paths,
+                     "path_translation": self._path_translation,
+                     "container_command": self.container_command}
+        if self.user_storage is not None:
+            structure["user_storage"] = _to_pickled_str(self.user_storage)
+        return structure, job_definitions
+
+    @classmethod
+    def from_structure(cls,
+                       structure,
+                       job_definitions,
+                       wf_id,
+                       queue,
+                       expiration_date,
+                       name):
+        '''
+        Builds a registered workflow back from the representation given by
+        to_structure(). The jobs, transfers and temporary paths get back
+        their identifiers, but their state (status, exit information...)
+        is the one of a new workflow.
+
+        Parameters
+        ----------
+        structure: dict
+        job_definitions: dict
+            job_id -> job definition
+        wf_id: WorkflowIdentifier
+        queue: str
+        expiration_date: datetime
+        name: str
+        '''
+        if structure.get("version") != STRUCTURE_VERSION:
+            raise WorkflowError("Unsupported workflow structure version: %s"
+                                % repr(structure.get("version")))
+        wf_dict = dict(structure["workflow"])
+        wf_dict["serialized_jobs"] = {}
+        wf_dict["serialized_barriers"] = {}
+        for ident, job_id in six.iteritems(structure["job_ids"]):
+            definition = job_definitions[job_id]
+            if definition.get("barrier"):
+                wf_dict["serialized_barriers"][ident] = definition["job"]
+            else:
+                wf_dict["serialized_jobs"][ident] = definition["job"]
+
+        (client_workflow, job_from_ids, tr_from_ids, tmp_from_ids) \
+            = Workflow._from_dict_with_ids(wf_dict)
+        if "user_storage" in structure:
+            client_workflow.user_storage = _from_pickled_str(
+                structure["user_storage"])
+        for ident, job_id in six.iteritems(structure["job_ids"]):
+            definition = job_definitions[job_id]
+            if "user_storage" in definition:
+                job_from_ids[int(ident)].user_storage = _from_pickled_str(
+                    definition["user_storage"])
+
+        workflow = cls(client_workflow,
+                       structure.get("path_translation"),
+                       queue,
+                       expiration_date,
+                       name,
+                       container_command=structure.get("container_command"))
+        workflow.wf_id = wf_id
+
+        for ident, job_id in six.iteritems(structure["job_ids"]):
+            engine_job = workflow.job_mapping[job_from_ids[int(ident)]]
+            engine_job.job_id = job_id
+            engine_job.workflow_id = wf_id
+            workflow.registered_jobs[job_id] = engine_job
+        for ident, engine_path in six.iteritems(structure["transfers"]):
+            engine_transfer = workflow.transfer_mapping.get(
+                tr_from_ids[int(ident)])
+            if engine_transfer is not None:
+                engine_transfer.engine_path = engine_path
+                engine_transfer.workflow_id = wf_id
+                workflow.registered_tr[engine_path] = engine_transfer
+        for ident, (temp_path_id, engine_path) in six.iteritems(
+                structure["temporary_paths"]):
+            engine_temp = workflow.transfer_mapping.get(
+                tmp_from_ids[int(ident)])
+            if engine_temp is not None:
+                engine_temp.temp_path_id = temp_path_id
+                engine_temp.engine_path = engine_path
+                engine_temp.workflow_id = wf_id
+                workflow.registered_tr[temp_path_id] = engine_temp
+
+        return workflow
+
     def find_out_independant_jobs(self):
         independant_jobs = []
         for job in self.jobs:
@@ -794,7 +955,7 @@ class EngineWorkflow(Workflow):
         #f_to_discard = 0
         #has_failed_jobs = getattr(self, 'has_new_failed_jobs', False)
         #self.has_new_failed_jobs = False
-        t0 = time.clock()
+        #t0 = time.clock()
         for client_job in self.jobs:
             #jcount += 1
             self.logger.debug("client_job=" + repr(client_job))
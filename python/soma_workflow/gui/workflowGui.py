@@ -18,6 +18,7 @@ from __future__ import with_statement, print_function
 import time
 import threading
 import os
+import logging
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
@@ -3765,6 +3766,9 @@ class ApplicationModel(QtCore.QObject):
         self.update_interval = 3  # update period in seconds
         self.auto_update = True
         self._hold = {}
+        # resource id => True if the server does not give the workflow
+        # elements status changes (older versions)
+        self._no_status_changes = {}
 
         self._lock = threading.RLock()
 
@@ -3814,13 +3818,46 @@ class ApplicationModel(QtCore.QObject):
                             # print(" ==> communication with the server " + repr(self.wf_id))
                             # begining = datetime.now()
 
-                            # wf_complete_status =
-                            # self.current_connection.workflow_elements_status(self.current_wf_id)
-                            wf_complete_status = self.connection_timeout(
-                                WorkflowController.workflow_elements_status,
-                                args=(
-                                    self.current_connection, self.current_wf_id),
-                                timeout_duration=self._timeout_duration[self.current_resource_id])
+                            wf_complete_status = None
+                            if not self._no_status_changes.get(
+                                    self.current_resource_id):
+                                # only the elements modified since the last
+                                # update are transfered
+                                try:
+                                    (status_revision,
+                                     wf_complete_status) = self.connection_timeout(
+                                        WorkflowController.workflow_elements_status_changes,
+                                        args=(
+                                            self.current_connection, self.current_wf_id,
+                                            self._current_workflow.status_revision),
+                                        timeout_duration=self._timeout_duration[self.current_resource_id])
+                                except (ConnectionClosedError,
+                                        UnknownObjectError):
+                                    raise
+                                except AttributeError as e:
+                                    # the server does not support the
+                                    # status changes: get the whole status
+                                    # from now on
+                                    logging.getLogger('gui').info(
+                                        'no workflow status changes on %s: '
+                                        '%s' % (self.current_resource_id, e))
+                                    self._no_status_changes[
+                                        self.current_resource_id] = True
+                                except Exception as e:
+                                    # get the whole status this time only
+                                    logging.getLogger('gui').warning(
+                                        'workflow status changes of %s '
+                                        'failed: %s: %s'
+                                        % (self.current_wf_id, type(e), e))
+                                else:
+                                    self._current_workflow.status_revision \
+                                        = status_revision
+                            if wf_complete_status is None:
+                                wf_complete_status = self.connection_timeout(
+                                    WorkflowController.workflow_elements_status,
+                                    args=(
+                                        self.current_connection, self.current_wf_id),
+                                    timeout_duration=self._timeout_duration[self.current_resource_id])
                             wf_status = wf_complete_status[2]
                             # end = datetime.now() - begining
                             # print(" <== end communication" + repr(self.wf_id)
@@ -3965,6 +4002,7 @@ class ApplicationModel(QtCore.QObject):
             self.current_workflow_about_to_change.emit()
             self.current_workflow_changed.emit()
             self._hold[resource_id] = False
+            self._no_status_changes[resource_id] = False
 
     def delete_connection(self, resource_id):
         '''
@@ -4016,6 +4054,7 @@ class ApplicationModel(QtCore.QObject):
             self.resource_pool.reinit_connection(resource_id, connection)
             self.current_connection_changed.emit()
             self._hold[resource_id] = False
+            self._no_status_changes[resource_id] = False
 
     def add_to_submitted_workflows(self,
                                    workflow_id,
@@ -4215,6 +4254,9 @@ class GuiWorkflow(object):
     server_jobs = None
 
     queue = None
+    # database revision of the last status update (see
+    # WorkflowController.workflow_elements_status_changes)
+    status_revision = None
 
     def __init__(self, workflow, tmp_stderrout_dir):
 
@@ -63,4 +63,9 @@ EXTRA_REQUIRES = {
 # Globals and constants
 #-----------------------------------------------------------------------------
 
-DB_VERSION = '1.1'
+# version of the database schema. Databases using an older schema are
+# upgraded when they are opened (see database_server.upgrade_database).
+DB_VERSION = '1.8'
+# version used in the default database file name. It only has to change when
+# a schema change can not be handled by a database upgrade.
+DB_FILE_VERSION = '1.1'
@@ -67,6 +67,22 @@ class Scheduler(object):
 
     is_sleeping = None
 
+    # True if the scheduler detects the job status changes by itself and
+    # calls the status changes callbacks (see add_status_changes_callback()).
+    # Otherwise its users have to poll the job status.
+    notifies_status_changes = False
+
+    _status_changes_callbacks = None
+
+    # last status returned by poll_changes() (dict scheduler_job_id ->
+    # status), used by the default implementation
+    _polled_status = None
+
+    # maximum number of job_submission() calls run concurrently by
+    # job_submissions(). Only the schedulers which submissions are slow
+    # (round trips to a batch system) and thread safe should raise it.
+    max_parallel_submissions = 1
+
     def __init__(self):
         self.parallel_job_submission_info = None
         self.is_sleeping = False
@@ -80,14 +96,87 @@ class Scheduler(object):
     def clean(self):
         pass
 
+    def add_status_changes_callback(self, callback):
+        '''
+        Register a function called, without arguments, each time the status
+        of submitted jobs changed. It is only called by the schedulers which
+        notifies_status_changes, from one of their threads: it should just
+        wake up the callers, which then get the new status using
+        poll_changes().
+        '''
+        if self._status_changes_callbacks is None:
+            self._status_changes_callbacks = []
+        self._status_changes_callbacks.append(callback)
+
+    def _notify_status_changes(self):
+        for callback in self._status_changes_callbacks or ():
+            try:
+                callback()
+            except Exception as e:
+                logging.getLogger('engine').exception(
+                    'job status changes callback failed: %s' % e)
+
     def job_submission(self, job):
         '''
+        The scheduler may set the status of a job it does not actually run
+        (barrier job) to DONE: the job is then ended at submission, and its
+        status is not polled.
+
         * job *EngineJob*
         * return: *string*
             Job id for the scheduling system (DRMAA for example)
         '''
         raise Exception("Scheduler is an abstract class!")
 
+    def job_submissions(self, jobs):
+        '''
+        Submit several jobs, running up to max_parallel_submissions
+        job_submission() calls concurrently. The schedulers providing a bulk
+        submission may override it.
+
+        * jobs *list of EngineJob*
+        * return: *list of tuple*
+            (scheduler_job_id, error) for each job, in the jobs order. error
+            is None, or the exception raised by job_submission(), in which
+            case scheduler_job_id is None.
+        '''
+        if self.is_sleeping:
+            self.wake()
+        results = [None] * len(jobs)
+
+        def submit(index):
+            try:
+                results[index] = (self.job_submission(jobs[index]), None)
+            except Exception as e:
+                results[index] = (None, e)
+
+        nthreads = min(self.max_parallel_submissions, len(jobs))
+        if nthreads <= 1:
+            for index in range(len(jobs)):
+                submit(index)
+            return results
+
+        indices = iter(range(len(jobs)))
+        indices_lock = threading.Lock()
+
+        def submission_thread():
+            while True:
+                with indices_lock:
+                    index = next(indices, None)
+                if index is None:
+                    break
+                submit(index)
+
+        threads = [threading.Thread(name='job_submission',
+                                    target=submission_thread)
+                   for i in range(nthreads)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
     def get_job_status(self, scheduler_job_id):
         '''
         * scheduler_job_id *string*
@@ -97,6 +186,46 @@ class Scheduler(object):
         '''
         raise Exception("Scheduler is an abstract class!")
 
+    def poll_changes(self, scheduler_job_ids):
+        '''
+        Get the status of the jobs which changed since the last call. The
+        first call for a job always returns its status.
+
+        This default implementation calls get_job_status() for each job.
+        The schedulers which track the status changes override it to only
+        process the jobs which changed.
+
+        * scheduler_job_ids *dict or set of string*
+            Job ids for the scheduling system of the jobs followed by the
+            caller: the submitted jobs which did not end yet.
+        * return: *tuple*
+            (changes, errors): dictionary scheduler_job_id -> status as
+            defined in constants.JOB_STATUS of the followed jobs which
+            status changed, and dictionary scheduler_job_id -> DRMError of
+            the jobs which status could not be got.
+        '''
+        if self._polled_status is None:
+            self._polled_status = {}
+        polled_status = self._polled_status
+        changes = {}
+        errors = {}
+        for scheduler_job_id in scheduler_job_ids:
+            try:
+                status = self.get_job_status(scheduler_job_id)
+            except DRMError as e:
+                errors[scheduler_job_id] = e
+                continue
+            if polled_status.get(scheduler_job_id) != status:
+                changes[scheduler_job_id] = status
+                polled_status[scheduler_job_id] = status
+        # forget the jobs which are not followed any longer
+        if len(polled_status) > len(scheduler_job_ids):
+            self._polled_status = dict(
+                (scheduler_job_id, polled_status[scheduler_job_id])
+                for scheduler_job_id in scheduler_job_ids
+                if scheduler_job_id in polled_status)
+        return (changes, errors)
+
     def get_job_exit_info(self, scheduler_job_id):
         '''
         * scheduler_job_id *string*
@@ -143,11 +272,27 @@ if DRMAA_LIB_FOUND == True:
         is_sleeping = False
         FAKE_JOB = -167
 
+        # the status of all the followed jobs is requested at least every
+        # full_poll_interval seconds by poll_changes() (see its doc)
+        full_poll_interval = 60.
+
+        # DRMAA sessions are thread safe: submit several jobs at once
+        max_parallel_submissions = 4
+
+        # exit information of the ended jobs reaped by poll_changes(), not
+        # yet read by get_job_exit_info()
+        # dict scheduler_job_id -> result of Session.wait()
+        _reaped_jobs = None
+
+        # date of the last poll of all the followed jobs (time.time())
+        _full_poll_time = 0.
+
         def __init__(self,
                      drmaa_implementation,
                      parallel_job_submission_info,
                      tmp_file_path=None,
-                     configured_native_spec=None):
+                     configured_native_spec=None,
+                     max_parallel_submissions=None):
 
             import somadrmaa
 
@@ -163,6 +308,12 @@ if DRMAA_LIB_FOUND == True:
 
             self._configured_native_spec = configured_native_spec
 
+            self._reaped_jobs = {}
+            self._polled_status = {}
+
+            if max_parallel_submissions is not None:
+                self.max_parallel_submissions = max_parallel_submissions
+
             self.logger.debug("Parallel job submission info: %s",
                               repr(parallel_job_submission_info))
 
@@ -448,6 +599,78 @@ if DRMAA_LIB_FOUND == True:
                 raise DRMError("%s" % (e))
             return status
 
+        def poll_changes(self, scheduler_job_ids):
+            '''
+            DRMAA cannot list the status changes. Instead:
+
+            * the ended jobs are reaped at once, waiting for any job of the
+              session without timeout. Their exit information is kept for
+              get_job_exit_info().
+            * jobStatus() is only called for the jobs which are not running
+              yet (queued, on hold...) since a running job can only end or
+              be suspended.
+            * the status of all the followed jobs is requested every
+              full_poll_interval seconds, to catch the suspensions and the
+              jobs the session cannot wait for.
+            '''
+            if self.is_sleeping:
+                self.wake()
+            polled_status = self._polled_status
+            changes = {}
+            errors = {}
+            self._reap_ended_jobs()
+            full_poll = time.time() - self._full_poll_time \
+                > self.full_poll_interval
+            if full_poll:
+                self._full_poll_time = time.time()
+            for scheduler_job_id in scheduler_job_ids:
+                if scheduler_job_id in self._reaped_jobs:
+                    status = self._reaped_job_status(scheduler_job_id)
+                elif polled_status.get(scheduler_job_id) == constants.RUNNING \
+                        and not full_poll:
+                    continue
+                else:
+                    try:
+                        status = self.get_job_status(scheduler_job_id)
+                    except DRMError as e:
+                        errors[scheduler_job_id] = e
+                        continue
+                if polled_status.get(scheduler_job_id) != status:
+                    changes[scheduler_job_id] = status
+                    polled_status[scheduler_job_id] = status
+            # jobs which are not followed any longer (killed...)
+            for scheduler_job_id in list(self._reaped_jobs.keys()):
+                if scheduler_job_id not in scheduler_job_ids:
+                    del self._reaped_jobs[scheduler_job_id]
+                    self.cleanup_drmaa_files(scheduler_job_id)
+            if len(polled_status) > len(scheduler_job_ids):
+                self._polled_status = dict(
+                    (scheduler_job_id, polled_status[scheduler_job_id])
+                    for scheduler_job_id in scheduler_job_ids
+                    if scheduler_job_id in polled_status)
+            return (changes, errors)
+
+        def _reap_ended_jobs(self):
+            while True:
+                try:
+                    job_info = self._drmaa.wait(
+                        self._drmaa.JOB_IDS_SESSION_ANY,
+                        self._drmaa.TIMEOUT_NO_WAIT)
+                except (ExitTimeoutException, InvalidJobException):
+                    # no job ended, or no job left in the session
+                    break
+                except DrmaaException as e:
+                    self.logger.error("%s" % (e))
+                    break
+                self._reaped_jobs[job_info[0]] = job_info
+
+        def _reaped_job_status(self, scheduler_job_id):
+            job_info = self._reaped_jobs[scheduler_job_id]
+            exited, aborted = job_info[1], job_info[5]
+            if exited and not aborted:
+                return constants.DONE
+            return constants.FAILED
+
         def get_job_exit_info(self, scheduler_job_id):
             if self.is_sleeping:
                 self.wake()
@@ -468,8 +691,13 @@ if DRMAA_LIB_FOUND == True:
             try:
                 self.logger.debug(
                     "  ==> Start to find info of job %s" % (scheduler_job_id))
-                jid_out, exit_value, signaled, term_sig, coredumped, aborted, exit_status, resource_usage = self._drmaa.wait(
-                    scheduler_job_id, self._drmaa.TIMEOUT_NO_WAIT)
+                if scheduler_job_id in self._reaped_jobs:
+                    # already waited for by poll_changes()
+                    job_info = self._reaped_jobs.pop(scheduler_job_id)
+                else:
+                    job_info = self._drmaa.wait(
+                        scheduler_job_id, self._drmaa.TIMEOUT_NO_WAIT)
+                jid_out, exit_value, signaled, term_sig, coredumped, aborted, exit_status, resource_usage = job_info
 
                 self.logger.debug("  ==> jid_out=" + repr(jid_out))
                 self.logger.debug("  ==> exit_value=" + repr(exit_value))
@@ -563,6 +791,9 @@ class LocalScheduler(Scheduler):
 
     _exit_info = None
 
+    # ids of the jobs which status changed since the last poll_changes()
+    _changed = None
+
     _loop = None
 
     _interval = None
@@ -572,6 +803,8 @@ class LocalScheduler(Scheduler):
     _lasttime = None
     _lastidle = None
 
+    notifies_status_changes = True
+
     def __init__(self, proc_nb=default_cpu_number(), interval=1,
                  max_proc_nb=0):
         super(LocalScheduler, self).__init__()
@@ -586,16 +819,26 @@ class LocalScheduler(Scheduler):
         self._processes = {}
         self._status = {}
         self._exit_info = {}
+        self._changed = set()
 
         self._lock = threading.RLock()
+        # wakes up the scheduler loop when a job is submitted or when a job
+        # process ends
+        self._wakeup = threading.Condition(self._lock)
+        self._woken_up = False
 
         self.stop_thread_loop = False
 
         def loop(self):
             while not self.stop_thread_loop:
                 with self._lock:
-                    self._iterate()
-                time.sleep(self._interval)
+                    self._woken_up = False
+                    changed = self._iterate()
+                if changed:
+                    self._notify_status_changes()
+                with self._lock:
+                    if not self.stop_thread_loop and not self._woken_up:
+                        self._wakeup.wait(self._interval)
 
         self._loop = threading.Thread(name="scheduler_loop",
                                       target=loop,
@@ -620,13 +863,17 @@ class LocalScheduler(Scheduler):
     def end_scheduler_thread(self):
         with self._lock:
             self.stop_thread_loop = True
-            self._loop.join()
-            # print("Soma scheduler thread ended nicely.")
+            self._wakeup.notify_all()
+        self._loop.join()
+        # print("Soma scheduler thread ended nicely.")
 
     def _iterate(self):
+        '''
+        Returns True if the status of jobs changed.
+        '''
         # Nothing to do if the queue is empty and nothing is running
         if not self._queue and not self._processes:
-            return
+            return False
         # print("#############################")
         # Control the running jobs
         ended_jobs = []
@@ -643,10 +890,11 @@ class LocalScheduler(Scheduler):
         # update for the ended job
         for job_id in ended_jobs:
             # print("updated job_id " + repr(job_id) + " status DONE")
-            self._status[job_id] = constants.DONE
+            self._set_status(job_id, constants.DONE)
             del self._processes[job_id]
 
         # run new jobs
+        started = False
         while (self._queue and self._can_submit_new_job()):
             job_id = self._queue.pop(0)
             job = self._jobs[job_id]
@@ -658,7 +906,7 @@ class LocalScheduler(Scheduler):
                                                0,
                                                None,
                                                None)
-                self._status[job.job_id] = constants.DONE
+                self._set_status(job.job_id, constants.DONE)
             else:
                 process = LocalScheduler.create_process(job)
                 if process == None:
@@ -666,10 +914,29 @@ class LocalScheduler(Scheduler):
                                                    None,
                                                    None,
                                                    None)
-                    self._status[job.job_id] = constants.FAILED
+                    self._set_status(job.job_id, constants.FAILED)
                 else:
                     self._processes[job.job_id] = process
-                    self._status[job.job_id] = constants.RUNNING
+                    self._set_status(job.job_id, constants.RUNNING)
+                    watcher = threading.Thread(
+                        name="scheduler_process_watcher",
+                        target=self._watch_process,
+                        args=[process])
+                    watcher.setDaemon(True)
+                    watcher.start()
+            started = True
+
+        return bool(ended_jobs) or started
+
+    def _watch_process(self, process):
+        '''
+        Wait for the end of a job process, then wake up the scheduler loop so
+        that the end is noticed at once, not at the next iteration.
+        '''
+        process.wait()
+        with self._lock:
+            self._woken_up = True
+            self._wakeup.notify()
 
     def _can_submit_new_job(self):
         n = len(self._processes)
@@ -790,9 +1057,12 @@ class LocalScheduler(Scheduler):
             # print("job submission " + repr(job.job_id))
             self._queue.append(job.job_id)
             self._jobs[job.job_id] = job
-            self._status[job.job_id] = constants.QUEUED_ACTIVE
+            self._set_status(job.job_id, constants.QUEUED_ACTIVE)
             self._queue.sort(key=lambda job_id: self._jobs[job_id].priority,
                              reverse=True)
+            # start the job without waiting for the next iteration
+            self._woken_up = True
+            self._wakeup.notify()
         return job.job_id
 
     def get_job_status(self, scheduler_job_id):
@@ -808,6 +1078,23 @@ class LocalScheduler(Scheduler):
         status = self._status[scheduler_job_id]
         return status
 
+    def _set_status(self, job_id, status):
+        self._status[job_id] = status
+        self._changed.add(job_id)
+
+    def poll_changes(self, scheduler_job_ids):
+        '''
+        Only the jobs which status changed since the last call are
+        processed.
+        '''
+        with self._lock:
+            changed = self._changed
+            self._changed = set()
+            changes = dict((job_id, self._status[job_id])
+                           for job_id in changed
+                           if job_id in scheduler_job_ids)
+        return (changes, {})
+
     def get_job_exit_info(self, scheduler_job_id):
         '''
         * scheduler_job_id *string*
@@ -867,7 +1154,7 @@ class LocalScheduler(Scheduler):
                     process.communicate()
 
                 del self._processes[scheduler_job_id]
-                self._status[scheduler_job_id] = constants.FAILED
+                self._set_status(scheduler_job_id, constants.FAILED)
                 self._exit_info[scheduler_job_id] = (constants.USER_KILLED,
                                                      None,
                                                      None,
@@ -876,7 +1163,7 @@ class LocalScheduler(Scheduler):
                 # print("    => removed from queue ")
                 self._queue.remove(scheduler_job_id)
                 del self._jobs[scheduler_job_id]
-                self._status[scheduler_job_id] = constants.FAILED
+                self._set_status(scheduler_job_id, constants.FAILED)
                 self._exit_info[scheduler_job_id] = (constants.EXIT_ABORTED,
                                                      None,
                                                      None,
@@ -33,13 +33,22 @@ if __name__ == '__main__':
         def __init__(self,
                      database_file,
                      tmp_file_dir_path,
-                     shared_tmp_dir=None):
+                     shared_tmp_dir=None,
+                     write_behind_interval=None,
+                     backend=None,
+                     archive_delay=None,
+                     maintenance_interval=None):
             Pyro.core.ObjBase.__init__(self)
             soma_workflow.database_server.WorkflowDatabaseServer.__init__(
                 self,
                 database_file,
                 tmp_file_dir_path,
-                shared_tmp_dir)
+                shared_tmp_dir,
+                write_behind=write_behind_interval is not None,
+                commit_interval=write_behind_interval or 0.005,
+                backend=backend,
+                archive_delay=archive_delay,
+                maintenance_interval=maintenance_interval)
         pass
 
         def test(self):
@@ -143,7 +152,11 @@ if __name__ == '__main__':
     # connect new object implementation
     server = WorkflowDatabaseServer(config.get_database_file(),
                                     config.get_transfered_file_dir(),
-                                    config.get_shared_temporary_directory())
+                                    config.get_shared_temporary_directory(),
+                                    config.get_database_write_behind(),
+                                    config.get_database_backend(),
+                                    config.get_database_archive_delay(),
+                                    config.get_database_maintenance_interval())
     daemon.connect(server, server_name)
     print("port = " + repr(daemon.port))
 
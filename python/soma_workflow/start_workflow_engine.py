@@ -215,7 +215,8 @@ if __name__ == "__main__":
                 config.get_drmaa_implementation(),
                 config.get_parallel_job_config(),
                 os.path.expanduser("~"),
-                configured_native_spec=config.get_native_specification())
+                configured_native_spec=config.get_native_specification(),
+                max_parallel_submissions=config.get_submission_threads())
             database_server = get_database_server_proxy(config, logger)
 
         elif config.get_scheduler_type() \
@@ -0,0 +1,11 @@
+'''
+Performance benchmarks of the workflow engine and database server.
+
+Each module can be run as a script, for instance::
+
+    python -m soma_workflow.test.benchmarks.engine_loop
+
+Benchmarks run in light mode, on a temporary database, with a fake
+scheduler: they measure the engine and database overheads, not the job
+execution time.
+'''
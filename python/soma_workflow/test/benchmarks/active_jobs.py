@@ -0,0 +1,98 @@
+from __future__ import with_statement, print_function
+
+'''
+Engine loop iteration latency with many finished jobs.
+
+Several large workflows are submitted to a WorkflowEngineLoop driven by a
+fake scheduler. Once all the jobs are submitted, all of them but a few per
+workflow are finished. The latency of the following loop iterations, with
+the time interval set to 0, shows how much the loop still works on the
+finished jobs: it should only depend on the number of active jobs.
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.active_jobs [-w 20] [-j 10000]
+'''
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from soma_workflow.engine import WorkflowEngineLoop, EngineLoopThread
+from soma_workflow.test.benchmarks.bench_utils import BenchmarkScheduler, \
+    make_workflow, temporary_database_server, print_stats, timed
+from soma_workflow.test.benchmarks.engine_loop import TickingDatabaseServer
+
+
+def wait_for(condition, timeout=3600.):
+    start = time.time()
+    while not condition():
+        if time.time() - start > timeout:
+            raise RuntimeError('benchmark timeout')
+        time.sleep(0.05)
+
+
+def run_active_jobs(nworkflows, njobs, nactive, iterations):
+    '''
+    Returns the list of iteration durations (seconds).
+    '''
+    with temporary_database_server(TickingDatabaseServer) as server:
+        scheduler = BenchmarkScheduler()
+        engine_loop = WorkflowEngineLoop(server, scheduler)
+        duration, _ = timed(
+            lambda: [engine_loop.add_workflow(
+                make_workflow(njobs, name='active_jobs_%d' % i),
+                datetime.now() + timedelta(days=1),
+                'active_jobs_benchmark_%d' % i, None)
+                for i in range(nworkflows)])
+        print('%d workflows added in %.2f s' % (nworkflows, duration))
+        thread = EngineLoopThread(engine_loop)
+        thread.time_interval = 0
+        thread.daemon = True
+        thread.start()
+        try:
+            wait_for(lambda: scheduler._count == nworkflows * njobs)
+            # the scheduler job ids are submission numbers: keep the last
+            # nactive jobs of each workflow running
+            with scheduler._lock:
+                scheduler_job_ids = sorted(scheduler._status.keys(), key=int)
+            to_finish = []
+            for i in range(nworkflows):
+                to_finish += scheduler_job_ids[i * njobs:
+                                               (i + 1) * njobs - nactive]
+            for scheduler_job_id in to_finish:
+                scheduler.finish_job(scheduler_job_id)
+            # the next complete iteration processes the ended jobs: skip it
+            start = len(server.ticks) + 2
+            wait_for(lambda: len(server.ticks) >= start)
+            wait_for(lambda: len(server.ticks) >= start + iterations + 1)
+            ticks = server.ticks[start:start + iterations + 1]
+        finally:
+            thread.stop()
+    return [t1 - t0 for t0, t1 in zip(ticks[:-1], ticks[1:])]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Engine loop iteration latency with many finished '
+        'jobs.')
+    parser.add_argument('-w', '--workflows', type=int, default=20,
+                        help='number of workflows')
+    parser.add_argument('-j', '--jobs', type=int, default=10000,
+                        help='number of jobs per workflow')
+    parser.add_argument('-a', '--active', type=int, default=10,
+                        help='number of jobs per workflow still running')
+    parser.add_argument('-i', '--iterations', type=int, default=20,
+                        help='number of measured loop iterations')
+    options = parser.parse_args(argv)
+
+    print('%d workflows of %d jobs, %d running jobs per workflow'
+          % (options.workflows, options.jobs, options.active))
+    durations = run_active_jobs(options.workflows, options.jobs,
+                                options.active, options.iterations)
+    print_stats('loop iteration', durations)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
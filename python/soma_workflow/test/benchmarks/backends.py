@@ -0,0 +1,91 @@
+from __future__ import with_statement, print_function
+
+'''
+Database backends benchmark: SQLite database file vs in-memory database.
+
+The same sequence of requests is run on a WorkflowDatabaseServer using each
+kind of SQLite database (see soma_workflow.database_server.SQLITE_DATABASES):
+
+* submission of a workflow of independent jobs (add_workflow()),
+* status updates of all the jobs, by groups as the engine loop does
+  (set_jobs_status()),
+* detailed status requests, as the GUI does
+  (get_detailed_workflow_status()),
+* deletion of the workflow (delete_workflow()).
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.backends [-j 10000] \\
+        [-b sqlite memory]
+'''
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+import soma_workflow.constants as constants
+from soma_workflow.database_server import SQLITE_DATABASES
+from soma_workflow.engine_types import EngineWorkflow
+from soma_workflow.test.benchmarks.bench_utils import make_workflow, \
+    temporary_database_server, timed
+
+
+def run_backend(backend, njobs, group_size, nreads):
+    '''
+    Returns a list of (request title, duration in seconds).
+    '''
+    durations = []
+    with temporary_database_server(backend=backend) as server:
+        user_id = server.register_user('benchmark')
+        engine_workflow = EngineWorkflow(
+            make_workflow(njobs), {}, None,
+            datetime.now() + timedelta(days=1), 'backends_benchmark')
+        durations.append(('add_workflow', timed(
+            server.add_workflow, user_id, engine_workflow,
+            login='benchmark')[0]))
+
+        job_ids = sorted(engine_workflow.registered_jobs)
+        groups = [job_ids[i:i + group_size]
+                  for i in range(0, len(job_ids), group_size)]
+
+        def update_status(status):
+            for group in groups:
+                server.set_jobs_status(dict((job_id, status)
+                                            for job_id in group))
+
+        durations.append(('%d set_jobs_status' % (len(groups) * 2), timed(
+            lambda: (update_status(constants.RUNNING),
+                     update_status(constants.DONE)))[0]))
+        durations.append(('%d get_detailed_workflow_status' % nreads, timed(
+            lambda: [server.get_detailed_workflow_status(
+                engine_workflow.wf_id) for i in range(nreads)])[0]))
+        durations.append(('delete_workflow', timed(
+            server.delete_workflow, engine_workflow.wf_id)[0]))
+    return durations
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Database storage backends benchmark.')
+    parser.add_argument('-j', '--jobs', type=int, default=10000,
+                        help='number of jobs of the workflow')
+    parser.add_argument('-g', '--group-size', type=int, default=100,
+                        help='number of jobs per status update')
+    parser.add_argument('-r', '--reads', type=int, default=20,
+                        help='number of detailed status requests')
+    parser.add_argument('-b', '--backends', nargs='+',
+                        default=sorted(SQLITE_DATABASES),
+                        help='backends to compare')
+    options = parser.parse_args(argv)
+
+    for backend in options.backends:
+        durations = run_backend(backend, options.jobs, options.group_size,
+                                options.reads)
+        print('%s backend, %d jobs: %s'
+              % (backend, options.jobs,
+                 ', '.join(['%s %.2f s' % (title, duration)
+                            for title, duration in durations])))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,183 @@
+from __future__ import with_statement, print_function
+
+'''
+Common tools for soma-workflow benchmarks.
+'''
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import soma_workflow.constants as constants
+from soma_workflow.client import Job, FileTransfer, Workflow
+from soma_workflow.scheduler import Scheduler
+
+
+class BenchmarkScheduler(Scheduler):
+
+    '''
+    Fake scheduler: submitted jobs are never run, they stay in the status
+    given by job_status until finish_job() is called on them.
+    '''
+
+    def __init__(self, job_status=constants.RUNNING):
+        super(BenchmarkScheduler, self).__init__()
+        self.job_status = job_status
+        self._lock = threading.RLock()
+        self._count = 0
+        self._status = {}
+        self._exit_info = {}
+
+    def job_submission(self, job):
+        with self._lock:
+            self._count += 1
+            scheduler_job_id = str(self._count)
+            self._status[scheduler_job_id] = self.job_status
+            return scheduler_job_id
+
+    def finish_job(self, scheduler_job_id, exit_value=0):
+        with self._lock:
+            self._status[scheduler_job_id] = constants.DONE
+            self._exit_info[scheduler_job_id] = (
+                constants.FINISHED_REGULARLY, exit_value, None, None)
+
+    def get_job_status(self, scheduler_job_id):
+        with self._lock:
+            return self._status.get(scheduler_job_id, constants.UNDETERMINED)
+
+    def get_job_exit_info(self, scheduler_job_id):
+        with self._lock:
+            return self._exit_info.get(scheduler_job_id,
+                                       (constants.EXIT_UNDETERMINED, None,
+                                        None, None))
+
+    def kill_job(self, scheduler_job_id):
+        with self._lock:
+            self._status[scheduler_job_id] = constants.FAILED
+            self._exit_info[scheduler_job_id] = (
+                constants.USER_KILLED, None, None, None)
+
+
+class CompletingScheduler(BenchmarkScheduler):
+
+    '''
+    Fake scheduler: submitted jobs end immediately. If notify is True, the
+    scheduler notifies the status changes (see
+    Scheduler.add_status_changes_callback()), otherwise it has to be
+    polled.
+    '''
+
+    def __init__(self, notify=True):
+        super(CompletingScheduler, self).__init__()
+        self.notifies_status_changes = notify
+
+    def job_submission(self, job):
+        scheduler_job_id = super(CompletingScheduler,
+                                 self).job_submission(job)
+        self.finish_job(scheduler_job_id)
+        if self.notifies_status_changes:
+            self._notify_status_changes()
+        return scheduler_job_id
+
+
+class SlowSubmissionScheduler(BenchmarkScheduler):
+
+    '''
+    Fake scheduler: each submission lasts latency seconds, like a round trip
+    to a batch system. The submissions are run by up to
+    max_parallel_submissions threads; the highest number of concurrent
+    submissions is recorded in max_concurrent_submissions.
+    '''
+
+    def __init__(self, latency, max_parallel_submissions=1):
+        super(SlowSubmissionScheduler, self).__init__()
+        self.latency = latency
+        self.max_parallel_submissions = max_parallel_submissions
+        self._submissions = 0
+        self.max_concurrent_submissions = 0
+
+    def job_submission(self, job):
+        with self._lock:
+            self._submissions += 1
+            self.max_concurrent_submissions = max(
+                self.max_concurrent_submissions, self._submissions)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self._submissions -= 1
+        return super(SlowSubmissionScheduler, self).job_submission(job)
+
+
+def make_workflow(njobs, ntransfers=0, name='benchmark'):
+    '''
+    Build a workflow of njobs independent jobs. The ntransfers first jobs
+    read an input file transfer which is never transfered, so that they
+    stay pending.
+    '''
+    jobs = []
+    for i in range(njobs):
+        inputs = []
+        if i < ntransfers:
+            inputs = [FileTransfer(True, '/tmp/swf_benchmark_%d' % i)]
+        jobs.append(Job(command=['true'], name='job_%d' % i,
+                        referenced_input_files=inputs))
+    return Workflow(jobs, name=name)
+
+
+def make_chain_workflow(njobs, name='benchmark_chain'):
+    '''
+    Build a workflow of njobs jobs, each one depending on the previous one.
+    '''
+    jobs = [Job(command=['true'], name='job_%d' % i) for i in range(njobs)]
+    dependencies = list(zip(jobs[:-1], jobs[1:]))
+    return Workflow(jobs, dependencies, name=name)
+
+
+@contextmanager
+def temporary_database_server(server_class=None, **kwargs):
+    '''
+    Context manager giving a WorkflowDatabaseServer working on a temporary
+    database file and transfers directory, removed afterwards.
+    '''
+    if server_class is None:
+        from soma_workflow.database_server import WorkflowDatabaseServer
+        server_class = WorkflowDatabaseServer
+    tmpdir = tempfile.mkdtemp(prefix='swf_bench_')
+    database_file = os.path.join(tmpdir, 'soma_workflow.db')
+    transfer_dir = os.path.join(tmpdir, 'transfered_files')
+    os.mkdir(transfer_dir)
+    server = server_class(database_file, transfer_dir, **kwargs)
+    try:
+        yield server
+    finally:
+        server.close_connections()
+        shutil.rmtree(tmpdir)
+
+
+def print_stats(title, durations):
+    '''
+    Print the mean, median, min and max of a list of durations (seconds).
+    '''
+    if not durations:
+        print('%s: no measure' % title)
+        return
+    durations = sorted(durations)
+    mean = sum(durations) / len(durations)
+    median = durations[len(durations) // 2]
+    print('%s: mean %.2f ms, median %.2f ms, min %.2f ms, max %.2f ms '
+          '(%d samples)' % (title, mean * 1000., median * 1000.,
+                            durations[0] * 1000., durations[-1] * 1000.,
+                            len(durations)))
+
+
+def timed(function, *args, **kwargs):
+    '''
+    Call function and return (elapsed time in seconds, result).
+    '''
+    t0 = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - t0, result
@@ -0,0 +1,74 @@
+from __future__ import with_statement, print_function
+
+'''
+Job completion to dependent submission latency benchmark.
+
+A chain workflow, where each job depends on the previous one, is submitted
+to a WorkflowEngineLoop driven by a fake scheduler whose jobs end as soon as
+they are submitted. The time to run the whole chain is thus the sum of the
+engine latencies between the end of a job and the submission of the next
+one. It is measured with a scheduler which notifies the job status changes
+(event driven loop) and with a scheduler which has to be polled every time
+interval.
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.chain_latency [-j 1000]
+'''
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from soma_workflow.engine import WorkflowEngineLoop, EngineLoopThread
+from soma_workflow.test.benchmarks.bench_utils import CompletingScheduler, \
+    make_chain_workflow, temporary_database_server
+
+
+def run_chain(njobs, notify, time_interval):
+    '''
+    Returns the time to run a chain of njobs jobs (seconds).
+    '''
+    with temporary_database_server() as server:
+        scheduler = CompletingScheduler(notify=notify)
+        engine_loop = WorkflowEngineLoop(server, scheduler)
+        thread = EngineLoopThread(engine_loop)
+        thread.time_interval = time_interval
+        thread.daemon = True
+        thread.start()
+        start = time.time()
+        engine_loop.add_workflow(make_chain_workflow(njobs),
+                                 datetime.now() + timedelta(days=1),
+                                 'chain_latency_benchmark', None)
+        while not engine_loop.are_jobs_and_workflow_done():
+            time.sleep(0.001)
+        duration = time.time() - start
+        thread.stop()
+    return duration
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Job completion to dependent submission latency '
+        'benchmark.')
+    parser.add_argument('-j', '--jobs', type=int, default=1000,
+                        help='number of jobs in the chain')
+    parser.add_argument('-p', '--polled-jobs', type=int, default=50,
+                        help='number of jobs in the chain with the polled '
+                        'scheduler')
+    parser.add_argument('-i', '--interval', type=float, default=0.1,
+                        help='time interval of the loop, in seconds')
+    options = parser.parse_args(argv)
+
+    for title, notify, njobs in (
+            ('event driven', True, options.jobs),
+            ('polling every %g s' % options.interval, False,
+             options.polled_jobs)):
+        duration = run_chain(njobs, notify, options.interval)
+        print('%s: %d jobs chain in %.2f s, %.2f ms per job'
+              % (title, njobs, duration, duration * 1000. / njobs))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,92 @@
+from __future__ import with_statement, print_function
+
+'''
+Engine loop iteration latency benchmark.
+
+A workflow is submitted to a WorkflowEngineLoop driven by a fake scheduler
+which keeps the jobs running forever, and a part of the jobs wait for input
+transfers which never happen. Each loop iteration thus performs the full
+status scan and the database updates of a busy engine. The latency of loop
+iterations is measured with the time interval set to 0, with and without
+persistent database connections.
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.engine_loop [-j 5000] [-t 1000]
+'''
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from soma_workflow.database_server import WorkflowDatabaseServer
+from soma_workflow.engine import WorkflowEngineLoop, EngineLoopThread
+from soma_workflow.test.benchmarks.bench_utils import BenchmarkScheduler, \
+    make_workflow, temporary_database_server, print_stats
+
+
+class TickingDatabaseServer(WorkflowDatabaseServer):
+
+    '''
+    Database server recording the time of each engine loop iteration.
+    workflows_to_delete_and_kill() is called once at the beginning of every
+    iteration as long as the engine manages workflows.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(TickingDatabaseServer, self).__init__(*args, **kwargs)
+        self.ticks = []
+
+    def workflows_to_delete_and_kill(self, user_id):
+        self.ticks.append(time.time())
+        return super(TickingDatabaseServer,
+                     self).workflows_to_delete_and_kill(user_id)
+
+
+def run_engine_loop(njobs, ntransfers, iterations, **server_kwargs):
+    '''
+    Returns the list of iteration durations (seconds).
+    '''
+    with temporary_database_server(TickingDatabaseServer,
+                                   **server_kwargs) as server:
+        scheduler = BenchmarkScheduler()
+        engine_loop = WorkflowEngineLoop(server, scheduler)
+        engine_loop.add_workflow(make_workflow(njobs, ntransfers),
+                                 datetime.now() + timedelta(days=1),
+                                 'engine_loop_benchmark', None)
+        thread = EngineLoopThread(engine_loop)
+        thread.time_interval = 0
+        thread.daemon = True
+        thread.start()
+        # the first iterations submit jobs: skip them
+        while len(server.ticks) < iterations + 3:
+            time.sleep(0.05)
+        thread.stop()
+        ticks = server.ticks[2:iterations + 3]
+    return [t1 - t0 for t0, t1 in zip(ticks[:-1], ticks[1:])]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Engine loop iteration latency benchmark.')
+    parser.add_argument('-j', '--jobs', type=int, default=5000,
+                        help='number of jobs in the workflow')
+    parser.add_argument('-t', '--transfers', type=int, default=1000,
+                        help='number of jobs waiting for an input transfer')
+    parser.add_argument('-i', '--iterations', type=int, default=10,
+                        help='number of measured loop iterations')
+    options = parser.parse_args(argv)
+
+    print('workflow: %d jobs, %d transfers'
+          % (options.jobs, options.transfers))
+    for title, kwargs in (
+            ('connection per request', {'persistent_connections': False}),
+            ('persistent connections', {'persistent_connections': True})):
+        durations = run_engine_loop(options.jobs, options.transfers,
+                                    options.iterations, **kwargs)
+        print_stats('loop iteration, %s' % title, durations)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
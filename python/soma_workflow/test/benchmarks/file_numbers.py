@@ -0,0 +1,116 @@
+from __future__ import with_statement, print_function
+
+'''
+File numbers allocation benchmark.
+
+Server side file paths (job stdout / stderr files, transfers) get a number
+allocated by WorkflowDatabaseServer.get_new_file_number(). This benchmark
+measures the generation of server side paths:
+
+* with generate_file_path() calls, outside of any submission,
+* during the submission of a workflow of independent jobs, which needs two
+  paths (stdout and stderr) per job.
+
+With --list, the former allocator, which kept the reserved numbers in a
+list and popped them from its front, is measured too, for comparison.
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.file_numbers [-n 200000]
+'''
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from soma_workflow.database_server import WorkflowDatabaseServer
+from soma_workflow.engine_types import EngineWorkflow
+from soma_workflow.test.benchmarks.bench_utils import make_workflow, \
+    temporary_database_server, timed
+
+
+class ListFileNumbersDatabaseServer(WorkflowDatabaseServer):
+
+    '''
+    Database server keeping the reserved file numbers in a list, as
+    get_new_file_number() used to do.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self._free_file_counters = []
+        super(ListFileNumbersDatabaseServer, self).__init__(*args, **kwargs)
+
+    def reserve_file_numbers(self, external_cursor=None, num_files=200):
+        with self._lock:
+            count = super(ListFileNumbersDatabaseServer,
+                          self).reserve_file_numbers(external_cursor,
+                                                     num_files)
+            self._free_file_counters = list(range(count, count + num_files))
+            return count
+
+    def ensure_file_numbers_available(self, num_files, num_realloc=0,
+                                      external_cursor=None):
+        with self._lock:
+            if len(self._free_file_counters) >= num_files:
+                return
+            num_alloc = num_files - len(self._free_file_counters)
+            if num_realloc > num_alloc:
+                num_alloc = num_realloc
+            self.reserve_file_numbers(external_cursor, num_alloc)
+
+    def get_new_file_number(self, external_cursor=None):
+        with self._lock:
+            self.ensure_file_numbers_available(1, 200, external_cursor)
+            return self._free_file_counters.pop(0)
+
+
+def run_generate_file_path(npaths, server_class=None):
+    '''
+    Time (seconds) to generate npaths paths with generate_file_path().
+    '''
+    with temporary_database_server(server_class) as server:
+        user_id = server.register_user('benchmark')
+        return timed(lambda: [server.generate_file_path(user_id,
+                                                        login='benchmark')
+                              for i in range(npaths)])[0]
+
+
+def run_submission(njobs, server_class=None):
+    '''
+    Time (seconds) to insert in the database a workflow of njobs jobs,
+    which allocates 2 * njobs paths.
+    '''
+    with temporary_database_server(server_class) as server:
+        user_id = server.register_user('benchmark')
+        engine_workflow = EngineWorkflow(
+            make_workflow(njobs), {}, None,
+            datetime.now() + timedelta(days=1), 'file_numbers_benchmark')
+        return timed(server.add_workflow, user_id, engine_workflow,
+                     login='benchmark')[0]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='File numbers allocation benchmark.')
+    parser.add_argument('-n', '--paths', type=int, default=200000,
+                        help='number of generated paths')
+    parser.add_argument('--list', action='store_true',
+                        help='also measure the former list based allocator')
+    options = parser.parse_args(argv)
+
+    servers = [('range allocator', None)]
+    if options.list:
+        servers.append(('list allocator', ListFileNumbersDatabaseServer))
+    for title, server_class in servers:
+        duration = run_generate_file_path(options.paths, server_class)
+        print('%s, %d generate_file_path() calls: %.2f s (%.0f paths/s)'
+              % (title, options.paths, duration, options.paths / duration))
+        duration = run_submission(options.paths // 2, server_class)
+        print('%s, submission of %d jobs (%d paths): %.2f s '
+              '(%.0f paths/s)'
+              % (title, options.paths // 2, options.paths, duration,
+                 options.paths / duration))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
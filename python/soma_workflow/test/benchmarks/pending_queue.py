@@ -0,0 +1,96 @@
+from __future__ import with_statement, print_function
+
+'''
+Pending submission queue benchmark.
+
+Ready jobs of random priorities are pushed in a PendingJobQueue, as
+WorkflowEngineLoop._pend_for_submission() does, then all taken back in
+submission order. With --sorted-list, the former queue (a list sorted again
+after each insertion, from which the jobs were popped at the front) is
+measured too, for comparison.
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.pending_queue [-j 1000 50000]
+'''
+
+import argparse
+import random
+import sys
+
+from soma_workflow.engine import PendingJobQueue
+from soma_workflow.test.benchmarks.bench_utils import timed
+
+
+class FakeJob(object):
+
+    def __init__(self, priority, workflow_id):
+        self.priority = priority
+        self.workflow_id = workflow_id
+
+
+class SortedListQueue(object):
+
+    '''
+    Pending queue as a list sorted by priority after each insertion.
+    '''
+
+    def __init__(self):
+        self._jobs = []
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def push(self, job):
+        self._jobs.append(job)
+        self._jobs.sort(key=lambda job: job.priority, reverse=True)
+
+    def pop(self):
+        return self._jobs.pop(0)
+
+
+def run_queue(queue, jobs):
+    '''
+    Returns (push time, pop time), in seconds.
+    '''
+    def push_all():
+        for job in jobs:
+            queue.push(job)
+
+    def pop_all():
+        while len(queue):
+            queue.pop()
+
+    return timed(push_all)[0], timed(pop_all)[0]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Pending submission queue benchmark.')
+    parser.add_argument('-j', '--jobs', type=int, nargs='+',
+                        default=[1000, 10000, 50000],
+                        help='numbers of pending jobs')
+    parser.add_argument('-w', '--workflows', type=int, default=10,
+                        help='number of workflows the jobs belong to')
+    parser.add_argument('--sorted-list', action='store_true',
+                        help='also measure the former sorted list queue')
+    options = parser.parse_args(argv)
+
+    queues = [('heap', PendingJobQueue),
+              ('heap, fair share', lambda: PendingJobQueue(fair_share=True))]
+    if options.sorted_list:
+        queues.append(('sorted list', SortedListQueue))
+    random.seed(0)
+    for njobs in options.jobs:
+        jobs = [FakeJob(random.randint(0, 10),
+                        random.randint(1, options.workflows))
+                for i in range(njobs)]
+        for title, queue_factory in queues:
+            push_time, pop_time = run_queue(queue_factory(), jobs)
+            print('%d jobs, %s: push %.3f s, pop %.3f s (%.1f jobs/s)'
+                  % (njobs, title, push_time, pop_time,
+                     njobs / (push_time + pop_time)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,115 @@
+from __future__ import with_statement, print_function
+
+'''
+Read / write contention benchmark.
+
+A workflow is run by a WorkflowEngineLoop (as in the engine_loop benchmark)
+while monitoring threads poll its detailed status, as GUIs and clients do.
+The engine loop iteration latency and the throughput of the status requests
+are measured, with status requests using read-only connections outside the
+server lock, and with status requests holding the server lock (as all the
+requests used to do).
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.read_contention [-j 5000] [-r 4]
+'''
+
+import argparse
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from soma_workflow.engine import WorkflowEngineLoop, EngineLoopThread
+from soma_workflow.test.benchmarks.bench_utils import BenchmarkScheduler, \
+    make_workflow, temporary_database_server, print_stats
+from soma_workflow.test.benchmarks.engine_loop import TickingDatabaseServer
+
+
+class LockedReadsDatabaseServer(TickingDatabaseServer):
+
+    '''
+    Database server serializing the status requests with the writes.
+    '''
+
+    def _connect(self, read_only=False):
+        return super(LockedReadsDatabaseServer, self)._connect()
+
+    def get_detailed_workflow_status(self, *args, **kwargs):
+        with self._lock:
+            return super(LockedReadsDatabaseServer,
+                         self).get_detailed_workflow_status(*args, **kwargs)
+
+
+def run_contention(njobs, ntransfers, nreaders, iterations, server_class):
+    '''
+    Returns (list of loop iteration durations, list of status request
+    durations), in seconds.
+    '''
+    with temporary_database_server(server_class) as server:
+        scheduler = BenchmarkScheduler()
+        engine_loop = WorkflowEngineLoop(server, scheduler)
+        wf_id = engine_loop.add_workflow(
+            make_workflow(njobs, ntransfers),
+            datetime.now() + timedelta(days=1),
+            'read_contention_benchmark', None)
+        thread = EngineLoopThread(engine_loop)
+        thread.time_interval = 0
+        thread.daemon = True
+        thread.start()
+        # the first iterations submit jobs
+        while len(server.ticks) < 3:
+            time.sleep(0.05)
+
+        stop = threading.Event()
+        requests = []
+
+        def poll_status():
+            while not stop.is_set():
+                t0 = time.time()
+                server.get_detailed_workflow_status(wf_id)
+                requests.append(time.time() - t0)
+
+        first_tick = len(server.ticks)
+        readers = [threading.Thread(target=poll_status)
+                   for i in range(nreaders)]
+        for reader in readers:
+            reader.start()
+        while len(server.ticks) < first_tick + iterations + 1:
+            time.sleep(0.05)
+        stop.set()
+        for reader in readers:
+            reader.join()
+        thread.stop()
+        ticks = server.ticks[first_tick:first_tick + iterations + 1]
+    return [t1 - t0 for t0, t1 in zip(ticks[:-1], ticks[1:])], requests
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Read / write contention benchmark.')
+    parser.add_argument('-j', '--jobs', type=int, default=5000,
+                        help='number of jobs in the workflow')
+    parser.add_argument('-t', '--transfers', type=int, default=1000,
+                        help='number of jobs waiting for an input transfer')
+    parser.add_argument('-r', '--readers', type=int, default=4,
+                        help='number of threads polling the workflow status')
+    parser.add_argument('-i', '--iterations', type=int, default=10,
+                        help='number of measured loop iterations')
+    options = parser.parse_args(argv)
+
+    print('workflow: %d jobs, %d transfers, %d status readers'
+          % (options.jobs, options.transfers, options.readers))
+    for title, server_class in (
+            ('locked reads', LockedReadsDatabaseServer),
+            ('read-only connections', TickingDatabaseServer)):
+        loop_durations, request_durations = run_contention(
+            options.jobs, options.transfers, options.readers,
+            options.iterations, server_class)
+        print_stats('%s: loop iteration' % title, loop_durations)
+        print_stats('%s: status request' % title, request_durations)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+from __future__ import with_statement, print_function
+
+'''
+Workflow submission benchmark.
+
+Workflows of increasing sizes, each job reading one input file transfer,
+are registered in a temporary database using
+WorkflowDatabaseServer.add_workflow(). The time to build the EngineWorkflow
+and the time to insert it in the database are measured separately.
+With --row-by-row, the former insertion method (one add_transfer() /
+add_job() call per element) is measured too, for comparison.
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.submission [-j 1000 10000 100000]
+'''
+
+import argparse
+import pickle
+import sys
+from datetime import datetime, timedelta
+
+import six
+
+from soma_workflow.database_server import WorkflowDatabaseServer
+from soma_workflow.engine_types import EngineWorkflow
+from soma_workflow.test.benchmarks.bench_utils import make_workflow, \
+    temporary_database_server, timed
+
+
+class RowByRowDatabaseServer(WorkflowDatabaseServer):
+
+    '''
+    Database server registering workflow elements one by one, as
+    add_workflow() used to do.
+    '''
+
+    def add_workflow(self, user_id, engine_workflow, login=None):
+        with self._lock:
+            self.ensure_file_numbers_available(
+                len(engine_workflow.transfer_mapping)
+                + len(engine_workflow.job_mapping) * 2)
+            connection = self._connect()
+            cursor = connection.cursor()
+            try:
+                cursor.execute(
+                    'INSERT INTO workflows (user_id, expiration_date, name, '
+                    'status, last_status_update) VALUES (?, ?, ?, ?, ?)',
+                    (user_id, engine_workflow.expiration_date,
+                     engine_workflow.name, 'benchmark', datetime.now()))
+                engine_workflow.wf_id = cursor.lastrowid
+                for transfer in six.itervalues(
+                        engine_workflow.transfer_mapping):
+                    transfer.workflow_id = engine_workflow.wf_id
+                    self.add_transfer(transfer, user_id,
+                                      engine_workflow.expiration_date,
+                                      external_cursor=cursor)
+                for job in six.itervalues(engine_workflow.job_mapping):
+                    job.workflow_id = engine_workflow.wf_id
+                    self.add_job(user_id, job,
+                                 engine_workflow.expiration_date,
+                                 external_cursor=cursor, login=login)
+                cursor.execute(
+                    'UPDATE workflows SET pickled_engine_workflow=? '
+                    'WHERE id=?',
+                    (pickle.dumps(engine_workflow), engine_workflow.wf_id))
+            except Exception:
+                connection.rollback()
+                cursor.close()
+                connection.close()
+                raise
+            connection.commit()
+            cursor.close()
+            connection.close()
+        return engine_workflow
+
+
+def run_submission(njobs, server_class=None):
+    '''
+    Returns (EngineWorkflow build time, database insertion time), in
+    seconds.
+    '''
+    with temporary_database_server(server_class) as server:
+        user_id = server.register_user('benchmark')
+        client_workflow = make_workflow(njobs, njobs)
+        build_time, engine_workflow = timed(
+            EngineWorkflow, client_workflow, {}, None,
+            datetime.now() + timedelta(days=1), 'submission_benchmark')
+        insert_time = timed(server.add_workflow, user_id, engine_workflow,
+                            login='benchmark')[0]
+    return build_time, insert_time
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Workflow submission benchmark.')
+    parser.add_argument('-j', '--jobs', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='numbers of jobs of the submitted workflows')
+    parser.add_argument('--row-by-row', action='store_true',
+                        help='also measure the insertion of elements one '
+                        'by one')
+    options = parser.parse_args(argv)
+
+    servers = [('bulk insertion', None)]
+    if options.row_by_row:
+        servers.append(('row by row insertion', RowByRowDatabaseServer))
+    for njobs in options.jobs:
+        for title, server_class in servers:
+            build_time, insert_time = run_submission(njobs, server_class)
+            print('%d jobs, %s: build %.2f s, database %.2f s '
+                  '(%.1f jobs/s)'
+                  % (njobs, title, build_time, insert_time,
+                     njobs / insert_time))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
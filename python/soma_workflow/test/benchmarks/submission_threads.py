@@ -0,0 +1,76 @@
+from __future__ import with_statement, print_function
+
+'''
+Job submission throughput of the engine loop.
+
+A workflow of independent jobs is submitted to a WorkflowEngineLoop driven by
+a fake scheduler which submissions last a fixed latency, like the round trips
+to a batch system through DRMAA. The time until all the jobs are submitted,
+and the submission metrics of the loop, are reported for several numbers of
+submission threads.
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.submission_threads [-j 500]
+        [-l 10] [-t 1 4 16]
+'''
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from soma_workflow.engine import WorkflowEngineLoop, EngineLoopThread
+from soma_workflow.test.benchmarks.bench_utils import \
+    SlowSubmissionScheduler, make_workflow, temporary_database_server
+
+
+def run_submissions(njobs, latency, nthreads):
+    '''
+    Returns (time until all the jobs are submitted, submission metrics).
+    '''
+    with temporary_database_server() as server:
+        scheduler = SlowSubmissionScheduler(latency, nthreads)
+        engine_loop = WorkflowEngineLoop(server, scheduler)
+        engine_loop.add_workflow(make_workflow(njobs),
+                                 datetime.now() + timedelta(days=1),
+                                 'submission_threads', None)
+        thread = EngineLoopThread(engine_loop)
+        thread.time_interval = 0
+        thread.daemon = True
+        start = time.time()
+        thread.start()
+        try:
+            while scheduler._count < njobs:
+                time.sleep(0.01)
+            duration = time.time() - start
+        finally:
+            thread.stop()
+        return duration, engine_loop.submission_metrics()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Job submission throughput of the engine loop.')
+    parser.add_argument('-j', '--jobs', type=int, default=500,
+                        help='number of jobs')
+    parser.add_argument('-l', '--latency', type=float, default=10.,
+                        help='duration of a submission, in milliseconds')
+    parser.add_argument('-t', '--threads', type=int, nargs='+',
+                        default=[1, 4, 16],
+                        help='numbers of submission threads')
+    options = parser.parse_args(argv)
+
+    print('%d jobs, submission latency %.1f ms'
+          % (options.jobs, options.latency))
+    for nthreads in options.threads:
+        duration, metrics = run_submissions(options.jobs,
+                                            options.latency / 1000.,
+                                            nthreads)
+        print('%d threads: all jobs submitted in %.2f s, %.1f jobs/s '
+              '(%d submission stages)'
+              % (nthreads, duration, metrics['rate'], metrics['batches']))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
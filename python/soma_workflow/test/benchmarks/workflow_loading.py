@@ -0,0 +1,86 @@
+from __future__ import with_statement, print_function
+
+'''
+Workflow loading benchmark.
+
+Workflows of increasing sizes, each job reading one input file transfer,
+are registered in a temporary database, then loaded back with
+WorkflowDatabaseServer.get_engine_workflow(), as WorkflowEngine.workflow()
+and the workflow restarts do. The workflow is loaded from the pickle of the
+whole EngineWorkflow stored in pickled_engine_workflow, then, once the
+pickle is removed, from its structured representation (workflows.structure
+and jobs.definition). In both cases, the state of the elements is read from
+their rows.
+
+Usage::
+
+    python -m soma_workflow.test.benchmarks.workflow_loading
+        [-j 1000 10000 100000]
+'''
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from soma_workflow.engine_types import EngineWorkflow
+from soma_workflow.test.benchmarks.bench_utils import make_workflow, \
+    temporary_database_server, timed
+
+
+def run_loading(njobs):
+    '''
+    Returns ((pickle load time, stored size),
+             (structured load time, stored size)), in seconds and bytes.
+    '''
+    with temporary_database_server() as server:
+        user_id = server.register_user('workflow_loading_benchmark')
+        workflow = server.add_workflow(
+            user_id,
+            EngineWorkflow(make_workflow(njobs, ntransfers=njobs), {}, None,
+                           datetime.now() + timedelta(days=1),
+                           'workflow_loading'),
+            login='workflow_loading_benchmark')
+        connection = server._connect()
+        try:
+            structure_size = connection.execute(
+                'SELECT length(structure) FROM workflows WHERE id=?',
+                [workflow.wf_id]).fetchone()[0]
+            structure_size += connection.execute(
+                'SELECT sum(length(definition)) FROM jobs '
+                'WHERE workflow_id=?', [workflow.wf_id]).fetchone()[0]
+            pickle_size = connection.execute(
+                'SELECT length(pickled_engine_workflow) FROM workflows '
+                'WHERE id=?', [workflow.wf_id]).fetchone()[0]
+            pickle_time = timed(server.get_engine_workflow,
+                                workflow.wf_id, user_id)[0]
+
+            connection.execute(
+                'UPDATE workflows SET pickled_engine_workflow=NULL '
+                'WHERE id=?', [workflow.wf_id])
+            connection.commit()
+            structure_time = timed(server.get_engine_workflow,
+                                   workflow.wf_id, user_id)[0]
+        finally:
+            connection.close()
+    return ((pickle_time, pickle_size),
+            (structure_time, structure_size))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Workflow loading benchmark.')
+    parser.add_argument('-j', '--jobs', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='numbers of jobs of the workflows')
+    options = parser.parse_args(argv)
+
+    for njobs in options.jobs:
+        ((pickle_time, pickle_size),
+         (structure_time, structure_size)) = run_loading(njobs)
+        print('%d jobs: pickle %.2f s (%.1f MB), structure %.2f s (%.1f MB)'
+              % (njobs, pickle_time, pickle_size / 1e6,
+                 structure_time, structure_size / 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,1489 @@
+from __future__ import print_function
+
+'''
+Unit tests of the database server schema and queries.
+'''
+
+import gc
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import six
+
+import soma_workflow.constants as constants
+import soma_workflow.database_server as database_server
+from soma_workflow.client import FileTransfer, TemporaryPath, Job, Workflow, \
+    Group
+from soma_workflow.database_server import WorkflowDatabaseServer, \
+    get_database_version
+from soma_workflow.engine import WorkflowEngine
+from soma_workflow.engine_types import EngineTransfer, EngineTemporaryPath, \
+    EngineWorkflow, EngineJob
+from soma_workflow.errors import DatabaseError, UnknownObjectError
+from soma_workflow.info import DB_VERSION
+from soma_workflow.test.benchmarks.bench_utils import BenchmarkScheduler
+
+
+class DatabaseServerTestCase(unittest.TestCase):
+
+    #: storage backend of the tested servers
+    backend = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='swf_test_')
+        self.database_file = os.path.join(self.tmpdir, 'soma_workflow.db')
+        self.transfer_dir = os.path.join(self.tmpdir, 'transfered_files')
+        os.mkdir(self.transfer_dir)
+        self.server = WorkflowDatabaseServer(self.database_file,
+                                             self.transfer_dir,
+                                             backend=self.backend)
+
+    def tearDown(self):
+        self.server.close_connections()
+        shutil.rmtree(self.tmpdir)
+
+    def raw_connection(self):
+        if self.backend == 'memory':
+            return self.server._backend.connect()
+        return sqlite3.connect(self.database_file)
+
+
+class SchemaUpgradeTest(DatabaseServerTestCase):
+
+    def set_version(self, version):
+        self.server.close_connections()
+        connection = self.raw_connection()
+        connection.execute('UPDATE db_version SET version=?', [version])
+        connection.commit()
+        connection.close()
+
+    def test_new_database_version(self):
+        connection = self.raw_connection()
+        self.assertEqual(get_database_version(connection.cursor()),
+                         DB_VERSION)
+        connection.close()
+
+    def schema(self, database_file):
+        connection = sqlite3.connect(database_file)
+        schema = {}
+        for name, sql in connection.execute(
+                "SELECT name, sql FROM sqlite_master WHERE sql IS NOT NULL "
+                "AND type IN ('table', 'index')"):
+            if name.startswith('sqlite_'):
+                continue
+            schema[name] = [row[1:] for row in connection.execute(
+                'PRAGMA table_info(%s)' % name)]
+        connection.close()
+        return schema
+
+    def test_upgrade_from_1_1(self):
+        # create a database without applying the upgrades
+        old_database_file = os.path.join(self.tmpdir, 'soma_workflow_1_1.db')
+        upgrade_database = database_server.upgrade_database
+        database_server.upgrade_database = lambda connection: None
+        try:
+            database_server.create_database(old_database_file)
+        finally:
+            database_server.upgrade_database = upgrade_database
+        connection = sqlite3.connect(old_database_file)
+        self.assertEqual(get_database_version(connection.cursor()),
+                         database_server.BASE_DB_VERSION)
+        connection.close()
+
+        server = WorkflowDatabaseServer(old_database_file, self.transfer_dir)
+        server.close_connections()
+        connection = sqlite3.connect(old_database_file)
+        self.assertEqual(get_database_version(connection.cursor()),
+                         DB_VERSION)
+        connection.close()
+        self.server.close_connections()
+        self.assertEqual(self.schema(old_database_file),
+                         self.schema(self.database_file))
+
+    def test_unknown_version(self):
+        self.set_version('0.1')
+        self.assertRaises(DatabaseError, WorkflowDatabaseServer,
+                          self.database_file, self.transfer_dir)
+
+
+class QueryPlanTest(DatabaseServerTestCase):
+
+    '''
+    The frequent queries of the engine loop and of the cleaning functions
+    must use an index, not scan the whole tables.
+    '''
+
+    def assertIndexed(self, table, query, args):
+        connection = self.raw_connection()
+        plan = [row[-1] for row in connection.execute(
+            'EXPLAIN QUERY PLAN ' + query, args)]
+        connection.close()
+        table_plan = [detail for detail in plan
+                      if (' %s ' % table) in (' %s ' % detail)]
+        self.assertTrue(len(table_plan) != 0, repr(plan))
+        for detail in table_plan:
+            self.assertTrue('USING' in detail and 'INDEX' in detail,
+                            'query not indexed: %s\nplan: %s'
+                            % (query, repr(plan)))
+
+    def test_jobs_workflow_id(self):
+        self.assertIndexed('jobs', 'SELECT id, status FROM jobs '
+                           'WHERE workflow_id=?', [1])
+        self.assertIndexed('jobs', 'SELECT id, status FROM jobs '
+                           'WHERE workflow_id=? AND revision>? '
+                           'AND revision<=?', [1, 0, 10])
+        self.assertIndexed('jobs', 'SELECT workflow_id, queue, status, '
+                           'count(*) FROM jobs WHERE workflow_id IN (?,?) '
+                           'GROUP BY workflow_id, queue, status', [1, 2])
+
+    def test_jobs_user_status(self):
+        self.assertIndexed('jobs', 'SELECT id FROM jobs '
+                           'WHERE user_id=? AND status=?',
+                           [1, constants.DELETE_PENDING])
+
+    def test_nb_jobs(self):
+        self.assertIndexed('jobs', 'SELECT count(*) FROM jobs WHERE '
+                           'user_id=? and ( status=? or status=? '
+                           'or status=?) and queue=?',
+                           [1, constants.RUNNING, constants.QUEUED_ACTIVE,
+                            constants.UNDETERMINED, 'queue'])
+        self.assertIndexed('jobs', 'SELECT count(*) FROM jobs WHERE '
+                           'user_id=? and ( status=? or status=?) '
+                           'and queue ISNULL',
+                           [1, constants.QUEUED_ACTIVE,
+                            constants.UNDETERMINED])
+
+    def test_jobs_expiration_date(self):
+        self.assertIndexed('jobs', 'SELECT id FROM jobs '
+                           'WHERE expiration_date < ?', ['2000-01-01'])
+
+    def test_expiration_date(self):
+        self.assertIndexed('transfers', 'SELECT engine_file_path '
+                           'FROM transfers WHERE expiration_date<? '
+                           'LIMIT ?', ['2000-01-01', 10])
+        self.assertIndexed('temporary_paths', 'SELECT temp_path_id '
+                           'FROM temporary_paths WHERE expiration_date<? '
+                           'LIMIT ?', ['2000-01-01', 10])
+        self.assertIndexed('workflows', 'SELECT id FROM workflows '
+                           'WHERE expiration_date<? LIMIT ?',
+                           ['2000-01-01', 10])
+
+    def test_transfers_workflow_id(self):
+        self.assertIndexed('transfers', 'SELECT engine_file_path, status '
+                           'FROM transfers WHERE workflow_id=?', [1])
+        self.assertIndexed('transfers', 'SELECT engine_file_path, status '
+                           'FROM transfers WHERE workflow_id IN (?, ?) '
+                           'AND revision>? AND revision<=?', [1, 2, 0, 3])
+
+    def test_ended_transfers_workflow_id(self):
+        self.assertIndexed('ended_transfers', 'SELECT id, workflow_id, '
+                           'engine_file_path FROM ended_transfers '
+                           'WHERE workflow_id IN (?, ?) ORDER BY id', [1, 2])
+
+    def test_temporary_paths_workflow_id(self):
+        self.assertIndexed('temporary_paths', 'SELECT temp_path_id, status '
+                           'FROM temporary_paths WHERE workflow_id=?', [1])
+        self.assertIndexed('temporary_paths', 'SELECT temp_path_id, status '
+                           'FROM temporary_paths WHERE workflow_id IN (?, ?) '
+                           'AND revision>? AND revision<=?', [1, 2, 0, 3])
+
+    def test_ios_engine_file_path(self):
+        self.assertIndexed('ios', 'SELECT DISTINCT engine_file_path FROM ios '
+                           'WHERE engine_file_path IN (?, ?)', ['a', 'b'])
+        self.assertIndexed('ios_tmp', 'SELECT DISTINCT temp_path_id '
+                           'FROM ios_tmp WHERE temp_path_id IN (?, ?)',
+                           [1, 2])
+
+
+class TransfersStatusTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(TransfersStatusTest, self).setUp()
+        self.user_id = self.server.register_user('swf_test_user')
+        expiration_date = datetime.now() + timedelta(days=1)
+        self.transfers = []
+        for i in range(7):
+            transfer = EngineTransfer(FileTransfer(True, '/tmp/file_%d' % i))
+            self.server.add_transfer(transfer, self.user_id,
+                                    expiration_date)
+            self.transfers.append(transfer)
+        self.temporaries = []
+        for i in range(3):
+            temp = EngineTemporaryPath(TemporaryPath())
+            self.server.add_temporary_path(temp, self.user_id,
+                                          expiration_date)
+            self.temporaries.append(temp)
+        self.server.set_transfer_status(self.transfers[2].engine_path,
+                                        constants.FILES_ON_CR)
+        self.server.set_temporary_status(self.temporaries[1].temp_path_id,
+                                         constants.FILES_ON_CR)
+        self.max_var = database_server._sqlite3_max_variable_number
+
+    def tearDown(self):
+        database_server._sqlite3_max_variable_number = self.max_var
+        super(TransfersStatusTest, self).tearDown()
+
+    def check_transfers_status(self):
+        ids = [t.engine_path for t in self.transfers] \
+            + [t.temp_path_id for t in self.temporaries] \
+            + ['/unknown/transfer']
+        status = self.server.get_transfers_status(ids, self.user_id)
+        self.assertEqual(len(status), len(ids) - 1)
+        for transfer_id in ids[:-1]:
+            self.assertEqual(status[transfer_id],
+                             self.server.get_transfer_status(transfer_id,
+                                                             self.user_id))
+        self.assertEqual(status[self.transfers[2].engine_path],
+                         constants.FILES_ON_CR)
+        self.assertEqual(status[self.temporaries[1].temp_path_id],
+                         constants.FILES_ON_CR)
+        self.assertEqual(
+            self.server.get_transfers_status(ids, self.user_id + 1), {})
+
+    def test_transfers_status(self):
+        self.check_transfers_status()
+
+    def test_transfers_status_chunks(self):
+        # force several queries per table
+        database_server._sqlite3_max_variable_number = 3
+        self.check_transfers_status()
+
+
+class TransfersChangesTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(TransfersChangesTest, self).setUp()
+        self.user_id = self.server.register_user('swf_test_user')
+        expiration_date = datetime.now() + timedelta(days=1)
+        self.transfers = []
+        self.temporaries = []
+        for workflow_id in (1, 2):
+            for i in range(3):
+                transfer = EngineTransfer(
+                    FileTransfer(True, '/tmp/file_%d_%d' % (workflow_id, i)))
+                transfer.workflow_id = workflow_id
+                self.server.add_transfer(transfer, self.user_id,
+                                        expiration_date)
+                self.transfers.append(transfer)
+            temp = EngineTemporaryPath(TemporaryPath())
+            temp.workflow_id = workflow_id
+            self.server.add_temporary_path(temp, self.user_id,
+                                          expiration_date)
+            self.temporaries.append(temp)
+
+    def test_no_change(self):
+        revision, status = self.server.get_transfers_changes([1, 2], 0)
+        self.assertEqual(status, {})
+        self.assertEqual(
+            self.server.get_transfers_changes([1, 2], revision),
+            (revision, {}))
+
+    def test_changes_since_revision(self):
+        revision, status = self.server.get_transfers_changes([1, 2], 0)
+        self.server.set_transfer_status(self.transfers[1].engine_path,
+                                        constants.FILES_ON_CR)
+        self.server.set_temporary_status(self.temporaries[1].temp_path_id,
+                                         constants.FILES_DO_NOT_EXIST)
+        self.server.set_transfer_status(self.transfers[4].engine_path,
+                                        constants.FILES_ON_CR)
+        revision2, status = self.server.get_transfers_changes([1, 2],
+                                                              revision)
+        self.assertEqual(revision2, revision + 3)
+        self.assertEqual(status,
+                         {self.transfers[1].engine_path:
+                          constants.FILES_ON_CR,
+                          self.temporaries[1].temp_path_id:
+                          constants.FILES_DO_NOT_EXIST,
+                          self.transfers[4].engine_path:
+                          constants.FILES_ON_CR})
+        # filtered by workflow and user
+        self.assertEqual(
+            self.server.get_transfers_changes([1], revision)[1],
+            {self.transfers[1].engine_path: constants.FILES_ON_CR})
+        self.assertEqual(
+            self.server.get_transfers_changes([1, 2], revision,
+                                              self.user_id + 1)[1], {})
+        # setting the same status again is not a change
+        self.server.set_transfer_status(self.transfers[1].engine_path,
+                                        constants.FILES_ON_CR)
+        self.assertEqual(
+            self.server.get_transfers_changes([1, 2], revision2),
+            (revision2, {}))
+        self.server.set_transfer_status(self.transfers[1].engine_path,
+                                        constants.TRANSFERING_FROM_CR_TO_CLIENT)
+        self.assertEqual(
+            self.server.get_transfers_changes([1, 2], revision2),
+            (revision2 + 1, {self.transfers[1].engine_path:
+                             constants.TRANSFERING_FROM_CR_TO_CLIENT}))
+
+
+class WorkflowsStatusTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(WorkflowsStatusTest, self).setUp()
+        self.user_id = self.server.register_user('swf_test_user')
+        self.server.close_connections()
+        self.last_update = (datetime.now()
+                            - timedelta(seconds=5)).replace(microsecond=0)
+        connection = self.raw_connection()
+        for status in (constants.WORKFLOW_NOT_STARTED,
+                       constants.WORKFLOW_IN_PROGRESS,
+                       constants.DELETE_PENDING):
+            connection.execute(
+                'INSERT INTO workflows (user_id, expiration_date, status, '
+                'last_status_update) VALUES (?, ?, ?, ?)',
+                (self.user_id, datetime.now() + timedelta(days=1), status,
+                 self.last_update))
+        connection.commit()
+        connection.close()
+
+    def workflows(self):
+        connection = self.raw_connection()
+        workflows = dict(
+            (wf_id, (status, datetime.strptime(
+                last_update, database_server.strtime_format)))
+            for wf_id, status, last_update in connection.execute(
+                'SELECT id, status, last_status_update FROM workflows'))
+        connection.close()
+        return workflows
+
+    def test_set_workflows_status(self):
+        self.server.set_workflows_status(
+            {1: constants.WORKFLOW_IN_PROGRESS,
+             2: constants.WORKFLOW_IN_PROGRESS,
+             3: constants.WORKFLOW_IN_PROGRESS})
+        workflows = self.workflows()
+        self.assertEqual(workflows[1][0], constants.WORKFLOW_IN_PROGRESS)
+        self.assertTrue(workflows[1][1] > self.last_update)
+        # unchanged: the date is updated only every update_interval
+        self.assertEqual(workflows[2], (constants.WORKFLOW_IN_PROGRESS,
+                                        self.last_update))
+        # pending deletion
+        self.assertEqual(workflows[3], (constants.DELETE_PENDING,
+                                        self.last_update))
+
+    def test_set_workflows_status_force(self):
+        self.server.set_workflows_status(
+            {2: constants.WORKFLOW_IN_PROGRESS,
+             3: constants.WORKFLOW_DONE}, force=True)
+        workflows = self.workflows()
+        self.assertEqual(workflows[1], (constants.WORKFLOW_NOT_STARTED,
+                                        self.last_update))
+        self.assertEqual(workflows[2][0], constants.WORKFLOW_IN_PROGRESS)
+        self.assertTrue(workflows[2][1] > self.last_update)
+        self.assertEqual(workflows[3][0], constants.WORKFLOW_DONE)
+
+    def test_update_interval(self):
+        update_interval = database_server.update_interval
+        database_server.update_interval = timedelta(seconds=1)
+        try:
+            self.server.set_workflows_status(
+                {2: constants.WORKFLOW_IN_PROGRESS})
+        finally:
+            database_server.update_interval = update_interval
+        workflows = self.workflows()
+        self.assertEqual(workflows[2][0], constants.WORKFLOW_IN_PROGRESS)
+        self.assertTrue(workflows[2][1] > self.last_update)
+
+
+class JobsStatusDateTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(JobsStatusDateTest, self).setUp()
+        self.user_id = self.server.register_user('swf_test_user')
+        self.server.close_connections()
+        self.last_update = (datetime.now()
+                            - timedelta(seconds=5)).replace(microsecond=0)
+        connection = self.raw_connection()
+        for workflow_id in (-1, -1, 1, 1, 2):
+            connection.execute(
+                'INSERT INTO jobs (user_id, expiration_date, status, '
+                'last_status_update, workflow_id, join_errout, stdout_file, '
+                'custom_submission) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.user_id, datetime.now() + timedelta(days=1),
+                 constants.RUNNING, self.last_update, workflow_id, False,
+                 '/tmp/stdout', False))
+        connection.commit()
+        connection.close()
+
+    def test_refresh_jobs_status_date(self):
+        self.server.refresh_jobs_status_date([1], [1])
+        connection = self.raw_connection()
+        refreshed = [job_id for job_id, last_update in connection.execute(
+            'SELECT id, last_status_update FROM jobs ORDER BY id')
+            if datetime.strptime(last_update, database_server.strtime_format)
+            > self.last_update]
+        connection.close()
+        self.assertEqual(refreshed, [1, 3, 4])
+
+
+class AddWorkflowTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(AddWorkflowTest, self).setUp()
+        self.user_id = self.server.register_user('swf_test_user')
+
+    def add_workflow(self, njobs):
+        jobs = []
+        for i in range(njobs):
+            in_file = FileTransfer(True, '/tmp/swf_in_%d.txt' % i)
+            temp = TemporaryPath()
+            jobs.append(Job(command=['cp', in_file, temp], name='job_%d' % i,
+                            referenced_input_files=[in_file],
+                            referenced_output_files=[temp]))
+        workflow = EngineWorkflow(Workflow(jobs), {}, None,
+                                  datetime.now() + timedelta(days=1),
+                                  'test')
+        return self.server.add_workflow(self.user_id, workflow,
+                                        login='swf_test_user')
+
+    def test_add_workflow(self):
+        workflow = self.add_workflow(5)
+        self.assertEqual(len(workflow.registered_jobs), 5)
+        self.assertEqual(len(workflow.registered_tr), 10)
+        connection = self.raw_connection()
+        jobs = dict(connection.execute(
+            'SELECT id, name FROM jobs WHERE workflow_id=?',
+            [workflow.wf_id]))
+        self.assertEqual(
+            jobs, dict((job_id, job.name) for job_id, job
+                       in six.iteritems(workflow.registered_jobs)))
+        for job_id, job in six.iteritems(workflow.registered_jobs):
+            in_file = workflow.transfer_mapping[
+                job.referenced_input_files[0]]
+            temp = workflow.transfer_mapping[job.referenced_output_files[0]]
+            self.assertEqual(
+                list(connection.execute(
+                    'SELECT engine_file_path, is_input FROM ios '
+                    'WHERE job_id=?', [job_id])),
+                [(in_file.engine_path, 1)])
+            self.assertEqual(
+                list(connection.execute(
+                    'SELECT temp_path_id, is_input FROM ios_tmp '
+                    'WHERE job_id=?', [job_id])),
+                [(temp.temp_path_id, 0)])
+            self.assertEqual(
+                six.next(connection.execute(
+                    'SELECT workflow_id FROM temporary_paths '
+                    'WHERE temp_path_id=?', [temp.temp_path_id]))[0],
+                workflow.wf_id)
+        connection.close()
+
+    def test_ids_not_reused(self):
+        workflow = self.add_workflow(3)
+        last_job_id = max(workflow.registered_jobs)
+        last_temp_id = max(tr_id for tr_id in workflow.registered_tr
+                           if isinstance(tr_id, int))
+        self.server.delete_workflow(workflow.wf_id)
+        workflow = self.add_workflow(3)
+        self.assertEqual(sorted(workflow.registered_jobs),
+                         list(range(last_job_id + 1, last_job_id + 4)))
+        self.assertEqual(
+            min(tr_id for tr_id in workflow.registered_tr
+                if isinstance(tr_id, int)), last_temp_id + 1)
+        # ids assigned by SQLite still follow the block
+        job = self.server.add_job(self.user_id,
+                                  list(workflow.registered_jobs.values())[0])
+        self.assertEqual(job.job_id, last_job_id + 4)
+
+
+    def drop_pickle(self, workflow):
+        # workflows registered without pickle are rebuilt from their
+        # structure
+        connection = self.raw_connection()
+        connection.execute('UPDATE workflows SET pickled_engine_workflow=NULL '
+                           'WHERE id=?', [workflow.wf_id])
+        connection.commit()
+        connection.close()
+
+    def test_get_engine_workflow(self):
+        self.check_get_engine_workflow(from_pickle=True)
+
+    def test_get_engine_workflow_structure(self):
+        self.check_get_engine_workflow(from_pickle=False)
+
+    def check_get_engine_workflow(self, from_pickle):
+        workflow = self.add_workflow(4)
+        connection = self.raw_connection()
+        self.assertEqual(
+            [value is not None for value in six.next(connection.execute(
+                'SELECT pickled_engine_workflow, structure FROM workflows '
+                'WHERE id=?', [workflow.wf_id]))], [True, True])
+        connection.close()
+        if not from_pickle:
+            self.drop_pickle(workflow)
+        job_id = min(workflow.registered_jobs)
+        self.server.set_job_status(job_id, constants.RUNNING)
+        in_path = workflow.transfer_mapping[
+            workflow.registered_jobs[job_id].referenced_input_files[0]
+        ].engine_path
+        self.server.set_transfer_status(in_path,
+                                        constants.FILES_ON_CLIENT)
+
+        loaded = self.server.get_engine_workflow(workflow.wf_id,
+                                                 self.user_id)
+        self.assertEqual(loaded.wf_id, workflow.wf_id)
+        self.assertEqual(loaded.name, 'test')
+        self.assertEqual(sorted(loaded.registered_jobs),
+                         sorted(workflow.registered_jobs))
+        self.assertEqual(sorted(loaded.registered_tr, key=str),
+                         sorted(workflow.registered_tr, key=str))
+        for loaded_id, loaded_job in six.iteritems(loaded.registered_jobs):
+            job = workflow.registered_jobs[loaded_id]
+            self.assertEqual(loaded_job.name, job.name)
+            self.assertEqual(loaded_job.plain_command(), job.plain_command())
+            self.assertEqual(loaded_job.workflow_id, workflow.wf_id)
+        self.assertEqual(
+            sorted(job.job_id for job in six.itervalues(loaded.job_mapping)),
+            sorted(loaded.registered_jobs))
+        self.assertEqual(loaded.registered_jobs[job_id].status,
+                         constants.RUNNING)
+        self.assertEqual(loaded.registered_tr[in_path].status,
+                         constants.FILES_ON_CLIENT)
+        self.assertEqual(len(loaded.dependencies), 0)
+
+    def test_detailed_status_changes(self):
+        workflow = self.add_workflow(3)
+        job_ids = sorted(workflow.registered_jobs)
+        revision, status = self.server.get_detailed_workflow_status_changes(
+            workflow.wf_id)
+        self.assertEqual(status, self.server.get_detailed_workflow_status(
+            workflow.wf_id))
+        self.assertEqual(
+            self.server.get_detailed_workflow_status_changes(
+                workflow.wf_id, revision),
+            (revision, ([], [], status[2], status[3], [])))
+
+        self.server.set_jobs_status({job_ids[0]: constants.RUNNING})
+        self.server.set_jobs_status({job_ids[0]: constants.RUNNING,
+                                     job_ids[1]: constants.QUEUED_ACTIVE})
+        self.server.set_queue('fast', [job_ids[2]])
+        in_path = workflow.transfer_mapping[
+            workflow.registered_jobs[job_ids[0]].referenced_input_files[0]
+        ].engine_path
+        self.server.set_transfer_status(in_path, constants.FILES_ON_CR)
+        new_revision, changes \
+            = self.server.get_detailed_workflow_status_changes(
+                workflow.wf_id, revision)
+        self.assertEqual(new_revision, revision + 4)
+        self.assertEqual(
+            sorted((job[0], job[1], job[2]) for job in changes[0]),
+            [(job_ids[0], constants.RUNNING, None),
+             (job_ids[1], constants.QUEUED_ACTIVE, None),
+             (job_ids[2], constants.NOT_SUBMITTED, 'fast')])
+        self.assertEqual([(tr[0], tr[3]) for tr in changes[1]],
+                         [(in_path, constants.FILES_ON_CR)])
+        self.assertEqual(changes[4], [])
+
+        self.server.set_jobs_exit_info(
+            {job_ids[1]: workflow.registered_jobs[job_ids[1]]})
+        changes = self.server.get_detailed_workflow_status_changes(
+            workflow.wf_id, new_revision)[1]
+        self.assertEqual([job[0] for job in changes[0]], [job_ids[1]])
+
+    def test_workflows_summary(self):
+        workflow = self.add_workflow(4)
+        other_workflow = self.add_workflow(2)
+        job_ids = sorted(workflow.registered_jobs)
+        self.server.set_jobs_status({job_ids[0]: constants.RUNNING})
+        self.server.set_jobs_status({job_ids[0]: constants.DONE,
+                                     job_ids[1]: constants.RUNNING})
+        self.server.set_queue('fast', [job_ids[3]])
+
+        summary = self.server.get_workflows_summary(self.user_id)
+        self.assertEqual(sorted(summary),
+                         sorted([workflow.wf_id, other_workflow.wf_id]))
+        wf_summary = summary[workflow.wf_id]
+        self.assertEqual(wf_summary['name'], 'test')
+        self.assertEqual(wf_summary['job_count'], 4)
+        self.assertEqual(wf_summary['status_counts'],
+                         {constants.DONE: 1, constants.RUNNING: 1,
+                          constants.NOT_SUBMITTED: 2})
+        self.assertEqual(wf_summary['queue_counts'],
+                         {None: {constants.DONE: 1, constants.RUNNING: 1,
+                                 constants.NOT_SUBMITTED: 1},
+                          'fast': {constants.NOT_SUBMITTED: 1}})
+        self.assertEqual(wf_summary['progress'], 25.)
+        self.assertTrue(wf_summary['first_execution_date'] is not None)
+        self.assertTrue(wf_summary['last_ending_date'] is not None)
+        self.assertTrue(wf_summary['mean_duration'] >= 0)
+        self.assertTrue(wf_summary['eta'] is not None)
+        self.assertEqual(summary[other_workflow.wf_id]['status_counts'],
+                         {constants.NOT_SUBMITTED: 2})
+        self.assertEqual(summary[other_workflow.wf_id]['eta'], None)
+
+        self.assertEqual(
+            list(self.server.get_workflows_summary(
+                self.user_id, [other_workflow.wf_id])),
+            [other_workflow.wf_id])
+        other_user = self.server.register_user('other_user')
+        self.assertEqual(
+            self.server.get_workflows_summary(other_user,
+                                              [workflow.wf_id]), {})
+
+    def test_workflows_summary_chunks(self):
+        # full chunks of workflow ids, on connections binding at most 3
+        # variables
+        if not hasattr(sqlite3.Connection, 'setlimit'):
+            self.skipTest('the sqlite3 limits cannot be set')
+        workflows = [self.add_workflow(1) for i in range(4)]
+        wf_ids = [workflow.wf_id for workflow in workflows]
+        connect = self.server._connect
+
+        def limited_connect(*args, **kwargs):
+            connection = connect(*args, **kwargs)
+            connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 3)
+            return connection
+
+        max_var = database_server._sqlite3_max_variable_number
+        database_server._sqlite3_max_variable_number = 3
+        self.server._connect = limited_connect
+        try:
+            summary = self.server.get_workflows_summary(self.user_id, wf_ids)
+        finally:
+            database_server._sqlite3_max_variable_number = max_var
+            del self.server._connect
+        self.assertEqual(sorted(summary), sorted(wf_ids))
+        for wf_summary in six.itervalues(summary):
+            self.assertEqual(wf_summary['job_count'], 1)
+
+    def test_get_engine_workflow_groups(self):
+        jobs = [Job(command=['echo', str(i)], name='job_%d' % i)
+                for i in range(3)]
+        group = Group(jobs[1:], name='group')
+        workflow = EngineWorkflow(
+            Workflow(jobs, dependencies=[(jobs[0], group)],
+                     root_group=[jobs[0], group]),
+            {}, None, datetime.now() + timedelta(days=1), 'test')
+        workflow = self.server.add_workflow(self.user_id, workflow,
+                                            login='swf_test_user')
+        self.drop_pickle(workflow)
+        loaded = self.server.get_engine_workflow(workflow.wf_id,
+                                                 self.user_id)
+        self.assertEqual(len(loaded.groups), 1)
+        self.assertEqual(loaded.groups[0].name, 'group')
+        self.assertEqual(
+            sorted((loaded.job_mapping[a].job_id,
+                    loaded.job_mapping[b].job_id)
+                   for a, b in loaded.dependencies),
+            sorted((workflow.job_mapping[a].job_id,
+                    workflow.job_mapping[b].job_id)
+                   for a, b in workflow.dependencies))
+
+    def test_gc_paused(self):
+        # overlapping blocks, as in concurrent threads
+        self.assertTrue(gc.isenabled())
+        first = database_server.gc_paused()
+        second = database_server.gc_paused()
+        first.__enter__()
+        second.__enter__()
+        self.assertFalse(gc.isenabled())
+        first.__exit__(None, None, None)
+        # still paused for the second block
+        self.assertFalse(gc.isenabled())
+        second.__exit__(None, None, None)
+        self.assertTrue(gc.isenabled())
+
+
+class FileNumbersTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(FileNumbersTest, self).setUp()
+        self.server.close_connections()
+        self.server = WorkflowDatabaseServer(self.database_file,
+                                             self.transfer_dir,
+                                             file_number_block_size=2,
+                                             max_file_number_block_size=8)
+
+    def file_counter(self):
+        connection = self.raw_connection()
+        count = six.next(connection.execute(
+            'SELECT count FROM fileCounter'))[0]
+        connection.close()
+        return count
+
+    def test_get_new_file_number(self):
+        first = self.file_counter()
+        numbers = [self.server.get_new_file_number() for i in range(20)]
+        self.assertEqual(numbers, list(range(first, first + 20)))
+        # quick reservations: the blocks grow up to the maximum size
+        self.assertEqual(self.server._file_number_block, 8)
+        self.assertEqual(self.file_counter(),
+                         first + 20 + self.server.available_file_numbers())
+
+    def test_ensure_file_numbers_available(self):
+        first = self.server.get_new_file_number()
+        self.assertEqual(self.server.available_file_numbers(), 1)
+        self.server.ensure_file_numbers_available(10)
+        # the new range follows the current one
+        self.assertEqual(self.server.available_file_numbers(), 11)
+        self.assertEqual(self.server.get_new_file_number(), first + 1)
+
+    def test_shared_counter(self):
+        first = self.server.get_new_file_number()
+        other = WorkflowDatabaseServer(self.database_file, self.transfer_dir)
+        other_first = other.reserve_file_numbers(num_files=5)
+        other.close_connections()
+        self.assertEqual(other_first, first + 2)
+        self.assertEqual(self.server.get_new_file_number(), first + 1)
+        # the numbers reserved by the other server are skipped
+        self.assertEqual(self.server.get_new_file_number(), first + 7)
+
+
+class EndedTransfersTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(EndedTransfersTest, self).setUp()
+        self.user_id = self.server.register_user('swf_test_user')
+        connection = self.raw_connection()
+        self.workflow_ids = []
+        for i in range(3):
+            self.workflow_ids.append(connection.execute(
+                'INSERT INTO workflows (user_id, expiration_date, status, '
+                'last_status_update) VALUES (?, ?, ?, ?)',
+                (self.user_id, datetime.now() + timedelta(days=1),
+                 constants.WORKFLOW_IN_PROGRESS, datetime.now())).lastrowid)
+        connection.commit()
+        connection.close()
+
+    def test_pop_workflows_ended_transfers(self):
+        wf1, wf2, wf3 = self.workflow_ids
+        self.assertEqual(
+            self.server.pop_workflows_ended_transfers(self.workflow_ids), {})
+        self.server.add_workflow_ended_transfer(wf1, '/tmp/a')
+        self.server.add_workflow_ended_transfer(wf2, '/tmp/b')
+        self.server.add_workflow_ended_transfer(wf1, '/tmp/c')
+        self.server.add_workflow_ended_transfer(wf3, '/tmp/d')
+        self.assertEqual(
+            self.server.pop_workflows_ended_transfers([wf1, wf2]),
+            {wf1: ['/tmp/a', '/tmp/c'], wf2: ['/tmp/b']})
+        self.assertEqual(
+            self.server.pop_workflows_ended_transfers([wf1, wf2]), {})
+        self.assertEqual(self.server.pop_workflow_ended_transfer(wf3),
+                         ['/tmp/d'])
+        self.assertEqual(self.server.pop_workflow_ended_transfer(wf3), [])
+
+    def test_upgrade_from_1_6(self):
+        wf1, wf2, wf3 = self.workflow_ids
+        self.server.close_connections()
+        connection = self.raw_connection()
+        connection.execute('DROP TABLE ended_transfers')
+        connection.execute('UPDATE workflows SET ended_transfers=? '
+                           'WHERE id=?', ('/tmp/a, /tmp/b', wf2))
+        connection.execute('UPDATE db_version SET version=?', ['1.6'])
+        connection.commit()
+        connection.close()
+        self.server = WorkflowDatabaseServer(self.database_file,
+                                             self.transfer_dir,
+                                             backend=self.backend)
+        self.assertEqual(
+            self.server.pop_workflows_ended_transfers(self.workflow_ids),
+            {wf2: ['/tmp/a', '/tmp/b']})
+
+
+class ReadConnectionsTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(ReadConnectionsTest, self).setUp()
+        self.user_id = self.server.register_user('swf_test_user')
+        transfer = EngineTransfer(FileTransfer(True, '/tmp/file_0'))
+        transfer.workflow_id = 1
+        self.server.add_transfer(transfer, self.user_id,
+                                 datetime.now() + timedelta(days=1))
+        self.engine_path = transfer.engine_path
+
+    def test_reads_do_not_wait_for_the_lock(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            with self.server._lock:
+                locked.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait()
+        result = []
+        reader = threading.Thread(
+            target=lambda: result.append(self.server.get_transfer_status(
+                self.engine_path, self.user_id)))
+        reader.start()
+        reader.join(10)
+        release.set()
+        thread.join()
+        self.assertEqual(result, [constants.FILES_ON_CLIENT])
+
+    def test_read_only(self):
+        connection = self.server._connect(read_only=True)
+        try:
+            self.assertRaises(sqlite3.OperationalError, connection.execute,
+                              'DELETE FROM transfers')
+        finally:
+            connection.close()
+
+
+class CleanTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(CleanTest, self).setUp()
+        self.server.clean_batch_size = 2
+        self.user_id = self.server.register_user('swf_test_user')
+
+    def add_workflow(self, njobs, expiration_date):
+        jobs = []
+        for i in range(njobs):
+            in_file = FileTransfer(True, '/tmp/swf_in_%d.txt' % i)
+            temp = TemporaryPath()
+            jobs.append(Job(command=['cp', in_file, temp], name='job_%d' % i,
+                            referenced_input_files=[in_file],
+                            referenced_output_files=[temp]))
+        workflow = EngineWorkflow(Workflow(jobs), {}, None, expiration_date,
+                                  'test')
+        workflow = self.server.add_workflow(self.user_id, workflow,
+                                            login='swf_test_user')
+        files = []
+        for job in six.itervalues(workflow.registered_jobs):
+            files += [job.stdout_file, job.stderr_file]
+        for transfer in six.itervalues(workflow.transfer_mapping):
+            files.append(transfer.engine_path)
+        for path in files:
+            open(path, 'w').close()
+        return workflow, files
+
+    def count(self, table):
+        connection = self.raw_connection()
+        count = six.next(connection.execute(
+            'SELECT count(*) FROM %s' % table))[0]
+        connection.close()
+        return count
+
+    def check_cleaned(self, expired_files, valid_files):
+        for table in ('jobs', 'transfers', 'temporary_paths', 'ios',
+                      'ios_tmp'):
+            self.assertEqual(self.count(table), 2)
+        self.assertEqual(self.count('workflows'), 1)
+        for path in expired_files:
+            self.assertFalse(os.path.exists(path), path)
+        for path in valid_files:
+            self.assertTrue(os.path.exists(path), path)
+
+    def test_clean(self):
+        expired, expired_files = self.add_workflow(
+            5, datetime.now() - timedelta(days=2))
+        valid, valid_files = self.add_workflow(
+            2, datetime.now() + timedelta(days=1))
+        counts = self.server.clean()
+        self.assertEqual(counts['jobs'], 5)
+        self.assertEqual(counts['transfers'], 5)
+        self.assertEqual(counts['temporary_paths'], 5)
+        self.assertEqual(counts['workflows'], 1)
+        self.assertEqual(counts['files'], 20)
+        # batches of 2 items of each kind
+        self.assertEqual(counts['batches'], 3)
+        self.check_cleaned(expired_files, valid_files)
+        self.assertEqual(self.server.cleaning_status()['total'], counts)
+        self.assertEqual(self.server.clean()['batches'], 0)
+
+    def test_custom_submission_files(self):
+        stdout_file = os.path.join(self.tmpdir, 'custom_stdout')
+        open(stdout_file, 'w').close()
+        job = EngineJob(Job(command=['ls'], stdout_file=stdout_file),
+                        None)
+        self.server.add_job(self.user_id, job,
+                            datetime.now() - timedelta(days=2))
+        self.assertEqual(self.server.clean()['jobs'], 1)
+        self.assertTrue(os.path.exists(stdout_file))
+
+    def test_background_cleaning(self):
+        self.server.close_connections()
+        self.server = WorkflowDatabaseServer(self.database_file,
+                                             self.transfer_dir,
+                                             backend=self.backend,
+                                             background_cleaning=True,
+                                             clean_batch_size=2,
+                                             file_removal_threads=3)
+        expired, expired_files = self.add_workflow(
+            5, datetime.now() - timedelta(days=2))
+        valid, valid_files = self.add_workflow(
+            2, datetime.now() + timedelta(days=1))
+        self.assertEqual(self.server.clean(vacuum=True), None)
+        self.server._cleaner.wait()
+        status = self.server.cleaning_status()
+        self.assertFalse(status['running'])
+        self.assertEqual(status['counts']['jobs'], 5)
+        self.assertEqual(status['counts']['files'], 20)
+        self.check_cleaned(expired_files, valid_files)
+
+
+class SweepTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(SweepTest, self).setUp()
+        self.user_id = self.server.register_user('swf_test_user')
+        self.registered = []
+        for i in range(3):
+            transfer = EngineTransfer(FileTransfer(True, '/tmp/file_%d' % i))
+            transfer.workflow_id = 1
+            self.server.add_transfer(transfer, self.user_id,
+                                     datetime.now() + timedelta(days=1))
+            self.registered.append(transfer.engine_path)
+        temp = EngineTemporaryPath(TemporaryPath())
+        temp.workflow_id = 1
+        self.server.add_temporary_path(temp, self.user_id,
+                                       datetime.now() + timedelta(days=1))
+        self.registered.append(temp.engine_path)
+        self.directory = os.path.dirname(self.registered[0])
+        self.orphans = [os.path.join(self.directory, 'orphan_%d' % i)
+                        for i in range(5)]
+        os.mkdir(self.orphans[0])
+        for path in self.registered + self.orphans[1:]:
+            open(path, 'w').close()
+        past = time.time() - 3600
+        for path in self.registered + self.orphans:
+            os.utime(path, (past, past))
+        self.recent = os.path.join(self.directory, 'recent')
+
+    def check_swept(self):
+        for path in self.registered:
+            self.assertTrue(os.path.exists(path), path)
+        for path in self.orphans:
+            self.assertFalse(os.path.exists(path), path)
+
+    def test_remove_non_registered_files(self):
+        self.server.sweep_batch_size = 2
+        removed = self.server.remove_non_registered_files()
+        self.assertEqual(removed, 5)
+        self.check_swept()
+
+    def test_recent_files_kept(self):
+        # file written during the sweep
+        open(self.recent, 'w').close()
+        future = time.time() + 3600
+        os.utime(self.recent, (future, future))
+        self.assertEqual(self.server.remove_non_registered_files(), 5)
+        self.assertTrue(os.path.exists(self.recent))
+
+    def test_background_sweeping(self):
+        self.server.close_connections()
+        self.server = WorkflowDatabaseServer(self.database_file,
+                                             self.transfer_dir,
+                                             background_sweeping=True)
+        self.assertEqual(self.server.remove_non_registered_files(), None)
+        self.server._sweeper.wait()
+        self.check_swept()
+
+
+class CacheTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(CacheTest, self).setUp()
+        self.server.close_connections()
+        self.server = WorkflowDatabaseServer(self.database_file,
+                                             self.transfer_dir,
+                                             backend=self.backend,
+                                             cache=True)
+        self.user_id = self.server.register_user('swf_test_user')
+        jobs = [Job(command=['echo', str(i)], name='job_%d' % i)
+                for i in range(4)]
+        self.workflow = self.server.add_workflow(
+            self.user_id,
+            EngineWorkflow(Workflow(jobs), {}, None,
+                           datetime.now() + timedelta(days=1), 'test'),
+            login='swf_test_user')
+        self.job_ids = sorted(self.workflow.registered_jobs)
+
+    def set_raw_status(self, table, row_id, status):
+        connection = self.raw_connection()
+        connection.execute('UPDATE %s SET status=? WHERE id=?' % table,
+                           [status, row_id])
+        connection.commit()
+        connection.close()
+
+    def test_status_read_from_cache(self):
+        job_id = self.job_ids[0]
+        wf_id = self.workflow.wf_id
+        self.server.set_job_status(job_id, constants.RUNNING)
+        self.server.set_workflow_status(wf_id,
+                                        constants.WORKFLOW_IN_PROGRESS)
+        # changes made behind the server are not seen any longer
+        self.set_raw_status('jobs', job_id, constants.FAILED)
+        self.set_raw_status('workflows', wf_id, constants.WORKFLOW_DONE)
+        self.assertEqual(
+            self.server.get_job_status(job_id, self.user_id)[0],
+            constants.RUNNING)
+        self.assertEqual(
+            self.server.get_workflow_status(wf_id, self.user_id)[0],
+            constants.WORKFLOW_IN_PROGRESS)
+        # other users do not see them
+        self.assertRaises(Exception, self.server.get_job_status, job_id,
+                          self.user_id + 1)
+
+    def test_workflow_evicted_when_done(self):
+        wf_id = self.workflow.wf_id
+        self.server.set_jobs_status(dict((job_id, constants.DONE)
+                                         for job_id in self.job_ids))
+        self.server.set_workflows_status(
+            {wf_id: constants.WORKFLOW_DONE})
+        self.assertEqual(self.server._cache.jobs, {})
+        self.assertEqual(self.server._cache.workflows, {})
+        self.set_raw_status('jobs', self.job_ids[0], constants.FAILED)
+        self.assertEqual(
+            self.server.get_job_status(self.job_ids[0], self.user_id)[0],
+            constants.FAILED)
+
+    def test_nb_jobs(self):
+        self.assertEqual(self.server.nb_running_jobs(self.user_id), 0)
+        self.server.set_jobs_status({self.job_ids[0]: constants.RUNNING,
+                                     self.job_ids[1]: constants.RUNNING,
+                                     self.job_ids[2]:
+                                     constants.QUEUED_ACTIVE})
+        self.assertEqual(self.server.nb_running_jobs(self.user_id), 3)
+        self.assertEqual(self.server.nb_queued_jobs(self.user_id), 1)
+        self.server.set_queue('long', self.job_ids[:2])
+        self.assertEqual(self.server.nb_running_jobs(self.user_id), 1)
+        self.assertEqual(self.server.nb_running_jobs(self.user_id, 'long'),
+                         2)
+        self.server.set_job_status(self.job_ids[0], constants.DONE)
+        self.assertEqual(self.server.nb_running_jobs(self.user_id, 'long'),
+                         1)
+        # the counts follow the database
+        counts = self.server._cache.counts
+        self.server._cache.counts = None
+        self.assertEqual(self.server.nb_running_jobs(self.user_id, 'long'),
+                         1)
+        self.assertEqual(self.server._cache.counts,
+                         dict((key, count) for key, count in counts.items()
+                              if count))
+
+    def test_nb_jobs_not_cached(self):
+        self.assertEqual(self.server.nb_running_jobs(self.user_id), 0)
+        # changes made behind the server are only counted without the cache
+        self.set_raw_status('jobs', self.job_ids[0], constants.RUNNING)
+        self.assertEqual(self.server.nb_running_jobs(self.user_id), 0)
+        self.assertEqual(
+            self.server.nb_running_jobs(self.user_id, cached=False), 1)
+        self.assertEqual(
+            self.server.nb_queued_jobs(self.user_id, cached=False), 0)
+
+    def test_cleaned_jobs(self):
+        self.server.set_job_status(self.job_ids[0], constants.RUNNING)
+        self.server.delete_workflow(self.workflow.wf_id)
+        self.assertEqual(self.server._cache.jobs, {})
+        self.assertEqual(self.server.nb_running_jobs(self.user_id), 0)
+
+
+class ArchiveTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(ArchiveTest, self).setUp()
+        self.server.clean_batch_size = 2
+        self.user_id = self.server.register_user('swf_test_user')
+
+    def add_workflow(self, njobs, expiration_date, status):
+        jobs = []
+        for i in range(njobs):
+            in_file = FileTransfer(True, '/tmp/swf_in_%d.txt' % i)
+            temp = TemporaryPath()
+            jobs.append(Job(command=['cp', in_file, temp], name='job_%d' % i,
+                            referenced_input_files=[in_file],
+                            referenced_output_files=[temp]))
+        workflow = EngineWorkflow(Workflow(jobs), {}, None, expiration_date,
+                                  'test')
+        workflow = self.server.add_workflow(self.user_id, workflow,
+                                            login='swf_test_user')
+        files = []
+        for job in six.itervalues(workflow.registered_jobs):
+            files += [job.stdout_file, job.stderr_file]
+        for transfer in six.itervalues(workflow.transfer_mapping):
+            files.append(transfer.engine_path)
+        for path in files:
+            open(path, 'w').close()
+        connection = self.raw_connection()
+        connection.execute('UPDATE workflows SET status=?, '
+                           'last_status_update=? WHERE id=?',
+                           [status, datetime.now() - timedelta(hours=2),
+                            workflow.wf_id])
+        connection.commit()
+        connection.close()
+        return workflow, files
+
+    def count(self, table):
+        connection = self.raw_connection()
+        count = six.next(connection.execute(
+            'SELECT count(*) FROM %s' % table))[0]
+        connection.close()
+        return count
+
+    def test_archive_workflows(self):
+        workflows = [self.add_workflow(3, datetime.now() + timedelta(days=1),
+                                       constants.WORKFLOW_DONE)
+                     for i in range(3)]
+        running, running_files = self.add_workflow(
+            2, datetime.now() + timedelta(days=1),
+            constants.WORKFLOW_IN_PROGRESS)
+        self.assertEqual(
+            self.server.archive_workflows(timedelta(hours=3)), 0)
+        self.assertEqual(
+            self.server.archive_workflows(timedelta(hours=1)), 3)
+        for table in ('jobs', 'transfers', 'temporary_paths', 'ios',
+                      'ios_tmp'):
+            self.assertEqual(self.count(table), 2)
+        self.assertEqual(self.count('workflows'), 1)
+        self.assertEqual(self.count('archived_workflows'), 3)
+        self.assertEqual(
+            sorted(self.server.get_workflows(self.user_id)),
+            sorted([workflow.wf_id for workflow, files in workflows]
+                   + [running.wf_id]))
+        workflow, files = workflows[0]
+        self.assertEqual(
+            self.server.get_workflows(self.user_id, [workflow.wf_id]),
+            {workflow.wf_id: ('test', workflow.expiration_date.replace(
+                microsecond=0))})
+        data = self.server.get_archived_workflow(workflow.wf_id,
+                                                 self.user_id)
+        self.assertEqual(sorted(job['id'] for job in data['jobs']),
+                         sorted(workflow.registered_jobs))
+        self.assertEqual(len(data['transfers']), 3)
+        self.assertEqual(len(data['temporary_paths']), 3)
+        self.assertEqual(len(data['ios']), 3)
+        self.assertEqual(data['workflow']['status'], constants.WORKFLOW_DONE)
+        self.assertEqual(sorted(data['files']), sorted(files))
+        self.assertRaises(UnknownObjectError,
+                          self.server.get_archived_workflow, running.wf_id,
+                          self.user_id)
+
+        # the files of the archived workflows are kept until they expire
+        self.assertEqual(self.server.remove_non_registered_files(), 0)
+        connection = self.raw_connection()
+        connection.execute('UPDATE archived_workflows SET expiration_date=? '
+                           'WHERE id=?',
+                           [datetime.now() - timedelta(days=2),
+                            workflow.wf_id])
+        connection.commit()
+        connection.close()
+        counts = self.server.clean()
+        self.assertEqual(counts['archived_workflows'], 1)
+        self.assertEqual(counts['files'], len(files))
+        for path in files:
+            self.assertFalse(os.path.exists(path), path)
+        for path in workflows[1][1] + running_files:
+            self.assertTrue(os.path.exists(path), path)
+
+    def test_archived_workflow_engine(self):
+        # the archived workflows listed by the engine can be monitored and
+        # deleted through it
+        engine = WorkflowEngine(self.server, BenchmarkScheduler())
+        try:
+            engine._user_id = self.user_id
+            workflow, files = self.add_workflow(
+                2, datetime.now() + timedelta(days=1),
+                constants.WORKFLOW_DONE)
+            wf_id = workflow.wf_id
+            self.assertEqual(
+                self.server.archive_workflows(timedelta(hours=1)), 1)
+            self.assertTrue(wf_id in engine.workflows())
+            self.assertEqual(self.server.is_valid_workflow(
+                wf_id, self.user_id)[0], True)
+            self.assertEqual(engine.workflow_status(wf_id),
+                             constants.WORKFLOW_DONE)
+            (jobs, transfers, status, queue,
+             temporary_paths) = engine.workflow_elements_status(wf_id)
+            self.assertEqual(status, constants.WORKFLOW_DONE)
+            self.assertEqual(sorted(job[0] for job in jobs),
+                             sorted(workflow.registered_jobs))
+            self.assertEqual(len(transfers), 2)
+            self.assertEqual(len(temporary_paths), 2)
+            engine_workflow = engine.workflow(wf_id)
+            self.assertEqual(sorted(engine_workflow.registered_jobs),
+                             sorted(workflow.registered_jobs))
+            self.assertEqual(engine_workflow.status,
+                             constants.WORKFLOW_DONE)
+            self.assertEqual(engine.archived_workflow(wf_id)['workflow']['id'],
+                             wf_id)
+
+            self.assertTrue(engine.delete_workflow(wf_id))
+            self.assertEqual(self.count('archived_workflows'), 0)
+            for path in files:
+                self.assertFalse(os.path.exists(path), path)
+            self.assertEqual(engine.workflows(), {})
+            self.assertRaises(UnknownObjectError, engine.workflow_status,
+                              wf_id)
+            self.assertRaises(UnknownObjectError, engine.workflow, wf_id)
+        finally:
+            engine.engine_loop_thread.stop()
+
+    def test_archived_workflows_summary(self):
+        workflow, files = self.add_workflow(
+            3, datetime.now() + timedelta(days=1), constants.WORKFLOW_DONE)
+        job_ids = sorted(workflow.registered_jobs)
+        self.server.set_jobs_status({job_ids[0]: constants.RUNNING,
+                                     job_ids[1]: constants.RUNNING})
+        self.server.set_jobs_status({job_ids[0]: constants.DONE,
+                                     job_ids[1]: constants.FAILED})
+        self.server.set_queue('fast', [job_ids[2]])
+        live = self.server.get_workflows_summary(self.user_id)
+        self.assertEqual(
+            self.server.archive_workflows(timedelta(hours=1)), 1)
+
+        for workflow_ids in (None, [workflow.wf_id]):
+            summary = self.server.get_workflows_summary(self.user_id,
+                                                        workflow_ids)
+            self.assertEqual(list(summary), [workflow.wf_id])
+            wf_summary = summary[workflow.wf_id]
+            live_summary = dict(live[workflow.wf_id])
+            self.assertAlmostEqual(wf_summary.pop('mean_duration'),
+                                   live_summary.pop('mean_duration'),
+                                   places=2)
+            # extrapolated from the current date
+            self.assertTrue(wf_summary.pop('eta') is not None)
+            live_summary.pop('eta')
+            self.assertEqual(wf_summary, live_summary)
+            self.assertEqual(wf_summary['queue_counts'],
+                             {None: {constants.DONE: 1,
+                                     constants.FAILED: 1},
+                              'fast': {constants.NOT_SUBMITTED: 1}})
+        other_user = self.server.register_user('other_user')
+        self.assertEqual(
+            self.server.get_workflows_summary(other_user), {})
+
+    def test_maintenance(self):
+        self.server.archive_delay = timedelta(hours=1)
+        for i in range(3):
+            self.add_workflow(20, datetime.now() + timedelta(days=1),
+                              constants.WORKFLOW_DONE)
+        counts = self.server.maintenance()
+        self.assertEqual(counts['archived_workflows'], 3)
+        if self.backend is None:
+            # the pages freed by the archival are released
+            self.assertTrue(counts['pages'] > 0)
+            connection = self.raw_connection()
+            self.assertEqual(six.next(connection.execute(
+                'PRAGMA freelist_count'))[0], 0)
+            connection.close()
+
+    def test_scheduled_maintenance(self):
+        self.server.close_connections()
+        self.server = WorkflowDatabaseServer(
+            self.database_file, self.transfer_dir, backend=self.backend,
+            archive_delay=timedelta(hours=1), maintenance_interval=0.05)
+        self.add_workflow(2, datetime.now() + timedelta(days=1),
+                          constants.WORKFLOW_DONE)
+        start = time.time()
+        while self.count('archived_workflows') == 0:
+            self.assertTrue(time.time() - start < 10.)
+            time.sleep(0.05)
+        self.assertEqual(self.count('workflows'), 0)
+
+    def test_upgrade_from_1_7(self):
+        self.server.close_connections()
+        connection = self.raw_connection()
+        connection.execute('DROP TABLE archived_workflows')
+        connection.execute('DROP INDEX workflows_status_update')
+        connection.execute('UPDATE db_version SET version=?', ['1.7'])
+        connection.commit()
+        connection.close()
+        self.server = WorkflowDatabaseServer(self.database_file,
+                                             self.transfer_dir,
+                                             backend=self.backend)
+        self.assertEqual(self.count('archived_workflows'), 0)
+
+    def test_vacuum_makes_incremental(self):
+        self.server.close_connections()
+        connection = self.raw_connection()
+        connection.execute('PRAGMA auto_vacuum=NONE')
+        connection.execute('VACUUM')
+        connection.close()
+        self.server = WorkflowDatabaseServer(self.database_file,
+                                             self.transfer_dir,
+                                             backend=self.backend)
+        self.assertEqual(self.server.incremental_vacuum(), 0)
+        self.server.vacuum()
+        connection = self.raw_connection()
+        self.assertEqual(six.next(connection.execute(
+            'PRAGMA auto_vacuum'))[0], 2)
+        connection.close()
+
+
+memory_backend = unittest.skipIf(
+    sys.version_info < (3, 4) or sqlite3.sqlite_version_info < (3, 36, 0),
+    'the memory backend needs Python >= 3.4 and SQLite >= 3.36')
+
+
+@memory_backend
+class MemoryBackendTest(DatabaseServerTestCase):
+
+    backend = 'memory'
+
+    def test_memory_databases(self):
+        self.assertFalse(os.path.exists(self.database_file))
+        user_id = self.server.register_user('swf_test_user')
+        # servers with the same database name share the database
+        other = WorkflowDatabaseServer(self.database_file, self.transfer_dir,
+                                       backend='memory')
+        self.assertEqual(other.get_user_login(user_id), 'swf_test_user')
+        other.close_connections()
+        other = WorkflowDatabaseServer(os.path.join(self.tmpdir, 'other.db'),
+                                       self.transfer_dir, backend='memory')
+        self.assertRaises(Exception, other.get_user_login, user_id)
+        other.close_connections()
+
+    def test_uncommitted_writes_are_not_read(self):
+        user_id = self.server.register_user('swf_test_user')
+        connection = self.server._backend.connect()
+        try:
+            connection.execute('UPDATE users SET login=? WHERE id=?',
+                               ['other_user', user_id])
+            # the reader waits for the end of the write transaction
+            rollback = threading.Timer(0.2, connection.rollback)
+            rollback.start()
+            self.assertEqual(self.server.get_user_login(user_id),
+                             'swf_test_user')
+            rollback.join()
+        finally:
+            connection.close()
+
+
+@memory_backend
+class MemoryAddWorkflowTest(AddWorkflowTest):
+    backend = 'memory'
+
+
+@memory_backend
+class MemoryWorkflowsStatusTest(WorkflowsStatusTest):
+    backend = 'memory'
+
+
+@memory_backend
+class MemoryTransfersChangesTest(TransfersChangesTest):
+    backend = 'memory'
+
+
+@memory_backend
+class MemoryReadConnectionsTest(ReadConnectionsTest):
+    backend = 'memory'
+
+
+@memory_backend
+class MemoryCleanTest(CleanTest):
+    backend = 'memory'
+
+
+@memory_backend
+class MemoryEndedTransfersTest(EndedTransfersTest):
+    backend = 'memory'
+
+
+class FailingWriteServer(WorkflowDatabaseServer):
+
+    @database_server.write_behind
+    def failing_write(self):
+        raise ValueError('failing write')
+
+
+class WriteBehindTest(DatabaseServerTestCase):
+
+    def setUp(self):
+        super(WriteBehindTest, self).setUp()
+        self.server.close_connections()
+        # long commit interval: only barriers commit the writes
+        self.server = FailingWriteServer(self.database_file,
+                                         self.transfer_dir,
+                                         backend=self.backend,
+                                         write_behind=True,
+                                         commit_interval=60)
+        self.user_id = self.server.register_user('swf_test_user')
+        self.transfers = []
+        for i in range(3):
+            transfer = EngineTransfer(FileTransfer(True, '/tmp/file_%d' % i))
+            transfer.workflow_id = 1
+            self.server.add_transfer(transfer, self.user_id,
+                                     datetime.now() + timedelta(days=1))
+            self.transfers.append(transfer.engine_path)
+
+    def committed_status(self, engine_path):
+        connection = self.raw_connection()
+        status = six.next(connection.execute(
+            'SELECT status FROM transfers WHERE engine_file_path=?',
+            [engine_path]))[0]
+        connection.close()
+        return status
+
+    def test_read_your_writes(self):
+        self.server.set_transfer_status(self.transfers[0],
+                                        constants.FILES_ON_CR)
+        self.assertNotEqual(self.committed_status(self.transfers[0]),
+                            constants.FILES_ON_CR)
+        self.assertEqual(
+            self.server.get_transfer_status(self.transfers[0],
+                                            self.user_id),
+            constants.FILES_ON_CR)
+        self.assertEqual(self.committed_status(self.transfers[0]),
+                         constants.FILES_ON_CR)
+
+    def test_flush(self):
+        thread = threading.Thread(
+            target=self.server.set_transfer_status,
+            args=(self.transfers[1], constants.FILES_ON_CR))
+        thread.start()
+        thread.join()
+        # writes of other threads are not committed by reads
+        self.server.get_transfer_status(self.transfers[0], self.user_id)
+        self.assertNotEqual(self.committed_status(self.transfers[1]),
+                            constants.FILES_ON_CR)
+        self.server.flush()
+        self.assertEqual(self.committed_status(self.transfers[1]),
+                         constants.FILES_ON_CR)
+
+    def test_failed_write(self):
+        self.server.set_transfer_status(self.transfers[0],
+                                        constants.FILES_ON_CR)
+        self.server.failing_write()
+        self.server.set_transfer_status(self.transfers[2],
+                                        constants.FILES_ON_CR)
+        self.assertRaises(DatabaseError, self.server.flush)
+        self.assertEqual(self.committed_status(self.transfers[0]),
+                         constants.FILES_ON_CR)
+        self.assertEqual(self.committed_status(self.transfers[2]),
+                         constants.FILES_ON_CR)
+        # the error is reported once
+        self.server.flush()
+
+    def test_close(self):
+        self.server.set_transfer_status(self.transfers[0],
+                                        constants.FILES_ON_CR)
+        self.server.close_connections()
+        self.assertEqual(self.committed_status(self.transfers[0]),
+                         constants.FILES_ON_CR)
+        # writes are synchronous after close
+        self.server.set_transfer_status(self.transfers[1],
+                                        constants.FILES_ON_CR)
+        self.assertEqual(self.committed_status(self.transfers[1]),
+                         constants.FILES_ON_CR)
+
+
+
+@memory_backend
+class MemoryCacheTest(CacheTest):
+    backend = 'memory'
+
+
+@memory_backend
+class MemoryWriteBehindTest(WriteBehindTest):
+    backend = 'memory'
+
+
+@memory_backend
+class MemoryArchiveTest(ArchiveTest):
+    backend = 'memory'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,519 @@
+from __future__ import print_function
+
+'''
+Unit tests of the workflow engine loop, driven by a fake scheduler.
+'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import soma_workflow.constants as constants
+from soma_workflow.database_server import WorkflowDatabaseServer
+from soma_workflow.engine import WorkflowEngine, WorkflowEngineLoop, \
+    EngineLoopThread, PendingJobQueue
+from soma_workflow.client import Job, BarrierJob, Workflow
+from soma_workflow.engine_types import EngineWorkflow
+from soma_workflow.scheduler import LocalScheduler
+from soma_workflow.test.benchmarks.bench_utils import BenchmarkScheduler, \
+    CompletingScheduler, SlowSubmissionScheduler, make_workflow, \
+    make_chain_workflow
+
+
+class CountingDatabaseServer(WorkflowDatabaseServer):
+
+    '''
+    Database server counting the nb_jobs() requests.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(CountingDatabaseServer, self).__init__(*args, **kwargs)
+        self.nb_jobs_requests = 0
+
+    def nb_jobs(self, user_id, queue_name, status, cached=True):
+        self.nb_jobs_requests += 1
+        return super(CountingDatabaseServer, self).nb_jobs(
+            user_id, queue_name, status, cached=cached)
+
+
+class EngineLoopTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='swf_test_')
+        database_file = os.path.join(self.tmpdir, 'soma_workflow.db')
+        transfer_dir = os.path.join(self.tmpdir, 'transfered_files')
+        os.mkdir(transfer_dir)
+        self.server = CountingDatabaseServer(database_file, transfer_dir)
+        self.scheduler = BenchmarkScheduler()
+        self.thread = None
+
+    def tearDown(self):
+        if self.thread is not None:
+            self.thread.stop()
+        self.server.close_connections()
+        shutil.rmtree(self.tmpdir)
+
+    def start(self, engine_loop, time_interval=0.01):
+        self.thread = EngineLoopThread(engine_loop)
+        self.thread.time_interval = time_interval
+        self.thread.daemon = True
+        self.thread.start()
+
+    def wait_for(self, condition, timeout=10.):
+        start = time.time()
+        while not condition():
+            if time.time() - start > timeout:
+                self.fail('timeout')
+            time.sleep(0.01)
+
+
+class QueueLimitsTest(EngineLoopTestCase):
+
+    def submitted(self):
+        return self.scheduler._count
+
+    def test_running_jobs_limit(self):
+        engine_loop = WorkflowEngineLoop(self.server, self.scheduler,
+                                         running_jobs_limits={'short': 3})
+        wf_id = engine_loop.add_workflow(make_workflow(10),
+                                         datetime.now() + timedelta(days=1),
+                                         'queue_limits', 'short')
+        self.start(engine_loop)
+        self.wait_for(lambda: self.submitted() == 3)
+        time.sleep(0.2)
+        self.assertEqual(self.submitted(), 3)
+        # the counts were read once from the database
+        self.assertEqual(self.server.nb_jobs_requests, 2)
+        self.scheduler.finish_job('1')
+        self.scheduler.finish_job('2')
+        self.wait_for(lambda: self.submitted() == 5)
+        time.sleep(0.2)
+        self.assertEqual(self.submitted(), 5)
+        self.assertEqual(self.server.nb_jobs_requests, 2)
+        with engine_loop._lock:
+            self.assertEqual(
+                engine_loop._queue_counts['short'],
+                [self.server.nb_running_jobs(engine_loop._user_id, 'short'),
+                 self.server.nb_queued_jobs(engine_loop._user_id, 'short')])
+        self.assertEqual(engine_loop._queue_counts['short'][0], 3)
+        self.assertTrue(wf_id in engine_loop._workflows)
+
+
+class EventsTest(EngineLoopTestCase):
+
+    def test_scheduler_events(self):
+        self.scheduler = CompletingScheduler()
+        engine_loop = WorkflowEngineLoop(self.server, self.scheduler)
+        # the loop does not poll a scheduler which notifies its changes
+        self.start(engine_loop, time_interval=60.)
+        time.sleep(0.1)
+        start = time.time()
+        engine_loop.add_workflow(make_chain_workflow(10),
+                                 datetime.now() + timedelta(days=1),
+                                 'events', None)
+        self.wait_for(engine_loop.are_jobs_and_workflow_done)
+        self.assertEqual(self.scheduler._count, 10)
+        self.assertTrue(time.time() - start < 5.)
+
+    def test_stop_wakes_up_the_loop(self):
+        engine_loop = WorkflowEngineLoop(self.server, self.scheduler)
+        self.start(engine_loop, time_interval=60.)
+        time.sleep(0.1)
+        start = time.time()
+        self.thread.stop()
+        self.thread = None
+        self.assertTrue(time.time() - start < 5.)
+
+    def test_notify_after_commit(self):
+        self.server.close_connections()
+        self.server = CountingDatabaseServer(self.server._database_file,
+                                             self.server._tmp_file_dir_path,
+                                             write_behind=True,
+                                             commit_interval=0.5)
+        # the loop is only woken up by the events, or by the safety sweep
+        self.scheduler.notifies_status_changes = True
+        engine = WorkflowEngine(self.server, self.scheduler)
+        self.thread = engine.engine_loop_thread
+        wf_id = engine.engine_loop.add_workflow(
+            make_workflow(1), datetime.now() + timedelta(days=1),
+            'notify_after_commit', None)
+        self.wait_for(lambda: self.scheduler._count == 1)
+        # the writes of the loop are committed: its reads do not commit the
+        # writes of the other threads
+        time.sleep(1.)
+        # as WorkflowEngine.stop_workflow(), without reading the status
+        # afterwards, which would commit the write
+        self.server.set_workflow_status(wf_id, constants.KILL_PENDING)
+        engine._notify_loop('workflow kill')
+        self.wait_for(lambda: self.scheduler.get_job_status('1')
+                      == constants.FAILED, timeout=5.)
+
+    def test_local_process_end_wakes_up_the_loop(self):
+        # the local scheduler does not wait for its polling interval to
+        # notice the end of the processes
+        self.scheduler = LocalScheduler(proc_nb=1, interval=60)
+        try:
+            engine_loop = WorkflowEngineLoop(self.server, self.scheduler)
+            self.start(engine_loop, time_interval=60.)
+            engine_loop.add_workflow(make_chain_workflow(3),
+                                     datetime.now() + timedelta(days=1),
+                                     'process_end', None)
+            self.wait_for(engine_loop.are_jobs_and_workflow_done,
+                          timeout=5.)
+        finally:
+            self.scheduler.end_scheduler_thread()
+
+
+class PollChangesTest(EngineLoopTestCase):
+
+    def test_default_poll_changes(self):
+        ids = set([self.scheduler.job_submission(None),
+                   self.scheduler.job_submission(None)])
+        self.assertEqual(self.scheduler.poll_changes(ids),
+                         (dict((i, constants.RUNNING) for i in ids), {}))
+        self.assertEqual(self.scheduler.poll_changes(ids), ({}, {}))
+        self.scheduler.finish_job('1')
+        self.assertEqual(self.scheduler.poll_changes(ids),
+                         ({'1': constants.DONE}, {}))
+        ids.remove('1')
+        self.assertEqual(self.scheduler.poll_changes(ids), ({}, {}))
+        self.assertEqual(list(self.scheduler._polled_status.keys()), ['2'])
+
+    def test_local_scheduler_poll_changes(self):
+        class FakeJob(object):
+            priority = 0
+
+            def __init__(self, job_id):
+                self.job_id = job_id
+                self.is_barrier = False
+
+        # no processor: the jobs stay queued
+        scheduler = LocalScheduler(proc_nb=0, max_proc_nb=-1)
+        try:
+            ids = set([scheduler.job_submission(FakeJob(1)),
+                       scheduler.job_submission(FakeJob(2))])
+            self.assertEqual(scheduler.poll_changes(ids),
+                             ({1: constants.QUEUED_ACTIVE,
+                               2: constants.QUEUED_ACTIVE}, {}))
+            self.assertEqual(scheduler.poll_changes(ids), ({}, {}))
+            scheduler.kill_job(1)
+            self.assertEqual(scheduler.poll_changes(ids),
+                             ({1: constants.FAILED}, {}))
+            # the changes of the jobs which are not followed are dropped
+            scheduler.kill_job(2)
+            self.assertEqual(scheduler.poll_changes(set()), ({}, {}))
+            self.assertEqual(scheduler.poll_changes(ids), ({}, {}))
+        finally:
+            scheduler.end_scheduler_thread()
+
+    def test_ended_jobs_are_not_followed(self):
+        engine_loop = WorkflowEngineLoop(self.server, self.scheduler)
+        engine_loop.add_workflow(make_workflow(10),
+                                 datetime.now() + timedelta(days=1),
+                                 'poll_changes', None)
+        self.start(engine_loop)
+        self.wait_for(lambda: len(engine_loop._scheduler_jobs) == 10)
+        for i in range(1, 6):
+            self.scheduler.finish_job(str(i))
+        self.wait_for(lambda: len(engine_loop._scheduler_jobs) == 5)
+        with engine_loop._lock:
+            self.assertEqual(set(engine_loop._scheduler_jobs.keys()),
+                             set(str(i) for i in range(6, 11)))
+        for i in range(6, 11):
+            self.scheduler.finish_job(str(i))
+        self.wait_for(engine_loop.are_jobs_and_workflow_done)
+        self.assertEqual(engine_loop._scheduler_jobs, {})
+
+
+class BarrierScheduler(CompletingScheduler):
+
+    '''
+    Completing scheduler which does not run the barrier jobs, like the DRMAA
+    scheduler: they are DONE at submission, and all get the same id.
+    '''
+
+    FAKE_JOB = -167
+
+    def job_submission(self, job):
+        if job.is_barrier:
+            job.status = constants.DONE
+            return self.FAKE_JOB
+        return super(BarrierScheduler, self).job_submission(job)
+
+    def get_job_status(self, scheduler_job_id):
+        if scheduler_job_id == self.FAKE_JOB:
+            return constants.DONE
+        return super(BarrierScheduler, self).get_job_status(scheduler_job_id)
+
+
+class BarrierJobsTest(EngineLoopTestCase):
+
+    def test_barriers_in_separate_iterations(self):
+        self.scheduler = BarrierScheduler()
+        engine_loop = WorkflowEngineLoop(self.server, self.scheduler)
+        jobs = [Job(command=['true'], name='job_0'),
+                BarrierJob(name='barrier_1'),
+                Job(command=['true'], name='job_2'),
+                BarrierJob(name='barrier_3'),
+                Job(command=['true'], name='job_4')]
+        workflow = Workflow(jobs, list(zip(jobs[:-1], jobs[1:])))
+        wf_id = engine_loop.add_workflow(workflow,
+                                         datetime.now() + timedelta(days=1),
+                                         'barriers', None)
+        with engine_loop._lock:
+            job_ids = list(engine_loop._workflows[wf_id].registered_jobs)
+        self.start(engine_loop)
+        self.wait_for(engine_loop.are_jobs_and_workflow_done)
+        self.assertEqual(self.scheduler._count, 3)
+        status = [self.server.get_job_status(job_id,
+                                             engine_loop._user_id)[0]
+                  for job_id in job_ids]
+        self.assertEqual(status, [constants.DONE] * 5)
+        self.assertEqual(self.server.get_workflow_status(
+            wf_id, engine_loop._user_id)[0], constants.WORKFLOW_DONE)
+
+
+class ActiveIndexesTest(EngineLoopTestCase):
+
+    def test_indexes(self):
+        engine_loop = WorkflowEngineLoop(self.server, self.scheduler)
+        # 2 jobs wait for input transfers which never happen
+        wf_id = engine_loop.add_workflow(make_workflow(10, ntransfers=2),
+                                         datetime.now() + timedelta(days=1),
+                                         'indexes', None)
+        self.assertEqual(len(engine_loop._transfers), 2)
+        self.start(engine_loop)
+        self.wait_for(lambda: len(engine_loop._scheduler_jobs) == 8)
+        for i in range(1, 5):
+            self.scheduler.finish_job(str(i))
+        self.wait_for(lambda: len(engine_loop._scheduler_jobs) == 4)
+        with engine_loop._lock:
+            # the finished jobs are not visited any longer
+            self.assertEqual(engine_loop._dirty_jobs, {})
+            self.assertTrue(wf_id in engine_loop._workflows)
+            job_ids = list(engine_loop._workflows[wf_id].registered_jobs)
+        # the status of the ended jobs was written to the database
+        status = [self.server.get_job_status(job_id,
+                                             engine_loop._user_id)[0]
+                  for job_id in job_ids]
+        self.assertEqual(status.count(constants.DONE), 4)
+        self.server.set_workflow_status(wf_id, constants.DELETE_PENDING)
+        engine_loop.notify('workflow deletion')
+        self.wait_for(engine_loop.are_jobs_and_workflow_done)
+        self.assertEqual(engine_loop._scheduler_jobs, {})
+        self.assertEqual(engine_loop._transfers, {})
+        self.assertEqual(engine_loop._dirty_jobs, {})
+
+
+class TransfersRevisionTest(EngineLoopTestCase):
+
+    def test_transfers_read_when_managed(self):
+        engine_loop = WorkflowEngineLoop(self.server, self.scheduler)
+        workflow = self.server.add_workflow(
+            engine_loop._user_id,
+            EngineWorkflow(make_workflow(4, ntransfers=2), {}, None,
+                           datetime.now() + timedelta(days=1), 'revision'),
+            login=engine_loop._user_login)
+        engine_path = list(workflow.registered_tr.keys())[0]
+        self.server.set_transfer_status(engine_path, constants.FILES_ON_CR)
+        # the loop revision is already past this change
+        engine_loop._transfers_revision = self.server.get_transfers_changes(
+            [], 0, engine_loop._user_id)[0]
+        with engine_loop._lock:
+            engine_loop._manage_workflow(workflow)
+            self.assertEqual(engine_loop._transfers[engine_path].status,
+                             constants.FILES_ON_CR)
+
+
+class PendingJobQueueTest(unittest.TestCase):
+
+    class FakeJob(object):
+
+        def __init__(self, name, priority=0, workflow_id=-1):
+            self.name = name
+            self.priority = priority
+            self.workflow_id = workflow_id
+
+    def pop_all(self, queue):
+        names = []
+        while queue:
+            names.append(queue.pop().name)
+        return names
+
+    def test_priority_order(self):
+        queue = PendingJobQueue()
+        for name, priority in (('a', 0), ('b', 2), ('c', 0), ('d', 1),
+                               ('e', 2), ('f', 0)):
+            queue.push(self.FakeJob(name, priority))
+        self.assertEqual(len(queue), 6)
+        # decreasing priority, then arrival order
+        self.assertEqual(self.pop_all(queue), ['b', 'e', 'd', 'a', 'c', 'f'])
+        self.assertRaises(IndexError, queue.pop)
+
+    def test_remove(self):
+        queue = PendingJobQueue()
+        jobs = [self.FakeJob(name) for name in 'abcd']
+        for job in jobs:
+            queue.push(job)
+        queue.remove(jobs[0])
+        queue.remove(jobs[2])
+        self.assertFalse(jobs[0] in queue)
+        self.assertTrue(jobs[1] in queue)
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(self.pop_all(queue), ['b', 'd'])
+
+    def test_fair_share(self):
+        queue = PendingJobQueue(fair_share=True)
+        for i in range(6):
+            queue.push(self.FakeJob('big%d' % i, priority=1, workflow_id=1))
+        for i in range(2):
+            queue.push(self.FakeJob('small%d' % i, workflow_id=2))
+        self.assertEqual(queue.pop().name, 'big0')
+        self.assertEqual(queue.pop().name, 'small0')
+        self.assertEqual(queue.pop().name, 'big1')
+        # a workflow arriving late starts on par with the others
+        queue.push(self.FakeJob('late0', workflow_id=3))
+        queue.push(self.FakeJob('late1', workflow_id=3))
+        queue.remove(queue._heaps[1][0][2])
+        self.assertEqual(self.pop_all(queue),
+                         ['small1', 'late0', 'big3', 'late1', 'big4',
+                          'big5'])
+
+
+class FairShareTest(EngineLoopTestCase):
+
+    def test_fair_share(self):
+        engine_loop = WorkflowEngineLoop(self.server, self.scheduler,
+                                         running_jobs_limits={'short': 4},
+                                         fair_share=True)
+        big_wf_id = engine_loop.add_workflow(
+            make_workflow(50), datetime.now() + timedelta(days=1), 'big',
+            'short')
+        small_wf_id = engine_loop.add_workflow(
+            make_workflow(2), datetime.now() + timedelta(days=1), 'small',
+            'short')
+        self.start(engine_loop)
+        self.wait_for(lambda: self.scheduler._count == 4)
+        with engine_loop._lock:
+            workflows = [job.workflow_id
+                         for job in engine_loop._scheduler_jobs.values()]
+        # the small workflow did not wait for the big one
+        self.assertEqual(workflows.count(small_wf_id), 2)
+        self.assertEqual(workflows.count(big_wf_id), 2)
+
+
+class LockCheckingScheduler(SlowSubmissionScheduler):
+
+    '''
+    Slow scheduler recording whether the engine lock was free during each
+    submission.
+    '''
+
+    engine_lock = None
+
+    def __init__(self, *args, **kwargs):
+        super(LockCheckingScheduler, self).__init__(*args, **kwargs)
+        self.lock_free = []
+
+    def job_submission(self, job):
+        acquired = self.engine_lock.acquire(False)
+        if acquired:
+            self.engine_lock.release()
+        with self._lock:
+            self.lock_free.append(acquired)
+        return super(LockCheckingScheduler, self).job_submission(job)
+
+
+class StoppingScheduler(SlowSubmissionScheduler):
+
+    '''
+    Slow scheduler calling on_submission() during the first submission, and
+    recording the killed jobs.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(StoppingScheduler, self).__init__(*args, **kwargs)
+        self.on_submission = None
+        self.killed = []
+
+    def job_submission(self, job):
+        with self._lock:
+            on_submission = self.on_submission
+            self.on_submission = None
+        if on_submission is not None:
+            on_submission()
+        return super(StoppingScheduler, self).job_submission(job)
+
+    def kill_job(self, scheduler_job_id):
+        with self._lock:
+            self.killed.append(scheduler_job_id)
+        super(StoppingScheduler, self).kill_job(scheduler_job_id)
+
+
+class SubmissionTest(EngineLoopTestCase):
+
+    def test_parallel_submissions(self):
+        scheduler = LockCheckingScheduler(0.1, max_parallel_submissions=5)
+        engine_loop = WorkflowEngineLoop(self.server, scheduler)
+        scheduler.engine_lock = engine_loop._lock
+        self.assertEqual(engine_loop.submission_metrics()['rate'], None)
+        engine_loop.add_workflow(make_workflow(20),
+                                 datetime.now() + timedelta(days=1),
+                                 'parallel', None)
+        start = time.time()
+        self.start(engine_loop)
+        self.wait_for(lambda: len(engine_loop._scheduler_jobs) == 20)
+        # 20 submissions of 0.1 s each would last 2 s sequentially
+        self.assertTrue(time.time() - start < 1.5)
+        self.assertEqual(scheduler.max_concurrent_submissions, 5)
+        # the engine lock was released during the submissions
+        self.assertEqual(scheduler.lock_free, [True] * 20)
+        metrics = engine_loop.submission_metrics()
+        self.assertEqual(metrics['jobs'], 20)
+        self.assertEqual(metrics['errors'], 0)
+        self.assertTrue(metrics['batches'] >= 1)
+        self.assertTrue(metrics['rate'] > 10.)
+
+    def test_stop_during_submission(self):
+        scheduler = StoppingScheduler(0.1, max_parallel_submissions=5)
+        engine_loop = WorkflowEngineLoop(self.server, scheduler)
+        wf_id = engine_loop.add_workflow(make_workflow(5),
+                                         datetime.now() + timedelta(days=1),
+                                         'stopped', None)
+        with engine_loop._lock:
+            job_ids = list(engine_loop._workflows[wf_id].registered_jobs)
+
+        def stop_workflow():
+            with engine_loop._lock:
+                engine_loop._stop_wf(wf_id)
+
+        scheduler.on_submission = stop_workflow
+        self.start(engine_loop)
+        self.wait_for(engine_loop.are_jobs_and_workflow_done)
+        self.assertEqual(scheduler._count, 5)
+        # the jobs submitted meanwhile were killed, and are not followed
+        self.assertEqual(sorted(scheduler.killed, key=int),
+                         [str(i) for i in range(1, 6)])
+        self.assertEqual(engine_loop._scheduler_jobs, {})
+        status = [self.server.get_job_status(job_id,
+                                             engine_loop._user_id)[0]
+                  for job_id in job_ids]
+        self.assertEqual(status, [constants.FAILED] * 5)
+
+    def test_sequential_submissions(self):
+        scheduler = SlowSubmissionScheduler(0.01)
+        engine_loop = WorkflowEngineLoop(self.server, scheduler)
+        engine_loop.add_workflow(make_workflow(5),
+                                 datetime.now() + timedelta(days=1),
+                                 'sequential', None)
+        self.start(engine_loop)
+        self.wait_for(lambda: len(engine_loop._scheduler_jobs) == 5)
+        self.assertEqual(scheduler.max_concurrent_submissions, 1)
+        self.assertEqual(engine_loop.submission_metrics()['jobs'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()